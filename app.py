@@ -1,8 +1,14 @@
+import atexit
+import threading
 from flask import Flask
 from config import Config
 from services.database import DatabaseService
 from services.ai_service import AIService
 from services.business_service import BusinessService
+from services.http_pool import AsyncHTTPPool, SessionPool
+from services.question_bank import QuestionBank
+from services.story_pool import StoryPool
+from services.story_jobs import StoryJobQueue
 from routes import Routes
 
 def create_app():
@@ -13,7 +19,23 @@ def create_app():
     # Initialize services
     db_service = DatabaseService()
     ai_service = AIService(db_service)
-    business_service = BusinessService(db_service, ai_service)
+    question_bank = QuestionBank(db_service, ai_service) if Config.QUIZ_BANK_ENABLED else None
+    business_service = BusinessService(db_service, ai_service, question_bank)
+    if Config.STORY_POOL_ENABLED:
+        business_service.story_pool = StoryPool(business_service)
+    business_service.story_jobs = StoryJobQueue(business_service)
+    
+    # Open DeepSeek connections in the background so startup never waits on the network
+    if ai_service.client and Config.DEEPSEEK_API_KEY:
+        threading.Thread(target=ai_service.client.warm_up, daemon=True).start()
+        if question_bank:
+            question_bank.start()
+        if business_service.story_pool:
+            business_service.story_pool.start()
+    atexit.register(SessionPool.close_all)
+    atexit.register(AsyncHTTPPool.close_all)
+    atexit.register(business_service.story_jobs.shutdown)
+    atexit.register(db_service.close)
     
     # Register routes
     Routes(app, business_service)
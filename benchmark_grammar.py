@@ -0,0 +1,52 @@
+# benchmark_grammar.py - Measure how fast the offline grammar rules check messages
+import random
+import re
+import sys
+import time
+from config import Config
+from services.grammar_rules import GrammarRuleEngine
+
+SAMPLE_MESSAGES = [
+    "Yesterday I am work on the payment API and we didn't deployed it because the tests was failing.",
+    "Can you explain me the informations in the dashboard? I think the enviroment is not configured.",
+    "I finished the login page, today I will review the pull request from Sarah and fix the flaky test.",
+    "The build doesn't works since 2 days, we should to revert back the last commit before the release.",
+    "We are investigate a memory leak in the worker; it don't happen locally, only in production.",
+    "I look forward to hear your feedbacks about the new architecture proposal for the search service.",
+    "No blockers from my side. I merged the refactor and updated the documentation for the new endpoints.",
+    "According to me the more better option is to cache the responses and to monitor the latency closely.",
+]
+
+def benchmark(engine, messages):
+    started = time.perf_counter()
+    matches = sum(len(engine.check(message)) for message in messages)
+    return time.perf_counter() - started, matches
+
+def benchmark_one_by_one(engine, messages):
+    """Baseline: search every rule separately, as the old hard-coded fallback did"""
+    patterns = [re.compile(pattern, re.IGNORECASE) for pattern in engine.patterns]
+    started = time.perf_counter()
+    matches = sum(1 for message in messages for pattern in patterns if pattern.search(message))
+    return time.perf_counter() - started, matches
+
+def main(count):
+    started = time.perf_counter()
+    engine = GrammarRuleEngine.from_file(Config.GRAMMAR_RULES_PATH)
+    print(f"📚 Compiled {len(engine)} rules in {time.perf_counter() - started:.3f}s")
+
+    random.seed(42)
+    messages = [random.choice(SAMPLE_MESSAGES) for _ in range(count)]
+    average_chars = sum(map(len, messages)) / len(messages)
+
+    elapsed, matches = benchmark(engine, messages)
+    print(f"⚡ Rule engine: {count / elapsed:,.0f} messages/second "
+          f"({count} messages of ~{average_chars:.0f} chars, {matches} matches)")
+
+    # The baseline is much slower, so a smaller sample is enough
+    sample = messages[:max(1, count // 20)]
+    baseline_elapsed, baseline_matches = benchmark_one_by_one(engine, sample)
+    print(f"🐢 One search per rule: {len(sample) / baseline_elapsed:,.0f} messages/second "
+          f"({len(sample)} messages, {baseline_matches} matches)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
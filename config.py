@@ -8,8 +8,123 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-this'
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY') or ''
     DATABASE_PATH = 'english_tutor.db'
-    DEEPSEEK_BASE_URL = "https://api.deepseek.com"
-   
+    DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL') or "https://api.deepseek.com"
+    
+    # SQLite connections kept open and reused across requests (at most DB_POOL_SIZE at once)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 8)
+    DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL') or 30)
+    
+    # SQLite tuning: 'fast' (WAL, synchronous=NORMAL) or 'durable' (WAL, synchronous=FULL)
+    DB_TUNING_PROFILE = os.environ.get('DB_TUNING_PROFILE') or 'fast'
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE') or 268435456)
+    DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB') or 16384)
+    DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT') or 5)
+    DB_LOCK_RETRIES = int(os.environ.get('DB_LOCK_RETRIES') or 3)
+    DB_LOCK_RETRY_JITTER = float(os.environ.get('DB_LOCK_RETRY_JITTER') or 0.05)
+    
+    # Outbound HTTP connection pool for the DeepSeek client
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 10)
+    HTTP_POOL_IDLE_TIMEOUT = float(os.environ.get('HTTP_POOL_IDLE_TIMEOUT') or 60)
+    HTTP_POOL_WARMUP_CONNECTIONS = int(os.environ.get('HTTP_POOL_WARMUP_CONNECTIONS') or 2)
+    
+    # Circuit breaker for the DeepSeek API
+    CIRCUIT_FAILURE_RATE = float(os.environ.get('CIRCUIT_FAILURE_RATE') or 0.5)
+    CIRCUIT_WINDOW_SECONDS = float(os.environ.get('CIRCUIT_WINDOW_SECONDS') or 60)
+    CIRCUIT_MINIMUM_CALLS = int(os.environ.get('CIRCUIT_MINIMUM_CALLS') or 4)
+    CIRCUIT_COOLDOWN_SECONDS = float(os.environ.get('CIRCUIT_COOLDOWN_SECONDS') or 30)
+    
+    # Conversation analysis cache (in-process LRU backed by SQLite)
+    ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE') or 1000)
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL') or 86400)
+    
+    # Serve the last personal report until the learner data behind it changes
+    REPORT_CACHE_ENABLED = os.environ.get('REPORT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Share one API call between identical requests in flight (optionally across processes via SQLite)
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    SINGLE_FLIGHT_SHARED = os.environ.get('SINGLE_FLIGHT_SHARED', '').lower() in ('1', 'true', 'yes')
+    SINGLE_FLIGHT_LEASE = float(os.environ.get('SINGLE_FLIGHT_LEASE') or 120)
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL') or 0.25)
+    
+    # Outbound AI call limiter: concurrency, token-bucket rate and queue per priority class
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY') or 8)
+    LLM_RATE_LIMIT = float(os.environ.get('LLM_RATE_LIMIT') or 5)
+    LLM_RATE_BURST = int(os.environ.get('LLM_RATE_BURST') or 10)
+    LLM_QUEUE_LIMIT = int(os.environ.get('LLM_QUEUE_LIMIT') or 32)
+    # Slots only chat and story replies may use, so background work never fills the limit
+    LLM_INTERACTIVE_RESERVE = int(os.environ.get('LLM_INTERACTIVE_RESERVE') or 4)
+    # Slots each background class may hold at once
+    LLM_CLASS_CONCURRENCY = {
+        'quiz': int(os.environ.get('LLM_QUIZ_CONCURRENCY') or 4),
+        'story_generation': int(os.environ.get('LLM_STORY_CONCURRENCY') or 2),
+        'report': int(os.environ.get('LLM_REPORT_CONCURRENCY') or 1)
+    }
+    
+    # Generation profiles: JSON response format and a scale for every output token cap
+    LLM_JSON_MODE = os.environ.get('LLM_JSON_MODE', 'true').lower() in ('1', 'true', 'yes')
+    LLM_MAX_TOKENS_SCALE = float(os.environ.get('LLM_MAX_TOKENS_SCALE') or 1.0)
+    
+    # Adaptive timeouts: rolling latency histograms per operation and output budget
+    LATENCY_WINDOW_SECONDS = float(os.environ.get('LATENCY_WINDOW_SECONDS') or 600)
+    LATENCY_MIN_SAMPLES = int(os.environ.get('LATENCY_MIN_SAMPLES') or 20)
+    LLM_TIMEOUT_PERCENTILE = float(os.environ.get('LLM_TIMEOUT_PERCENTILE') or 0.99)
+    LLM_TIMEOUT_MULTIPLIER = float(os.environ.get('LLM_TIMEOUT_MULTIPLIER') or 1.5)
+    LLM_TIMEOUT_FLOOR = float(os.environ.get('LLM_TIMEOUT_FLOOR') or 5)
+    LLM_TIMEOUT_CEILING = float(os.environ.get('LLM_TIMEOUT_CEILING') or 60)
+    LLM_BACKOFF_FACTOR = float(os.environ.get('LLM_BACKOFF_FACTOR') or 0.25)
+    LLM_BACKOFF_FLOOR = float(os.environ.get('LLM_BACKOFF_FLOOR') or 0.1)
+    
+    # Hedged requests: send a backup copy of a non-streaming call slower than the given latency percentile
+    HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    HEDGE_OPERATIONS = [name.strip() for name in (os.environ.get('HEDGE_OPERATIONS') or 'analysis').split(',') if name.strip()]
+    HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE') or 0.9)
+    HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET') or 0.05)
+    HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY') or 1.0)
+    
+    # Offline grammar rules used when the AI analysis is unavailable
+    GRAMMAR_RULES_PATH = os.environ.get('GRAMMAR_RULES_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'services', 'grammar_rules.json')
+    
+    # Batched analysis: messages per API call, and per request
+    ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE') or 8)
+    ANALYSIS_BATCH_MAX_MESSAGES = int(os.environ.get('ANALYSIS_BATCH_MAX_MESSAGES') or 50)
+    
+    # Serve LLM-bound routes with async views (requires flask[async])
+    ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+    
+    # Time budget in seconds for each request, shared by every AI and database call it makes
+    ROUTE_BUDGETS = {
+        'send_message': float(os.environ.get('BUDGET_SEND_MESSAGE') or 8),
+        'send_messages': float(os.environ.get('BUDGET_SEND_MESSAGES') or 60),
+        'generate_quiz': float(os.environ.get('BUDGET_GENERATE_QUIZ') or 45),
+        'personal_report': float(os.environ.get('BUDGET_PERSONAL_REPORT') or 60),
+        'generate_story': float(os.environ.get('BUDGET_GENERATE_STORY') or 25),
+        'create_story': float(os.environ.get('BUDGET_GENERATE_STORY') or 25),
+        'story_interact': float(os.environ.get('BUDGET_STORY_INTERACT') or 20)
+    }
+    DEFAULT_ROUTE_BUDGET = float(os.environ.get('DEFAULT_ROUTE_BUDGET') or 30)
+    
+    # Pre-generated quiz questions per grammar category
+    QUIZ_BANK_ENABLED = os.environ.get('QUIZ_BANK_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    QUIZ_BANK_TARGET = int(os.environ.get('QUIZ_BANK_TARGET') or 10)
+    QUIZ_BANK_BATCH_SIZE = int(os.environ.get('QUIZ_BANK_BATCH_SIZE') or 5)
+    QUIZ_BANK_REFILL_INTERVAL = float(os.environ.get('QUIZ_BANK_REFILL_INTERVAL') or 300)
+    QUIZ_BANK_CATEGORIES = [category.strip() for category in
+                            (os.environ.get('QUIZ_BANK_CATEGORIES') or 'grammar,vocabulary,verb_tense,prepositions').split(',')
+                            if category.strip()]
+    
+    # Pre-generated stories per scenario, difficulty and length
+    STORY_POOL_ENABLED = os.environ.get('STORY_POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    STORY_POOL_SIZE = int(os.environ.get('STORY_POOL_SIZE') or 2)
+    STORY_POOL_REFILL_INTERVAL = float(os.environ.get('STORY_POOL_REFILL_INTERVAL') or 600)
+    STORY_POOL_TOPIC = os.environ.get('STORY_POOL_TOPIC') or 'software_development'
+    STORY_POOL_DIFFICULTIES = (os.environ.get('STORY_POOL_DIFFICULTIES') or 'intermediate').split(',')
+    STORY_POOL_LENGTHS = (os.environ.get('STORY_POOL_LENGTHS') or 'short').split(',')
+    
+    # Background story generation jobs
+    STORY_JOB_WORKERS = int(os.environ.get('STORY_JOB_WORKERS') or 2)
+    STORY_JOB_STALE_AFTER = float(os.environ.get('STORY_JOB_STALE_AFTER') or 300)
 
     
     # Work scenarios for practice
@@ -0,0 +1,344 @@
+# mock_deepseek.py - Local DeepSeek-compatible /chat/completions server for offline load testing
+#
+#   python mock_deepseek.py --port 8001 --latency lognormal:800:0.5 --error-rate 0.02
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:8001 DEEPSEEK_API_KEY=mock python app.py
+#
+# Replies are valid JSON for the app's analysis, batch analysis, quiz, story and
+# report prompts (recognised by their static prompt prefix), so every feature
+# works end to end without spending API credits. GET /stats shows what was served.
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from services.prompts import prompts
+
+class LatencyModel:
+    """Random delay in seconds from a spec such as fixed:200, uniform:100:400,
+    normal:300:50, lognormal:800:0.5 (median ms, sigma) or exp:300 (mean ms)"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, *values = spec.split(':')
+        try:
+            self.kind = kind
+            self.values = [float(value) for value in values]
+            self.sample(random.Random(0))
+        except (ValueError, IndexError, KeyError):
+            raise argparse.ArgumentTypeError(f"Invalid latency spec '{spec}'")
+
+    def sample(self, rng):
+        samplers = {
+            'fixed': lambda: self.values[0],
+            'uniform': lambda: rng.uniform(self.values[0], self.values[1]),
+            'normal': lambda: rng.gauss(self.values[0], self.values[1]),
+            'lognormal': lambda: self.values[0] * math.exp(rng.gauss(0, self.values[1])),
+            'exp': lambda: rng.expovariate(1 / self.values[0]) if self.values[0] else 0.0
+        }
+        return max(0.0, samplers[self.kind]()) / 1000
+
+class MockBehavior:
+    """Latency, failure injection and payloads shared by every request"""
+
+    def __init__(self, args):
+        self.latency = args.latency
+        self.token_delay = args.token_delay / 1000
+        self.chunk_chars = args.chunk_chars
+        self.error_rate = args.error_rate
+        self.error_statuses = args.error_statuses
+        self.timeout_rate = args.timeout_rate
+        self.hang_seconds = args.hang_seconds
+        self.truncate_rate = args.truncate_rate
+        self.payload_dir = args.payloads
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.stats = {'requests': 0, 'streams': 0, 'errors': 0, 'timeouts': 0, 'truncated': 0, 'in_flight': 0, 'prompts': {}}
+
+    def roll(self):
+        """Decide the fate of one request: (latency seconds, 'error' / 'timeout' / 'truncate' / None)"""
+        with self._lock:
+            latency = self.latency.sample(self._rng)
+            draw = self._rng.random()
+            if draw < self.timeout_rate:
+                return latency, 'timeout'
+            if draw < self.timeout_rate + self.error_rate:
+                return latency, 'error'
+            if self._rng.random() < self.truncate_rate:
+                return latency, 'truncate'
+            return latency, None
+
+    def error_status(self):
+        with self._lock:
+            return self._rng.choice(self.error_statuses)
+
+    def count(self, key, prompt=None, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+            if prompt:
+                self.stats['prompts'][prompt] = self.stats['prompts'].get(prompt, 0) + 1
+
+    def usage(self, messages, system, template, content):
+        """Token counts at ~4 characters per token; a repeated static prefix counts as cached"""
+        prompt_tokens = sum(len(message.get('content') or '') for message in messages) // 4
+        cached_tokens = 0
+        if template is not None:
+            prefix = hashlib.sha256(template.static_prefix.encode('utf-8')).hexdigest()
+            with self._lock:
+                if prefix in self._seen_prefixes:
+                    # DeepSeek caches whole 64-token units
+                    cached_tokens = len(template.static_prefix) // 4 // 64 * 64
+                self._seen_prefixes.add(prefix)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': prompt_tokens + len(content) // 4,
+            'prompt_cache_hit_tokens': cached_tokens,
+            'prompt_cache_miss_tokens': prompt_tokens - cached_tokens
+        }
+
+    def canned(self, name, values):
+        """<payloads>/<prompt name>.json with $placeholders filled in, if present"""
+        if not self.payload_dir:
+            return None
+        path = os.path.join(self.payload_dir, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return string.Template(f.read()).safe_substitute(values)
+
+def identify_prompt(system):
+    """Registered prompt template whose static prefix starts the system message"""
+    for name in prompts.describe():
+        template = prompts.get(name)
+        if system.startswith(template.static_prefix):
+            return template
+    return None
+
+def templated_payload(name, system, user_message, rng):
+    """A reply shaped like the one each prompt asks for"""
+    stamp = rng.randint(1000, 9999)
+    if name == 'analysis_batch':
+        try:
+            items = json.loads(user_message or '[]')
+        except json.JSONDecodeError:
+            items = []
+        return {'results': [templated_analysis(item.get('message', ''), item.get('id')) for item in items if isinstance(item, dict)]}
+    if name == 'quiz':
+        count = 5
+        for line in system.splitlines():
+            if line.startswith('Number of questions:'):
+                count = int(line.split(':')[1])
+        return {'questions': [{
+            'question': f"Choose the correct sentence for the standup (#{stamp}-{index}):",
+            'option_a': "I deployed the fix yesterday",
+            'option_b': "I deploy the fix yesterday",
+            'option_c': "I deploying the fix yesterday",
+            'correct_answer': 'a',
+            'explanation': "Use the past simple for finished actions",
+            'category': 'verb_tense'
+        } for index in range(count)]}
+    if name == 'story':
+        return {
+            'title': f"The Friday Deploy #{stamp}",
+            'description': "Handle a risky release with your team.",
+            'content': "It is Friday afternoon and the release pipeline has just turned red.",
+            'learning_objectives': ["Report an incident clearly", "Propose next steps"],
+            'estimated_time': 5,
+            'total_steps': 2,
+            'steps': [
+                {'step_number': 1, 'type': 'question', 'content': "Your lead asks what happened.",
+                 'question': "How do you explain the failure?", 'expected_response_type': 'open',
+                 'learning_focus': 'professional_communication'},
+                {'step_number': 2, 'type': 'question', 'content': "The team agrees to roll back.",
+                 'question': "How do you announce the rollback?", 'expected_response_type': 'open',
+                 'learning_focus': 'technical_vocabulary'}
+            ]
+        }
+    if name == 'report':
+        return {
+            'strengths': ["Clear status updates"],
+            'weaknesses': ["Verb tenses in past events"],
+            'grammar_mastered': ["Present simple"],
+            'grammar_needs_work': ["Past simple"],
+            'focus_areas': ["Past simple", "Prepositions", "Technical vocabulary"],
+            'recommendations': ["Practice incident reports"],
+            'overall_assessment': f"Solid intermediate English (mock report {stamp}).",
+            'learning_path': ["Week 1: past simple", "Week 2: prepositions"],
+            'personality_insights': ["Prefers concise communication"]
+        }
+    return templated_analysis(user_message or '')
+
+def templated_analysis(message, message_id=None):
+    analysis = {
+        'conversation_response': f"Thanks for the update. What is the next step after \"{message[:40]}\"?",
+        'corrections': [{'original': "I am work", 'corrected': "I am working", 'type': 'verb_tense',
+                         'explanation': "Use the -ing form for an action in progress"}] if 'am work' in message.lower() else [],
+        'new_vocabulary': [{'word': 'blocker', 'definition': "an issue preventing progress",
+                            'example': "I have a blocker with the API."}],
+        'suggestions': "Keep your updates short and specific."
+    }
+    if message_id is not None:
+        analysis = {'id': message_id, **analysis}
+    return analysis
+
+class MockHandler(BaseHTTPRequestHandler):
+    behavior = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        # Connection warm-up
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            return self._send_json(200, self.behavior.stats)
+        if self.path.rstrip('/') in ('/models', '/v1/models'):
+            return self._send_json(200, {'object': 'list', 'data': [{'id': 'deepseek-chat', 'object': 'model'}]})
+        self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/chat/completions', '/v1/chat/completions'):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            return self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+        behavior = self.behavior
+        behavior.count('in_flight')
+        try:
+            self._complete(behavior, json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0))))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up (timeout or cancelled stream)
+        finally:
+            behavior.count('in_flight', delta=-1)
+
+    def _complete(self, behavior, body):
+        messages = body.get('messages') or []
+        system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+        user_message = next((m.get('content') for m in reversed(messages) if m.get('role') == 'user'), None)
+        template = identify_prompt(system)
+        name = template.name if template else 'other'
+        behavior.count('requests', name)
+
+        latency, fate = behavior.roll()
+        time.sleep(latency)
+
+        if fate == 'timeout':
+            behavior.count('timeouts')
+            time.sleep(behavior.hang_seconds)
+            return self._send_json(504, {'error': {'message': 'Upstream timed out', 'type': 'timeout'}})
+        if fate == 'error':
+            behavior.count('errors')
+            status = behavior.error_status()
+            return self._send_json(status, {'error': {'message': f"Injected error {status}", 'type': 'server_error'}})
+
+        values = {'message': user_message or '', 'scenario': system.rsplit(':', 1)[-1].strip(), 'prompt': name}
+        content = behavior.canned(name, values)
+        if content is None:
+            content = json.dumps(templated_payload(name, system, user_message, behavior._rng), ensure_ascii=False)
+        finish_reason = 'stop'
+        if fate == 'truncate':
+            behavior.count('truncated')
+            content = content[:len(content) // 2]
+            finish_reason = 'length'
+        max_tokens = body.get('max_tokens')
+        if max_tokens and len(content) // 4 > max_tokens:
+            # Cut at the caller's output cap, like the real API
+            behavior.count('truncated')
+            content = content[:max_tokens * 4]
+            finish_reason = 'length'
+
+        usage = behavior.usage(messages, system, template, content)
+        created = int(time.time())
+        completion_id = f"mock-{hashlib.sha1(f'{created}{random.random()}'.encode()).hexdigest()[:12]}"
+
+        if body.get('stream'):
+            behavior.count('streams')
+            return self._stream(behavior, completion_id, created, content, finish_reason, usage, body)
+
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': body.get('model', 'deepseek-chat'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+            'usage': usage
+        })
+
+    def _stream(self, behavior, completion_id, created, content, finish_reason, usage, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish=None, usage=None):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                     'model': body.get('model', 'deepseek-chat'),
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]}
+            if usage is not None:
+                chunk['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        event({'role': 'assistant', 'content': ''})
+        for start in range(0, len(content), behavior.chunk_chars):
+            if start and behavior.token_delay:
+                time.sleep(behavior.token_delay)
+            event({'content': content[start:start + behavior.chunk_chars]})
+        include_usage = (body.get('stream_options') or {}).get('include_usage')
+        event({}, finish_reason, usage if include_usage else None)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local DeepSeek-compatible mock server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=LatencyModel, default=LatencyModel('fixed:0'),
+                        help="Time to first byte: fixed:MS, uniform:MIN:MAX, normal:MEAN:STD, lognormal:MEDIAN:SIGMA or exp:MEAN")
+    parser.add_argument('--token-delay', type=float, default=0, help="Milliseconds between streamed chunks")
+    parser.add_argument('--chunk-chars', type=int, default=8, help="Characters per streamed chunk")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of requests answered with an HTTP error")
+    parser.add_argument('--error-statuses', type=lambda value: [int(status) for status in value.split(',')],
+                        default=[500, 503, 429], help="Comma-separated statuses to pick injected errors from")
+    parser.add_argument('--timeout-rate', type=float, default=0, help="Share of requests that hang for --hang-seconds")
+    parser.add_argument('--hang-seconds', type=float, default=120)
+    parser.add_argument('--truncate-rate', type=float, default=0, help="Share of replies cut in half with finish_reason 'length'")
+    parser.add_argument('--payloads', help="Directory of canned <prompt name>.json replies ($message and $scenario are filled in)")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible runs")
+    return parser.parse_args(argv)
+
+def serve(args):
+    MockHandler.behavior = MockBehavior(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = serve(args)
+    print(f"🧪 Mock DeepSeek listening on http://{args.host}:{args.port} (latency {args.latency.spec})")
+    print(f"   Point the app at it with DEEPSEEK_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Mock DeepSeek stopped")
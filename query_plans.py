@@ -0,0 +1,164 @@
+# query_plans.py - Show the SQLite query plan of every DatabaseService query and flag unapproved table scans
+import os
+import re
+import sys
+import tempfile
+import time
+from config import Config
+
+# Tables that stay a handful of rows, where a scan is as cheap as an index lookup
+SMALL_TABLES = {'story_templates', 'inflight_requests', 'story_jobs', 'report_cache'}
+
+# Queries that have to read a whole table (totals, full listings), by how they start, and why that is fine
+APPROVED_SCANS = {
+    'SELECT story_id, current_step, is_completed, completion_percentage, total_interactions, last_interaction '
+    'FROM user_story_progress': "lists every story the user has started",
+    'SELECT COALESCE(SUM(is_completed), 0), AVG(completion_percentage) FROM user_story_progress':
+        "story totals for analytics, one pass",
+    'SELECT mistake_type, COUNT(*) as count FROM grammar_mistakes GROUP BY mistake_type':
+        "counts every mistake; the covering index keeps the pass narrow",
+    'SELECT COUNT(*) FROM vocabulary': "vocabulary total for analytics",
+    'SELECT scenario, COUNT(*) as count FROM conversations c JOIN grammar_mistakes g':
+        "mistakes per scenario for analytics",
+    'SELECT gm.mistake_type, gm.original_text': "most frequent mistakes for the report, built once per data change",
+    'SELECT scenario, COUNT(*) as total, SUM(CASE': "performance per scenario for the report, built once per data change",
+    'SELECT word, definition, example, times_encountered FROM vocabulary ORDER BY': "the full vocabulary page",
+    'SELECT grammar_category, COUNT(*) FROM quiz_questions WHERE served_at IS NULL':
+        "the partial index holds only unserved questions, a few per category",
+    'SELECT (SELECT COALESCE(MAX(id), 0) FROM conversations)':
+        "report fingerprint; vocabulary and story sums change without new rows, and it saves rebuilding the report",
+}
+
+QUERY = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+INDEX_WALK = re.compile(r'^SCAN \w+(?: AS \w+)? USING (?:COVERING )?INDEX \w+$')
+TOP_N = re.compile(r'\bORDER BY\b.*\bLIMIT \d+$', re.IGNORECASE)
+
+def exercise(db):
+    """Call every DatabaseService method that runs a query, with a little data to work on"""
+    corrections = [{'original': 'I has', 'corrected': 'I have', 'type': 'grammar', 'explanation': 'Agreement'}]
+    vocabulary = [{'word': 'deploy', 'definition': 'Release software', 'example': 'We deploy on Fridays'}]
+    db.save_conversation("I has a bug", "Let's fix it", corrections, 'daily_standup')
+    db.save_conversation_batch([("I has a test", "Nice", corrections, vocabulary)], 'code_review')
+    db.save_vocabulary(vocabulary)
+    db.save_quiz_result('grammar', 5, 4, [], ['grammar'])
+    db.save_quiz_questions([{'question': 'Pick one', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c',
+                             'explanation': 'Because'}], category='grammar', served=False)
+
+    story_id = db.save_story("Outage", "A production outage", "The pager goes off...", scenario='debugging_session')
+    db.save_story_steps(story_id, [{'content': 'The API returns 500 errors', 'question': 'What do you check first?'}])
+    db.get_stories_list()
+    db.get_story_by_id(story_id)
+    db.save_story_interaction(story_id, 1, "I would check the logs", corrections=corrections)
+    db.get_user_story_progress()
+    db.get_story_progress(story_id)
+    db.get_story_interactions(story_id)
+    db.complete_story(story_id)
+    db.get_story_templates('debugging_session', 'intermediate')
+
+    pooled_id = db.save_story("Pooled", "Ready story", "Content", scenario='code_review', story_length='short', pooled=True)
+    db.save_story_steps(pooled_id, [{'content': 'Review the pull request', 'question': 'What do you say?'}])
+    db.count_pooled_stories()
+    db.claim_pooled_story('code_review', 'intermediate', 'short', 'software_development')
+
+    db.get_user_analytics()
+    db.get_user_mistakes()
+    db.get_detailed_mistakes_for_report()
+    db.get_vocabulary_for_report()
+    db.get_quiz_history_for_report()
+    db.get_scenario_performance_for_report()
+    db.get_vocabulary_list()
+    db.get_conversation_history()
+
+    db.save_cached_analysis('key', 'daily_standup', {'corrections': []}, time.time() + 60)
+    db.get_cached_analysis('key')
+    db.count_unused_quiz_questions()
+    db.claim_quiz_questions('grammar', 5)
+    db.get_report_inputs()
+    db.save_cached_report('fingerprint', {'overall_assessment': 'Good'})
+    db.get_cached_report()
+
+    db.create_story_job('job', {'scenario': 'code_review'})
+    db.update_story_job('job', status='running')
+    db.get_story_job('job')
+
+    db.claim_inflight_request('request', 'owner', 30)
+    db.get_inflight_request('request', 'owner')
+    db.finish_inflight_request('request', 'owner', {'ok': True})
+    db.claim_inflight_request('other', 'owner', 30)
+    db.release_inflight_request('other', 'owner')
+
+def capture_queries(db):
+    """Run exercise() and return the distinct queries it sent, in order"""
+    statements = []
+    get_connection = db.get_connection
+
+    def traced_connection(*args, **kwargs):
+        conn = get_connection(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    db.get_connection = traced_connection
+    exercise(db)
+    db.get_connection = get_connection
+
+    queries = []
+    for statement in statements:
+        statement = ' '.join(statement.split())
+        if QUERY.match(statement) and statement not in queries:
+            queries.append(statement)
+    return queries
+
+def full_scans(plan, query):
+    """Tables read from start to end, with or without an index
+
+    Walking an index in ORDER BY order stops after LIMIT rows, so that only
+    counts as a scan when SQLite still has to sort.
+    """
+    top_n = TOP_N.search(query) and 'USE TEMP B-TREE FOR ORDER BY' not in plan
+    return [match.group(1) for match in (FULL_SCAN.match(detail) for detail in plan)
+            if match and not (top_n and INDEX_WALK.match(match.group(0)))]
+
+def approved_scan(query):
+    """Why this query may read a whole table, or None"""
+    return next((reason for start, reason in APPROVED_SCANS.items() if query.startswith(start)), None)
+
+def main(verbose):
+    from services.database import DatabaseService
+
+    with tempfile.TemporaryDirectory() as directory:
+        Config.DATABASE_PATH = os.path.join(directory, 'query_plans.db')
+        db = DatabaseService()
+        queries = capture_queries(db)
+
+        conn = db.get_connection()
+        problems = 0
+        for query in queries:
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}').fetchall()]
+            scans = [table for table in full_scans(plan, query) if table not in SMALL_TABLES]
+            approval = approved_scan(query) if scans else None
+            if approval:
+                scans = []
+            # Sorting a few groups after GROUP BY is cheap; sorting every row is not
+            sorts = [detail for detail in plan if detail.startswith('USE TEMP B-TREE')
+                     and not (detail.endswith('ORDER BY') and 'GROUP BY' in query)]
+            problems += bool(scans)
+            if scans:
+                print(f"🐢 Full scan of {', '.join(scans)}: {query}")
+            elif verbose and approval:
+                print(f"🆗 Approved scan ({approval}): {query}")
+            elif verbose:
+                print(f"✅ {query}")
+            if scans or verbose:
+                for detail in plan:
+                    print(f"     {detail}")
+            elif sorts:
+                print(f"🔃 {', '.join(sorts)}: {query}")
+        conn.close()
+        db.close()
+
+    print(f"📊 {len(queries)} queries, {problems} with unapproved scans of large tables")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main('-v' in sys.argv[1:]))
@@ -1,5 +1,8 @@
-from flask import render_template, request, jsonify
+import asyncio
+import json
+from flask import render_template, request, jsonify, Response
 from config import Config
+from services.deadline import Deadline
 
 class Routes:
     def __init__(self, app, business_service):
@@ -14,18 +17,20 @@ class Routes:
         
         # Chat routes
         self.app.add_url_rule('/chat', 'chat', self.chat, methods=['GET'])
-        self.app.add_url_rule('/send_message', 'send_message', self.send_message, methods=['POST'])
+        self.app.add_url_rule('/send_message', 'send_message', self._view('send_message'), methods=['POST'])
+        self.app.add_url_rule('/send_messages', 'send_messages', self._view('send_messages'), methods=['POST'])
         
         # Quiz routes
         self.app.add_url_rule('/quiz', 'quiz', self.quiz, methods=['GET'])
-        self.app.add_url_rule('/generate_quiz', 'generate_quiz', self.generate_quiz, methods=['POST'])
+        self.app.add_url_rule('/generate_quiz', 'generate_quiz', self._view('generate_quiz'), methods=['POST'])
         self.app.add_url_rule('/submit_quiz', 'submit_quiz', self.submit_quiz, methods=['POST'])
         
         # Report routes
-        self.app.add_url_rule('/report', 'personal_report', self.personal_report, methods=['GET'])
+        self.app.add_url_rule('/report', 'personal_report', self._view('personal_report'), methods=['GET'])
         
         # Analytics routes
         self.app.add_url_rule('/analytics', 'analytics', self.analytics, methods=['GET'])
+        self.app.add_url_rule('/metrics', 'metrics', self.metrics, methods=['GET'])
         
         # Vocabulary routes
         self.app.add_url_rule('/vocabulary', 'vocabulary', self.vocabulary, methods=['GET'])
@@ -39,8 +44,15 @@ class Routes:
         self.app.add_url_rule('/stories/create', 'create_story', self.create_story, methods=['GET', 'POST'])
         self.app.add_url_rule('/stories/<int:story_id>/interact', 'story_interact', self.story_interact, methods=['POST'])
         self.app.add_url_rule('/stories/generate', 'generate_story', self.generate_story, methods=['POST'])
+        self.app.add_url_rule('/stories/jobs/<job_id>', 'story_job', self.story_job, methods=['GET'])
         self.app.add_url_rule('/stories/<int:story_id>/complete', 'complete_story', self.complete_story, methods=['POST'])
     
+    def _view(self, name):
+        """Pick the async variant of an LLM-bound view when async views are enabled"""
+        if Config.ASYNC_VIEWS:
+            return getattr(self, f"{name}_async")
+        return getattr(self, name)
+    
     def index(self):
         """Home page with scenario selection"""
         return render_template('index.html', scenarios=Config.WORK_SCENARIOS)
@@ -52,6 +64,7 @@ class Routes:
     
     def send_message(self):
         """Process chat messages and return AI analysis"""
+        deadline = Deadline.for_route('send_message')
         try:
             data = request.json
             user_message = data.get('message', '')
@@ -60,20 +73,122 @@ class Routes:
             if not user_message.strip():
                 return jsonify({"error": "Message cannot be empty"}), 400
             
+            if data.get('stream'):
+                return self._stream_message(user_message, scenario, deadline)
+            
             # Process conversation through business service
-            analysis = self.business_service.process_conversation(user_message, scenario)
+            analysis = self.business_service.process_conversation(user_message, scenario, deadline=deadline)
+            
+            return jsonify(analysis)
+            
+        except Exception as e:
+            print(f"Error in send_message: {e}")
+            return self._send_message_error()
+    
+    async def send_message_async(self):
+        """Async variant of send_message"""
+        deadline = Deadline.for_route('send_message')
+        try:
+            data = request.json
+            user_message = data.get('message', '')
+            scenario = data.get('scenario', 'daily_standup')
+            
+            if not user_message.strip():
+                return jsonify({"error": "Message cannot be empty"}), 400
+            
+            if data.get('stream'):
+                return self._stream_message(user_message, scenario, deadline)
+            
+            analysis = await self.business_service.process_conversation_async(user_message, scenario, deadline=deadline)
             
             return jsonify(analysis)
             
         except Exception as e:
             print(f"Error in send_message: {e}")
-            return jsonify({
-                "error": "Failed to process message",
-                "conversation_response": "I'm sorry, there was an error processing your message. Please try again.",
-                "corrections": [],
-                "new_vocabulary": [],
-                "suggestions": ""
-            }), 500
+            return self._send_message_error()
+    
+    def send_messages(self):
+        """Analyze a batch of messages (e.g. a pasted retro write-up) in as few AI calls as possible"""
+        deadline = Deadline.for_route('send_messages')
+        try:
+            user_messages, scenario, error = self._batch_messages(request.json)
+            if error:
+                return jsonify({"error": error}), 400
+            
+            analyses = self.business_service.process_conversation_batch(user_messages, scenario, deadline=deadline)
+            
+            return jsonify({"results": analyses})
+            
+        except Exception as e:
+            print(f"Error in send_messages: {e}")
+            return jsonify({"error": "Failed to process messages"}), 500
+    
+    async def send_messages_async(self):
+        """Async variant of send_messages"""
+        deadline = Deadline.for_route('send_messages')
+        try:
+            user_messages, scenario, error = self._batch_messages(request.json)
+            if error:
+                return jsonify({"error": error}), 400
+            
+            analyses = await asyncio.to_thread(
+                self.business_service.process_conversation_batch, user_messages, scenario, deadline=deadline
+            )
+            
+            return jsonify({"results": analyses})
+            
+        except Exception as e:
+            print(f"Error in send_messages: {e}")
+            return jsonify({"error": "Failed to process messages"}), 500
+    
+    def _batch_messages(self, data):
+        """Non-empty messages and scenario of a batch request, or an error message"""
+        messages = data.get('messages')
+        scenario = data.get('scenario', 'daily_standup')
+        
+        if not isinstance(messages, list):
+            return None, scenario, "Messages must be a list"
+        
+        messages = [message.strip() for message in messages if isinstance(message, str) and message.strip()]
+        if not messages:
+            return None, scenario, "Messages cannot be empty"
+        if len(messages) > Config.ANALYSIS_BATCH_MAX_MESSAGES:
+            return None, scenario, f"At most {Config.ANALYSIS_BATCH_MAX_MESSAGES} messages can be sent at once"
+        
+        return messages, scenario, None
+    
+    def _send_message_error(self):
+        return jsonify({
+            "error": "Failed to process message",
+            "conversation_response": "I'm sorry, there was an error processing your message. Please try again.",
+            "corrections": [],
+            "new_vocabulary": [],
+            "suggestions": ""
+        }), 500
+    
+    def _stream_message(self, user_message, scenario, deadline):
+        """Stream the AI reply as newline-delimited JSON events"""
+        def generate():
+            try:
+                for event, payload in self.business_service.process_conversation_stream(user_message, scenario, deadline=deadline):
+                    if event == 'token':
+                        yield json.dumps({"type": "token", "text": payload}) + "\n"
+                    elif event == 'field':
+                        name, value = payload
+                        yield json.dumps({"type": "field", "name": name, "value": value}) + "\n"
+                    else:
+                        yield json.dumps({"type": "analysis", "analysis": payload}) + "\n"
+            except Exception as e:
+                print(f"Error in send_message stream: {e}")
+                yield json.dumps({"type": "error", "error": "Failed to process message"}) + "\n"
+        
+        # The generator only uses its arguments, so it needs no request context;
+        # stream_with_context would also break when called from an async view
+        return Response(
+            generate(),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
     
     def quiz(self):
         """Quiz interface page"""
@@ -81,8 +196,20 @@ class Routes:
     
     def generate_quiz(self):
         """Generate personalized quiz questions"""
+        deadline = Deadline.for_route('generate_quiz')
+        try:
+            quiz_data = self.business_service.generate_personalized_quiz(deadline=deadline)
+            return jsonify(quiz_data)
+            
+        except Exception as e:
+            print(f"Error in generate_quiz: {e}")
+            return jsonify({"error": str(e)}), 500
+    
+    async def generate_quiz_async(self):
+        """Async variant of generate_quiz"""
+        deadline = Deadline.for_route('generate_quiz')
         try:
-            quiz_data = self.business_service.generate_personalized_quiz()
+            quiz_data = await self.business_service.generate_personalized_quiz_async(deadline=deadline)
             return jsonify(quiz_data)
             
         except Exception as e:
@@ -107,34 +234,51 @@ class Routes:
     
     def personal_report(self):
         """Generate and display comprehensive AI analysis report"""
+        deadline = Deadline.for_route('personal_report')
         try:
-            report_data = self.business_service.generate_personal_report()
+            report_data = self.business_service.generate_personal_report(deadline=deadline)
             return render_template('report.html', 
                                  report=report_data['report'], 
                                  analytics=report_data['analytics'])
             
         except Exception as e:
             print(f"Error generating report: {e}")
-            # Return error page or fallback
+            return self._render_report_error()
+    
+    async def personal_report_async(self):
+        """Async variant of personal_report"""
+        deadline = Deadline.for_route('personal_report')
+        try:
+            report_data = await self.business_service.generate_personal_report_async(deadline=deadline)
             return render_template('report.html', 
-                                 report={
-                                     "strengths": ["Error generating report"],
-                                     "weaknesses": ["Please try again later"],
-                                     "grammar_mastered": [],
-                                     "grammar_needs_work": [],
-                                     "focus_areas": [],
-                                     "recommendations": [],
-                                     "overall_assessment": "Unable to generate report at this time.",
-                                     "learning_path": [],
-                                     "personality_insights": []
-                                 }, 
-                                 analytics={
-                                     'mistake_patterns': [],
-                                     'today_conversations': 0,
-                                     'vocabulary_count': 0,
-                                     'problem_areas': [],
-                                     'quiz_stats': {'avg_score': 0, 'total_quizzes': 0}
-                                 })
+                                 report=report_data['report'], 
+                                 analytics=report_data['analytics'])
+            
+        except Exception as e:
+            print(f"Error generating report: {e}")
+            return self._render_report_error()
+    
+    def _render_report_error(self):
+        # Return error page or fallback
+        return render_template('report.html', 
+                             report={
+                                 "strengths": ["Error generating report"],
+                                 "weaknesses": ["Please try again later"],
+                                 "grammar_mastered": [],
+                                 "grammar_needs_work": [],
+                                 "focus_areas": [],
+                                 "recommendations": [],
+                                 "overall_assessment": "Unable to generate report at this time.",
+                                 "learning_path": [],
+                                 "personality_insights": []
+                             }, 
+                             analytics={
+                                 'mistake_patterns': [],
+                                 'today_conversations': 0,
+                                 'vocabulary_count': 0,
+                                 'problem_areas': [],
+                                 'quiz_stats': {'avg_score': 0, 'total_quizzes': 0}
+                             })
     
     def analytics(self):
         """Analytics dashboard with progress tracking"""
@@ -156,6 +300,18 @@ class Routes:
                                  },
                                  recommendations=[])
     
+    def metrics(self):
+        """Token usage, latency and cache statistics for the AI calls (JSON)"""
+        try:
+            return jsonify(self.business_service.get_service_metrics(
+                operation=request.args.get('operation'),
+                scenario=request.args.get('scenario')
+            ))
+            
+        except Exception as e:
+            print(f"Error in metrics: {e}")
+            return jsonify({"error": "Failed to collect metrics"}), 500
+    
     def vocabulary(self):
         """Vocabulary management page"""
         try:
@@ -229,22 +385,21 @@ class Routes:
             
             if story_type == 'generated':
                 # Generate story using AI
-                topic = data.get('topic', 'software_development')
+                topic = data.get('topic', Config.STORY_POOL_TOPIC)
                 difficulty = data.get('difficulty', 'intermediate')
                 scenario = data.get('scenario', 'daily_standup')
                 length = data.get('length', 'short')
                 focus_areas = data.get('focus_areas', [])
                 
-                story = self.business_service.generate_ai_story(
-                    topic=topic, 
-                    difficulty=difficulty, 
-                    scenario=scenario,
-                    length=length,
-                    focus_areas=focus_areas
-                )
+                job_id = self.business_service.story_jobs.submit({
+                    'topic': topic,
+                    'difficulty': difficulty,
+                    'scenario': scenario,
+                    'length': length,
+                    'focus_areas': focus_areas
+                }, route='create_story')
                 
-                if not story:
-                    raise Exception("AI story generation failed")
+                return jsonify(self._story_job_accepted(job_id, success=True)), 202
                     
             else:
                 # Manual story creation
@@ -304,6 +459,7 @@ class Routes:
     
     def story_interact(self, story_id):
         """Handle user interactions with stories"""
+        deadline = Deadline.for_route('story_interact')
         try:
             data = request.json
             user_response = data.get('response', '')
@@ -314,7 +470,7 @@ class Routes:
             
             # Process interaction through business service
             result = self.business_service.process_story_interaction(
-                story_id, user_response, current_step
+                story_id, user_response, current_step, deadline=deadline
             )
             
             return jsonify(result)
@@ -324,49 +480,83 @@ class Routes:
             return jsonify({"error": str(e)}), 500
     
     def generate_story(self):
-        """Generate a new AI story"""
+        """Queue a new AI story; poll /stories/jobs/<job_id> for the result"""
         try:
-            data = request.json
-            parameters = {
-                'topic': data.get('topic', 'software development'),
-                'difficulty': data.get('difficulty', 'intermediate'),
-                'scenario': data.get('scenario', 'daily_standup'),
-                'length': data.get('length', 'short'),  # Default to short for better success rate
-                'focus_areas': data.get('focus_areas', ['technical_vocabulary', 'communication_skills'])
-            }
+            parameters = self._story_parameters(request.json)
             
             print(f"Generating story with parameters: {parameters}")
             
-            story = self.business_service.generate_ai_story(**parameters)
-            
-            if not story:
-                raise Exception("Failed to generate story - AI service returned None")
-            
-            if not story.get('id'):
-                raise Exception("Generated story has no ID")
-            
-            # Validate the story has steps
-            if not story.get('steps') or len(story['steps']) == 0:
-                print("Generated story has no steps, creating default steps")
-                default_steps = self._create_emergency_steps(parameters['scenario'])
-                self.business_service.db_service.save_story_steps(story['id'], default_steps)
-                story['steps'] = default_steps
-                story['total_steps'] = len(default_steps)
-            
-            print(f"Successfully generated story {story['id']} with {len(story.get('steps', []))} steps")
+            job_id = self.business_service.story_jobs.submit(
+                parameters,
+                finish=lambda story: self._finish_generated_story(story, parameters['scenario'])
+            )
             
-            return jsonify(story)
+            return jsonify(self._story_job_accepted(job_id)), 202
             
         except Exception as e:
             print(f"Error in generate_story: {e}")
-            # Return a meaningful error message
-            error_message = str(e)
-            if "API" in error_message:
-                error_message = "AI service is currently unavailable. Please try again or create a manual story."
-            elif "timeout" in error_message.lower():
-                error_message = "Story generation timed out. Please try with a shorter story length."
-            
-            return jsonify({"error": error_message}), 500
+            return self._story_generation_error(e)
+    
+    def story_job(self, job_id):
+        """Status of a story generation job, with partial results while it runs"""
+        job = self.business_service.story_jobs.get(job_id)
+        if not job:
+            return jsonify({"error": "Story job not found"}), 404
+        
+        result = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'partial': job['partial'],
+            'story_id': job['story_id']
+        }
+        if job['status'] == 'completed':
+            result['story_url'] = f"/stories/{job['story_id']}"
+        elif job['status'] == 'failed':
+            result['error'] = self._story_error_message(job['error'] or '')
+        return jsonify(result)
+    
+    def _story_job_accepted(self, job_id, **extra):
+        return {'job_id': job_id, 'status': 'queued', 'status_url': f"/stories/jobs/{job_id}", **extra}
+    
+    def _story_parameters(self, data):
+        return {
+            'topic': data.get('topic', Config.STORY_POOL_TOPIC),
+            'difficulty': data.get('difficulty', 'intermediate'),
+            'scenario': data.get('scenario', 'daily_standup'),
+            'length': data.get('length', 'short'),  # Default to short for better success rate
+            'focus_areas': data.get('focus_areas', ['technical_vocabulary', 'communication_skills'])
+        }
+    
+    def _finish_generated_story(self, story, scenario):
+        """Check a generated story and make sure it can be played"""
+        if not story:
+            raise Exception("Failed to generate story - AI service returned None")
+        
+        if not story.get('id'):
+            raise Exception("Generated story has no ID")
+        
+        # Validate the story has steps
+        if not story.get('steps') or len(story['steps']) == 0:
+            print("Generated story has no steps, creating default steps")
+            default_steps = self._create_emergency_steps(scenario)
+            self.business_service.db_service.save_story_steps(story['id'], default_steps)
+            story['steps'] = default_steps
+            story['total_steps'] = len(default_steps)
+        
+        print(f"Successfully generated story {story['id']} with {len(story.get('steps', []))} steps")
+        
+        return story
+    
+    def _story_generation_error(self, error):
+        return jsonify({"error": self._story_error_message(str(error))}), 500
+    
+    def _story_error_message(self, error_message):
+        # Return a meaningful error message
+        if "API" in error_message:
+            return "AI service is currently unavailable. Please try again or create a manual story."
+        elif "timeout" in error_message.lower():
+            return "Story generation timed out. Please try with a shorter story length."
+        return error_message
     
     def complete_story(self, story_id):
         """Mark story as completed and generate summary"""
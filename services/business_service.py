@@ -1,96 +1,183 @@
+import asyncio
 import json
 from .ai_service import AIService
 from .database import DatabaseService
 import random
 
 class BusinessService:
-    def __init__(self, db_service, ai_service):
+    def __init__(self, db_service, ai_service, question_bank=None):
         self.db_service = db_service
         self.ai_service = ai_service
+        self.question_bank = question_bank
+        self.story_pool = None  # Attached by the app factory, the pool needs this service
+        self.story_jobs = None  # Likewise for the story job queue
     
-    def process_conversation(self, user_message, scenario):
+    def process_conversation(self, user_message, scenario, deadline=None):
         """Process a user conversation message and return analysis"""
         # Analyze with AI
-        analysis = self.ai_service.analyze_english_with_deepseek(user_message, scenario)
+        analysis = self.ai_service.analyze_english_with_deepseek(user_message, scenario, deadline=deadline)
         
+        self._save_conversation_turn(user_message, scenario, analysis, deadline)
+        
+        return analysis
+    
+    async def process_conversation_async(self, user_message, scenario, deadline=None):
+        """Async variant of process_conversation"""
+        analysis = await self.ai_service.analyze_english_with_deepseek_async(user_message, scenario, deadline=deadline)
+        
+        await asyncio.to_thread(self._save_conversation_turn, user_message, scenario, analysis, deadline)
+        
+        return analysis
+    
+    def process_conversation_stream(self, user_message, scenario, deadline=None):
+        """Stream the AI reply for a conversation message, saving the turn once complete
+        
+        Yields ('token', text) and ('field', (name, value)) events followed by one
+        ('analysis', analysis) event.
+        """
+        for event, payload in self.ai_service.stream_english_analysis(user_message, scenario, deadline=deadline):
+            if event == 'analysis':
+                # Only persist once corrections and vocabulary are known
+                self._save_conversation_turn(user_message, scenario, payload, deadline)
+            yield event, payload
+    
+    def process_conversation_batch(self, user_messages, scenario, deadline=None):
+        """Analyze several messages in batched API calls and save them in one transaction"""
+        analyses = self.ai_service.analyze_english_batch(user_messages, scenario, deadline=deadline)
+        
+        self.db_service.save_conversation_batch([
+            (user_message,
+             analysis.get('conversation_response', ''),
+             analysis.get('corrections', []),
+             analysis.get('new_vocabulary', []))
+            for user_message, analysis in zip(user_messages, analyses)
+        ], scenario, deadline=deadline)
+        
+        return analyses
+    
+    def _save_conversation_turn(self, user_message, scenario, analysis, deadline=None):
+        """Save a conversation turn and its new vocabulary"""
         # Save to database
         conversation_id = self.db_service.save_conversation(
             user_message,
             analysis.get('conversation_response', ''),
             analysis.get('corrections', []),
-            scenario
+            scenario,
+            deadline=deadline
         )
         
         # Save new vocabulary
         if analysis.get('new_vocabulary'):
-            self.db_service.save_vocabulary(analysis.get('new_vocabulary', []))
+            self.db_service.save_vocabulary(analysis.get('new_vocabulary', []), deadline=deadline)
         
-        return analysis
+        return conversation_id
     
-    def generate_personalized_quiz(self):
+    def generate_personalized_quiz(self, deadline=None):
         """Generate a personalized quiz based on user's mistakes"""
         # Get user's mistake patterns
-        user_mistakes = self.db_service.get_user_mistakes(5)
+        user_mistakes = self.db_service.get_user_mistakes(5, deadline=deadline)
         
         if not user_mistakes:
             # If no mistakes found, return default questions
-            default_questions = [
-                {
-                    "question": "Choose the correct sentence for a code review:",
-                    "option_a": "This function works good",
-                    "option_b": "This function works well",
-                    "option_c": "This function work well",
-                    "correct_answer": "b",
-                    "explanation": "'Well' is the correct adverb to describe how something works",
-                    "category": "grammar"
-                },
-                {
-                    "question": "Which is the correct way to report a bug?",
-                    "option_a": "I found a bug in the login system",
-                    "option_b": "I finded a bug in the login system",
-                    "option_c": "I find a bug in the login system",
-                    "correct_answer": "a",
-                    "explanation": "'Found' is the correct past tense of 'find'",
-                    "category": "verb_tense"
-                },
-                {
-                    "question": "What's the best way to describe a completed task?",
-                    "option_a": "I have finish the implementation",
-                    "option_b": "I have finished the implementation",
-                    "option_c": "I have finishing the implementation",
-                    "correct_answer": "b",
-                    "explanation": "Present perfect requires the past participle 'finished'",
-                    "category": "verb_tense"
-                },
-                {
-                    "question": "How should you ask for help in a meeting?",
-                    "option_a": "Can you help me with this issue?",
-                    "option_b": "Can you help me to this issue?",
-                    "option_c": "Can you help me for this issue?",
-                    "correct_answer": "a",
-                    "explanation": "'Help me with' is the correct preposition usage",
-                    "category": "prepositions"
-                },
-                {
-                    "question": "Which sentence is correct for describing progress?",
-                    "option_a": "We are making good progresses",
-                    "option_b": "We are making good progress",
-                    "option_c": "We are making a good progresses",
-                    "correct_answer": "b",
-                    "explanation": "'Progress' is an uncountable noun, so no plural form",
-                    "category": "grammar"
-                }
-            ]
-            return {"questions": default_questions}
+            return {"questions": self._get_default_quiz_questions()}
+        
+        # Serve from the pre-generated bank, only calling the API for what it can't cover
+        questions = self._take_banked_questions(user_mistakes, 5, deadline)
+        if len(questions) < 5:
+            questions += self.ai_service.generate_quiz_questions(user_mistakes, 5 - len(questions), deadline=deadline)
+        
+        if not questions:
+            # The AI call was shed, the circuit is open or the call failed; starter questions beat an error
+            print("🔄 No quiz questions from the bank or the AI - serving default questions")
+            questions = self._get_default_quiz_questions()
         
-        # Generate questions based on user mistakes
-        questions = self.ai_service.generate_quiz_questions(user_mistakes, 5)
+        return {"questions": questions}
+    
+    async def generate_personalized_quiz_async(self, deadline=None):
+        """Async variant of generate_personalized_quiz"""
+        user_mistakes = await asyncio.to_thread(self.db_service.get_user_mistakes, 5, deadline=deadline)
+        
+        if not user_mistakes:
+            return {"questions": self._get_default_quiz_questions()}
+        
+        questions = await asyncio.to_thread(self._take_banked_questions, user_mistakes, 5, deadline)
+        if len(questions) < 5:
+            questions += await self.ai_service.generate_quiz_questions_async(user_mistakes, 5 - len(questions), deadline=deadline)
         
         if not questions:
-            raise Exception("Failed to generate quiz questions")
+            # The AI call was shed, the circuit is open or the call failed; starter questions beat an error
+            print("🔄 No quiz questions from the bank or the AI - serving default questions")
+            questions = self._get_default_quiz_questions()
         
         return {"questions": questions}
     
+    def _take_banked_questions(self, user_mistakes, count, deadline=None):
+        """Claim banked questions for the user's top mistake types and schedule a refill"""
+        if not self.question_bank:
+            return []
+        
+        categories = [mistake[0] for mistake in user_mistakes[:3]]
+        try:
+            questions = self.question_bank.take(categories, count, deadline=deadline)
+        except Exception as e:
+            print(f"⚠️ Quiz bank unavailable: {e}")
+            return []
+        finally:
+            self.question_bank.request_refill(categories)
+        
+        print(f"🏦 Served {len(questions)}/{count} quiz questions from the bank")
+        return questions
+    
+    def _get_default_quiz_questions(self):
+        """Starter questions for users without recorded mistakes, or when no AI questions are available"""
+        return [
+            {
+                "question": "Choose the correct sentence for a code review:",
+                "option_a": "This function works good",
+                "option_b": "This function works well",
+                "option_c": "This function work well",
+                "correct_answer": "b",
+                "explanation": "'Well' is the correct adverb to describe how something works",
+                "category": "grammar"
+            },
+            {
+                "question": "Which is the correct way to report a bug?",
+                "option_a": "I found a bug in the login system",
+                "option_b": "I finded a bug in the login system",
+                "option_c": "I find a bug in the login system",
+                "correct_answer": "a",
+                "explanation": "'Found' is the correct past tense of 'find'",
+                "category": "verb_tense"
+            },
+            {
+                "question": "What's the best way to describe a completed task?",
+                "option_a": "I have finish the implementation",
+                "option_b": "I have finished the implementation",
+                "option_c": "I have finishing the implementation",
+                "correct_answer": "b",
+                "explanation": "Present perfect requires the past participle 'finished'",
+                "category": "verb_tense"
+            },
+            {
+                "question": "How should you ask for help in a meeting?",
+                "option_a": "Can you help me with this issue?",
+                "option_b": "Can you help me to this issue?",
+                "option_c": "Can you help me for this issue?",
+                "correct_answer": "a",
+                "explanation": "'Help me with' is the correct preposition usage",
+                "category": "prepositions"
+            },
+            {
+                "question": "Which sentence is correct for describing progress?",
+                "option_a": "We are making good progresses",
+                "option_b": "We are making good progress",
+                "option_c": "We are making a good progresses",
+                "correct_answer": "b",
+                "explanation": "'Progress' is an uncountable noun, so no plural form",
+                "category": "grammar"
+            }
+        ]
+    
     def process_quiz_submission(self, answers, questions):
         """Process quiz submission and return results"""
         if not answers or not questions:
@@ -146,14 +233,14 @@ class BusinessService:
             "focused_areas": list(set(focused_areas))
         }
     
-    def generate_personal_report(self):
+    def generate_personal_report(self, deadline=None):
         """Generate comprehensive AI analysis report"""
         try:
             # Generate AI report
-            ai_report = self.ai_service.generate_ai_personal_report()
+            ai_report = self.ai_service.generate_ai_personal_report(deadline=deadline)
             
             # Get additional analytics data
-            analytics = self.db_service.get_user_analytics()
+            analytics = self.db_service.get_user_analytics(deadline=deadline)
             
             return {
                 'report': ai_report,
@@ -162,23 +249,42 @@ class BusinessService:
             
         except Exception as e:
             print(f"Error generating report: {e}")
-            # Fallback data
-            fallback_report = {
-                "strengths": ["You're committed to learning"],
-                "weaknesses": ["Continue practicing regularly"],
-                "grammar_mastered": [],
-                "grammar_needs_work": [],
-                "focus_areas": ["Daily practice", "Grammar quizzes"],
-                "recommendations": ["Keep practicing conversations"],
-                "overall_assessment": "Keep up the great work with your English practice!",
-                "learning_path": ["Daily conversations", "Weekly quizzes"],
-                "personality_insights": ["Dedicated learner"]
+            return {
+                'report': self._get_fallback_personal_report(),
+                'analytics': self.db_service.get_user_analytics()
             }
-            analytics = self.db_service.get_user_analytics()
+    
+    async def generate_personal_report_async(self, deadline=None):
+        """Async variant of generate_personal_report"""
+        try:
+            ai_report = await self.ai_service.generate_ai_personal_report_async(deadline=deadline)
+            analytics = await asyncio.to_thread(self.db_service.get_user_analytics, deadline=deadline)
+            
             return {
-                'report': fallback_report,
+                'report': ai_report,
                 'analytics': analytics
             }
+            
+        except Exception as e:
+            print(f"Error generating report: {e}")
+            return {
+                'report': self._get_fallback_personal_report(),
+                'analytics': await asyncio.to_thread(self.db_service.get_user_analytics)
+            }
+    
+    def _get_fallback_personal_report(self):
+        """Fallback report data when report generation fails"""
+        return {
+            "strengths": ["You're committed to learning"],
+            "weaknesses": ["Continue practicing regularly"],
+            "grammar_mastered": [],
+            "grammar_needs_work": [],
+            "focus_areas": ["Daily practice", "Grammar quizzes"],
+            "recommendations": ["Keep practicing conversations"],
+            "overall_assessment": "Keep up the great work with your English practice!",
+            "learning_path": ["Daily conversations", "Weekly quizzes"],
+            "personality_insights": ["Dedicated learner"]
+        }
     
     def generate_recommendations(self):
         """Generate personalized learning recommendations"""
@@ -239,6 +345,15 @@ class BusinessService:
             'recommendations': recommendations
         }
     
+    def get_service_metrics(self, operation=None, scenario=None):
+        """LLM usage and latency per operation and scenario, plus cache and circuit state"""
+        metrics = self.ai_service.get_metrics(operation, scenario)
+        if self.question_bank:
+            metrics['quiz_bank'] = self.question_bank.get_stats()
+        if self.story_pool:
+            metrics['story_pool'] = self.story_pool.get_stats()
+        return metrics
+    
     def get_vocabulary_data(self):
         """Get vocabulary data"""
         return self.db_service.get_vocabulary_list()
@@ -288,13 +403,41 @@ class BusinessService:
     
     def generate_ai_story(self, topic='software_development', difficulty='intermediate', 
                          scenario='daily_standup', length='medium', focus_areas=None, 
-                         additional_preferences=''):
-        """Generate a new AI story based on parameters"""
+                         additional_preferences='', deadline=None, on_progress=None):
+        """Generate a new AI story based on parameters
+        
+        on_progress(partial) is called with the story's title, description and
+        finished steps while it is still being generated.
+        """
+        if self.story_pool and self.story_pool.accepts(topic, additional_preferences):
+            story = self.story_pool.claim(scenario, difficulty, length, deadline=deadline)
+            if story:
+                return story
+        
         if not self.ai_service.client:
             return self._create_fallback_story(topic, difficulty, scenario, length)
         
         # Prepare parameters for AI generation
-        parameters = {
+        parameters = self._build_story_parameters(topic, difficulty, scenario, length, focus_areas, additional_preferences)
+        
+        # Generate story using AI service
+        story_data = self.ai_service.generate_story_with_ai(parameters, deadline=deadline, on_progress=on_progress)
+        
+        return self._save_ai_story(story_data, topic, difficulty, scenario, length, deadline)
+    
+    def generate_pooled_story(self, topic, difficulty, scenario, length):
+        """Generate a story for the story pool; returns its ID, or None when the AI output is unusable"""
+        parameters = self._build_story_parameters(topic, difficulty, scenario, length, None, '')
+        story_data = self.ai_service.generate_story_with_ai(parameters)
+        
+        # Built-in fallback stories are never pooled
+        if not story_data or not self._validate_story_data(story_data):
+            return None
+        return self._store_story(story_data, topic, difficulty, scenario, length, pooled=True)['id']
+    
+    def _build_story_parameters(self, topic, difficulty, scenario, length, focus_areas, additional_preferences):
+        """Prepare parameters for AI story generation"""
+        return {
             'topic': topic,
             'scenario': scenario,
             'difficulty': difficulty,
@@ -302,10 +445,9 @@ class BusinessService:
             'focus_areas': focus_areas or ['technical_vocabulary', 'communication_skills'],
             'additional_preferences': additional_preferences
         }
-        
-        # Generate story using AI service
-        story_data = self.ai_service.generate_story_with_ai(parameters)
-        
+    
+    def _save_ai_story(self, story_data, topic, difficulty, scenario, length, deadline=None):
+        """Save an AI-generated story, falling back to a built-in story if it is unusable"""
         if not story_data:
             # Fallback to manual creation if AI fails
             return self._create_fallback_story(topic, difficulty, scenario, length)
@@ -316,43 +458,50 @@ class BusinessService:
                 print("Invalid story data from AI, using fallback")
                 return self._create_fallback_story(topic, difficulty, scenario, length)
             
-            # Save story to database
-            story_id = self.db_service.save_story(
-                title=story_data.get('title', 'Generated Story'),
-                description=story_data.get('description', ''),
-                content=story_data.get('content', ''),
-                story_type='generated',
-                scenario=scenario,
-                difficulty_level=difficulty,
-                topic=topic,
-                estimated_time=story_data.get('estimated_time', 15),
-                learning_objectives=story_data.get('learning_objectives', [])
-            )
-            
-            # Save story steps - CRITICAL FIX
-            steps = story_data.get('steps', [])
-            if steps:
-                # Ensure step numbers are correct and validate each step
-                validated_steps = []
-                for i, step in enumerate(steps):
-                    validated_step = self._validate_and_fix_step(step, i + 1)
-                    validated_steps.append(validated_step)
-                
-                self.db_service.save_story_steps(story_id, validated_steps)
-            else:
-                # If no steps, create a basic interaction step
-                default_steps = self._create_default_steps(scenario)
-                self.db_service.save_story_steps(story_id, default_steps)
-            
-            # Return story with ID and ensure it has steps
-            story_data['id'] = story_id
-            story_data['steps'] = validated_steps if steps else default_steps
-            return story_data
+            return self._store_story(story_data, topic, difficulty, scenario, length, deadline=deadline)
             
         except Exception as e:
             print(f"Error saving AI-generated story: {e}")
             return self._create_fallback_story(topic, difficulty, scenario, length)
         
+    def _store_story(self, story_data, topic, difficulty, scenario, length, pooled=False, deadline=None):
+        """Save a validated AI story and its steps, returning it with its ID"""
+        # Save story to database
+        story_id = self.db_service.save_story(
+            title=story_data.get('title', 'Generated Story'),
+            description=story_data.get('description', ''),
+            content=story_data.get('content', ''),
+            story_type='generated',
+            scenario=scenario,
+            difficulty_level=difficulty,
+            topic=topic,
+            estimated_time=story_data.get('estimated_time', 15),
+            learning_objectives=story_data.get('learning_objectives', []),
+            story_length=length,
+            pooled=pooled,
+            deadline=deadline
+        )
+        
+        # Save story steps - CRITICAL FIX
+        steps = story_data.get('steps', [])
+        if steps:
+            # Ensure step numbers are correct and validate each step
+            validated_steps = []
+            for i, step in enumerate(steps):
+                validated_step = self._validate_and_fix_step(step, i + 1)
+                validated_steps.append(validated_step)
+            
+            self.db_service.save_story_steps(story_id, validated_steps, deadline=deadline)
+        else:
+            # If no steps, create a basic interaction step
+            default_steps = self._create_default_steps(scenario)
+            self.db_service.save_story_steps(story_id, default_steps, deadline=deadline)
+        
+        # Return story with ID and ensure it has steps
+        story_data['id'] = story_id
+        story_data['steps'] = validated_steps if steps else default_steps
+        return story_data
+    
     def _validate_story_data(self, story_data):
         """Validate that story data has required fields"""
         required_fields = ['title', 'content']
@@ -706,17 +855,18 @@ class BusinessService:
             'difficulty_level': difficulty
         }
     
-    def process_story_interaction(self, story_id, user_response, current_step):
+    def process_story_interaction(self, story_id, user_response, current_step, deadline=None):
         """Process user interaction with a story step"""
         # Get story details
-        story = self.db_service.get_story_by_id(story_id)
+        story = self.db_service.get_story_by_id(story_id, deadline=deadline)
         if not story:
             raise Exception("Story not found")
         
         # Analyze user response with AI
         ai_analysis = self.ai_service.analyze_english_with_deepseek(
             user_response, 
-            f"story_interaction_{story['scenario']}"
+            f"story_interaction_{story['scenario']}",
+            deadline=deadline
         )
         
         # Calculate interaction score based on response quality
@@ -732,12 +882,13 @@ class BusinessService:
             ai_feedback=ai_analysis.get('conversation_response', ''),
             corrections=ai_analysis.get('corrections', []),
             new_vocabulary=ai_analysis.get('new_vocabulary', []),
-            interaction_score=interaction_score
+            interaction_score=interaction_score,
+            deadline=deadline
         )
         
         # Save new vocabulary to main vocabulary table
         if ai_analysis.get('new_vocabulary'):
-            self.db_service.save_vocabulary(ai_analysis['new_vocabulary'])
+            self.db_service.save_vocabulary(ai_analysis['new_vocabulary'], deadline=deadline)
         
         # Determine next step
         next_step = current_step + 1
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+from config import Config
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the upstream is considered down"""
+
+class CircuitBreaker:
+    """Process-wide circuit breaker with a sliding failure-rate window
+
+    closed    -> calls flow, outcomes are recorded in the window
+    open      -> calls are refused until the cool-down has passed
+    half_open -> a limited number of trial calls decide whether to close again
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name, failure_rate_threshold=None, window_seconds=None, minimum_calls=None,
+                 cooldown_seconds=None, half_open_max_calls=1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold or Config.CIRCUIT_FAILURE_RATE
+        self.window_seconds = window_seconds or Config.CIRCUIT_WINDOW_SECONDS
+        self.minimum_calls = minimum_calls or Config.CIRCUIT_MINIMUM_CALLS
+        self.cooldown_seconds = cooldown_seconds or Config.CIRCUIT_COOLDOWN_SECONDS
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes = deque()  # (timestamp, succeeded)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @classmethod
+    def shared(cls, name):
+        """Get the breaker every client of the same upstream shares"""
+        with cls._registry_lock:
+            breaker = cls._registry.get(name)
+            if breaker is None:
+                breaker = cls(name)
+                cls._registry[name] = breaker
+            return breaker
+
+    def allow_request(self):
+        """Reserve a call slot; False means fail fast"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown_seconds:
+                    return False
+                print(f"🟡 Circuit '{self.name}' half-open, sending a trial request")
+                self._state = self.HALF_OPEN
+                self._half_open_calls = 0
+
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    return False
+                self._half_open_calls += 1
+
+            return True
+
+    def release_trial(self):
+        """Give back a half-open trial reserved by allow_request() whose call ended without an outcome"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def is_open(self):
+        """True while calls would be refused, without reserving a slot"""
+        with self._lock:
+            if self._state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.cooldown_seconds
+            if self._state == self.HALF_OPEN:
+                return self._half_open_calls >= self.half_open_max_calls
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                print(f"🟢 Circuit '{self.name}' closed, upstream recovered")
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                return
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trip()
+                return
+            self._record(False)
+
+            total = len(self._outcomes)
+            if self._state == self.CLOSED and total >= self.minimum_calls:
+                failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+                if failures / total >= self.failure_rate_threshold:
+                    self._trip()
+
+    def _record(self, succeeded):
+        # Caller holds the lock
+        now = time.monotonic()
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _trip(self):
+        # Caller holds the lock
+        print(f"🔴 Circuit '{self.name}' opened for {self.cooldown_seconds}s")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+
+    def get_state(self):
+        """Snapshot of the breaker for inspection"""
+        with self._lock:
+            total = len(self._outcomes)
+            failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+            retry_after = 0.0
+            if self._state == self.OPEN:
+                retry_after = max(0.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_calls': total,
+                'window_failures': failures,
+                'failure_rate': round(failures / total, 3) if total else 0.0,
+                'retry_after': round(retry_after, 1)
+            }
@@ -0,0 +1,136 @@
+import json
+import time
+import requests
+
+class Usage:
+    """Token counts reported by the API for one completion"""
+
+    __slots__ = ('prompt_tokens', 'completion_tokens', 'cached_tokens')
+
+    def __init__(self, prompt_tokens=0, completion_tokens=0, cached_tokens=0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+    @classmethod
+    def from_api(cls, data):
+        """Read DeepSeek's usage block (OpenAI's cached_tokens detail is accepted too)"""
+        if not data:
+            return None
+        cached = data.get('prompt_cache_hit_tokens')
+        if cached is None:
+            cached = (data.get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+        return cls(data.get('prompt_tokens', 0), data.get('completion_tokens', 0), cached or 0)
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self):
+        return {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens
+        }
+
+class Message:
+    __slots__ = ('role', 'content')
+
+    def __init__(self, content, role='assistant'):
+        self.role = role
+        self.content = content
+
+class Choice:
+    __slots__ = ('message', 'finish_reason')
+
+    def __init__(self, message, finish_reason=None):
+        self.message = message
+        self.finish_reason = finish_reason
+
+class ChatCompletion:
+    """Chat completion shaped like OpenAI's, plus usage and wall time"""
+
+    __slots__ = ('choices', 'model', 'usage', 'elapsed')
+
+    def __init__(self, choices, model=None, usage=None, elapsed=0.0):
+        self.choices = choices
+        self.model = model
+        self.usage = usage
+        self.elapsed = elapsed
+
+    @classmethod
+    def from_api(cls, data, elapsed):
+        choice = data['choices'][0]
+        return cls(
+            [Choice(Message(choice['message']['content']), choice.get('finish_reason'))],
+            model=data.get('model'),
+            usage=Usage.from_api(data.get('usage')),
+            elapsed=elapsed
+        )
+
+    @property
+    def finish_reason(self):
+        return self.choices[0].finish_reason if self.choices else None
+
+    def to_shared(self):
+        """JSON-compatible copy for callers that reuse this completion; they spent no tokens on it"""
+        return {
+            'content': self.choices[0].message.content if self.choices else '',
+            'finish_reason': self.finish_reason,
+            'model': self.model
+        }
+
+    @classmethod
+    def from_shared(cls, data):
+        return cls([Choice(Message(data['content']), data.get('finish_reason'))], model=data.get('model'))
+
+class CompletionStream:
+    """Iterator of content deltas from a server-sent events response
+
+    Usage, finish reason and model are filled in as the final chunks arrive;
+    elapsed covers the whole stream once iteration has finished. on_close is
+    called once the response has been closed.
+    """
+
+    def __init__(self, response, started_at, on_close=None):
+        self._response = response
+        self._started_at = started_at
+        self._on_close = on_close
+        self.model = None
+        self.usage = None
+        self.finish_reason = None
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        try:
+            for raw_line in self._response.iter_lines():
+                line = raw_line.decode('utf-8') if isinstance(raw_line, bytes) else raw_line
+                if not line.startswith('data:'):
+                    continue
+
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+
+                self.model = chunk.get('model') or self.model
+                if chunk.get('usage'):
+                    self.usage = Usage.from_api(chunk['usage'])
+
+                choices = chunk.get('choices') or []
+                if choices:
+                    self.finish_reason = choices[0].get('finish_reason') or self.finish_reason
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        yield content
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"API stream interrupted: {str(e)}")
+        finally:
+            self.elapsed = time.perf_counter() - self._started_at
+            self._response.close()
+            if self._on_close is not None:
+                self._on_close()
@@ -1,486 +1,297 @@
-import sqlite3
 import json
+import time
 from config import Config
+from .db_pool import ConnectionPool
+from .deadline import Deadline
+from .migrations import migrate
 
 class DatabaseService:
     def __init__(self):
         self.db_path = Config.DATABASE_PATH
+        self.pool = ConnectionPool(self.db_path)
         self.init_db()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def get_connection(self, deadline=None):
+        """Borrow a pooled connection; leaving its with block (or closing it) returns it to the pool"""
+        if deadline is None:
+            return self.pool.connection()
+        # Don't wait on a locked database longer than the request has left,
+        # but always leave enough time to save work that is already done
+        timeout = min(Config.DB_BUSY_TIMEOUT, max(deadline.remaining(), Deadline.MIN_ATTEMPT_SECONDS))
+        return self.pool.connection(busy_timeout=timeout)
+    
+    def close(self):
+        """Close the pooled connections (used on shutdown)"""
+        self.pool.close()
     
     def init_db(self):
-        """Initialize the database with all required tables"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        # Conversations table
-        c.execute('''CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_message TEXT NOT NULL,
-            ai_response TEXT NOT NULL,
-            corrections TEXT,
-            scenario TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Grammar mistakes table
-        c.execute('''CREATE TABLE IF NOT EXISTS grammar_mistakes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            original_text TEXT NOT NULL,
-            corrected_text TEXT NOT NULL,
-            mistake_type TEXT NOT NULL,
-            explanation TEXT,
-            conversation_id INTEGER,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-        )''')
-        
-        # Vocabulary table
-        c.execute('''CREATE TABLE IF NOT EXISTS vocabulary (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            word TEXT NOT NULL UNIQUE,
-            definition TEXT NOT NULL,
-            example TEXT,
-            category TEXT DEFAULT 'technical',
-            difficulty_level INTEGER DEFAULT 1,
-            times_encountered INTEGER DEFAULT 1,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # User progress table
-        c.execute('''CREATE TABLE IF NOT EXISTS user_progress (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            skill_area TEXT NOT NULL,
-            current_level INTEGER DEFAULT 1,
-            mistakes_count INTEGER DEFAULT 0,
-            improvements_count INTEGER DEFAULT 0,
-            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Learning recommendations table
-        c.execute('''CREATE TABLE IF NOT EXISTS recommendations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recommendation_type TEXT NOT NULL,
-            content TEXT NOT NULL,
-            priority INTEGER DEFAULT 1,
-            is_completed BOOLEAN DEFAULT FALSE,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Quiz results table
-        c.execute('''CREATE TABLE IF NOT EXISTS quiz_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quiz_type TEXT NOT NULL,
-            total_questions INTEGER NOT NULL,
-            correct_answers INTEGER NOT NULL,
-            incorrect_answers INTEGER NOT NULL,
-            score_percentage REAL NOT NULL,
-            focused_areas TEXT,
-            detailed_results TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Quiz questions table
-        c.execute('''CREATE TABLE IF NOT EXISTS quiz_questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_text TEXT NOT NULL,
-            option_a TEXT NOT NULL,
-            option_b TEXT NOT NULL,
-            option_c TEXT NOT NULL,
-            correct_answer TEXT NOT NULL,
-            explanation TEXT NOT NULL,
-            grammar_category TEXT NOT NULL,
-            difficulty_level INTEGER DEFAULT 1,
-            based_on_user_mistake BOOLEAN DEFAULT FALSE,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # NEW: Stories table
-        c.execute('''CREATE TABLE IF NOT EXISTS stories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            content TEXT NOT NULL,
-            story_type TEXT DEFAULT 'generated',
-            scenario TEXT DEFAULT 'general',
-            difficulty_level TEXT DEFAULT 'intermediate',
-            topic TEXT DEFAULT 'software_development',
-            estimated_time INTEGER DEFAULT 10,
-            total_steps INTEGER DEFAULT 1,
-            learning_objectives TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT TRUE
-        )''')
-        
-        # NEW: Story steps table (for interactive stories)
-        c.execute('''CREATE TABLE IF NOT EXISTS story_steps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            story_id INTEGER NOT NULL,
-            step_number INTEGER NOT NULL,
-            step_type TEXT DEFAULT 'narrative',
-            content TEXT NOT NULL,
-            question TEXT,
-            expected_response_type TEXT DEFAULT 'open',
-            learning_focus TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (story_id) REFERENCES stories (id)
-        )''')
-        
-        # NEW: User story progress table
-        c.execute('''CREATE TABLE IF NOT EXISTS user_story_progress (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            story_id INTEGER NOT NULL,
-            current_step INTEGER DEFAULT 1,
-            is_completed BOOLEAN DEFAULT FALSE,
-            total_interactions INTEGER DEFAULT 0,
-            completion_percentage REAL DEFAULT 0.0,
-            time_spent INTEGER DEFAULT 0,
-            last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
-            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            completed_at DATETIME,
-            FOREIGN KEY (story_id) REFERENCES stories (id)
-        )''')
-        
-        # NEW: Story interactions table
-        c.execute('''CREATE TABLE IF NOT EXISTS story_interactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            story_id INTEGER NOT NULL,
-            step_number INTEGER NOT NULL,
-            user_response TEXT NOT NULL,
-            ai_feedback TEXT,
-            corrections TEXT,
-            new_vocabulary TEXT,
-            interaction_score REAL DEFAULT 0.0,
-            response_time INTEGER DEFAULT 0,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (story_id) REFERENCES stories (id)
-        )''')
-        
-        # NEW: Story templates table (for AI generation)
-        c.execute('''CREATE TABLE IF NOT EXISTS story_templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            scenario TEXT NOT NULL,
-            difficulty_level TEXT NOT NULL,
-            template_structure TEXT NOT NULL,
-            variables TEXT,
-            learning_objectives TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT TRUE
-        )''')
-        
-        conn.commit()
-        
-        # Insert default story templates if they don't exist
-        self._insert_default_story_templates(c)
-        conn.commit()
-        conn.close()
-    
-    def _insert_default_story_templates(self, cursor):
-        """Insert default story templates for AI generation"""
-        default_templates = [
-            {
-                'name': 'Bug Hunt Adventure',
-                'scenario': 'debugging_session',
-                'difficulty_level': 'intermediate',
-                'template_structure': json.dumps({
-                    'intro': 'A critical bug has been discovered in production...',
-                    'steps': [
-                        {'type': 'narrative', 'content': 'Describe the bug symptoms'},
-                        {'type': 'question', 'content': 'What would be your first debugging step?'},
-                        {'type': 'narrative', 'content': 'Investigation process'},
-                        {'type': 'question', 'content': 'How would you communicate this to stakeholders?'},
-                        {'type': 'resolution', 'content': 'Bug resolution and lessons learned'}
-                    ]
-                }),
-                'variables': json.dumps(['bug_type', 'system_component', 'urgency_level']),
-                'learning_objectives': json.dumps(['technical vocabulary', 'problem-solving communication', 'stakeholder updates'])
-            },
-            {
-                'name': 'Code Review Drama',
-                'scenario': 'code_review',
-                'difficulty_level': 'advanced',
-                'template_structure': json.dumps({
-                    'intro': 'You need to review a complex pull request...',
-                    'steps': [
-                        {'type': 'narrative', 'content': 'Analyzing the code changes'},
-                        {'type': 'question', 'content': 'How would you provide constructive feedback?'},
-                        {'type': 'dialogue', 'content': 'Discussion with the developer'},
-                        {'type': 'question', 'content': 'How do you handle disagreements?'},
-                        {'type': 'conclusion', 'content': 'Reaching consensus and approval'}
-                    ]
-                }),
-                'variables': json.dumps(['code_complexity', 'team_member', 'review_type']),
-                'learning_objectives': json.dumps(['diplomatic language', 'technical feedback', 'conflict resolution'])
-            },
-            {
-                'name': 'Interview Challenge',
-                'scenario': 'technical_interview',
-                'difficulty_level': 'beginner',
-                'template_structure': json.dumps({
-                    'intro': 'You are interviewing for a software developer position...',
-                    'steps': [
-                        {'type': 'question', 'content': 'Tell me about yourself'},
-                        {'type': 'technical', 'content': 'Explain a technical concept'},
-                        {'type': 'behavioral', 'content': 'Describe a challenging project'},
-                        {'type': 'scenario', 'content': 'How would you handle a difficult situation?'},
-                        {'type': 'closing', 'content': 'Questions for the interviewer'}
-                    ]
-                }),
-                'variables': json.dumps(['company_type', 'position_level', 'technology_stack']),
-                'learning_objectives': json.dumps(['self-presentation', 'technical explanations', 'question asking'])
-            }
-        ]
-        
-        for template in default_templates:
-            cursor.execute('''INSERT OR IGNORE INTO story_templates 
-                             (name, scenario, difficulty_level, template_structure, variables, learning_objectives)
-                             VALUES (?, ?, ?, ?, ?, ?)''',
-                          (template['name'], template['scenario'], template['difficulty_level'],
-                           template['template_structure'], template['variables'], template['learning_objectives']))
-    
-    def save_conversation(self, user_message, ai_response, corrections, scenario):
+        """Bring the database schema up to date (a single version check when it already is)"""
+        with self.get_connection() as conn:
+            migrate(conn)
+    
+    def save_conversation(self, user_message, ai_response, corrections, scenario, deadline=None):
         """Save a conversation with corrections to the database"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute('''INSERT INTO conversations (user_message, ai_response, corrections, scenario)
-                     VALUES (?, ?, ?, ?)''',
-                  (user_message, ai_response, json.dumps(corrections), scenario))
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            conversation_id = self._insert_conversation(c, user_message, ai_response, corrections, scenario)
+            
+            conn.commit()
+        return conversation_id
+    
+    def save_conversation_batch(self, turns, scenario, deadline=None):
+        """Save several conversation turns and their new vocabulary in one transaction
+        
+        Each turn is (user_message, ai_response, corrections, new_vocabulary).
+        Returns the conversation IDs in the same order.
+        """
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            conversation_ids = []
+            for user_message, ai_response, corrections, new_vocabulary in turns:
+                conversation_ids.append(self._insert_conversation(c, user_message, ai_response, corrections, scenario))
+                self._insert_vocabulary(c, new_vocabulary or [])
+            
+            conn.commit()
+        return conversation_ids
+    
+    def _insert_conversation(self, cursor, user_message, ai_response, corrections, scenario):
+        cursor.execute('''INSERT INTO conversations (user_message, ai_response, corrections, scenario)
+                          VALUES (?, ?, ?, ?)''',
+                       (user_message, ai_response, json.dumps(corrections), scenario))
         
-        conversation_id = c.lastrowid
+        conversation_id = cursor.lastrowid
         
         # Save grammar mistakes
         for correction in corrections:
-            c.execute('''INSERT INTO grammar_mistakes 
-                         (original_text, corrected_text, mistake_type, explanation, conversation_id)
-                         VALUES (?, ?, ?, ?, ?)''',
-                      (correction.get('original', ''),
-                       correction.get('corrected', ''),
-                       correction.get('type', ''),
-                       correction.get('explanation', ''),
-                       conversation_id))
+            cursor.execute('''INSERT INTO grammar_mistakes 
+                              (original_text, corrected_text, mistake_type, explanation, conversation_id)
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (correction.get('original', ''),
+                            correction.get('corrected', ''),
+                            correction.get('type', ''),
+                            correction.get('explanation', ''),
+                            conversation_id))
         
-        conn.commit()
-        conn.close()
         return conversation_id
     
-    def save_vocabulary(self, vocabulary_list):
+    def save_vocabulary(self, vocabulary_list, deadline=None):
         """Save new vocabulary words to the database"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            self._insert_vocabulary(c, vocabulary_list)
+            
+            conn.commit()
+    
+    def _insert_vocabulary(self, cursor, vocabulary_list):
         for vocab in vocabulary_list:
-            c.execute('''INSERT OR IGNORE INTO vocabulary (word, definition, example)
-                         VALUES (?, ?, ?)''',
-                      (vocab.get('word', ''),
-                       vocab.get('definition', ''),
-                       vocab.get('example', '')))
+            cursor.execute('''INSERT OR IGNORE INTO vocabulary (word, definition, example)
+                              VALUES (?, ?, ?)''',
+                           (vocab.get('word', ''),
+                            vocab.get('definition', ''),
+                            vocab.get('example', '')))
             
             # Update encounter count if word already exists
-            c.execute('''UPDATE vocabulary SET times_encountered = times_encountered + 1
-                         WHERE word = ?''', (vocab.get('word', ''),))
-        
-        conn.commit()
-        conn.close()
+            cursor.execute('''UPDATE vocabulary SET times_encountered = times_encountered + 1
+                              WHERE word = ?''', (vocab.get('word', ''),))
     
     def save_quiz_result(self, quiz_type, total_questions, correct_answers, detailed_results, focused_areas):
         """Save quiz results to the database"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        incorrect_answers = total_questions - correct_answers
-        score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-        
-        c.execute('''INSERT INTO quiz_results 
-                     (quiz_type, total_questions, correct_answers, incorrect_answers, 
-                      score_percentage, focused_areas, detailed_results)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (quiz_type, total_questions, correct_answers, incorrect_answers,
-                   score_percentage, json.dumps(focused_areas), json.dumps(detailed_results)))
-        
-        conn.commit()
-        conn.close()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            
+            incorrect_answers = total_questions - correct_answers
+            score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+            
+            c.execute('''INSERT INTO quiz_results 
+                         (quiz_type, total_questions, correct_answers, incorrect_answers, 
+                          score_percentage, focused_areas, detailed_results)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      (quiz_type, total_questions, correct_answers, incorrect_answers,
+                       score_percentage, json.dumps(focused_areas), json.dumps(detailed_results)))
+            
+            conn.commit()
     
-    def save_quiz_questions(self, questions):
-        """Save generated quiz questions to the database"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        for q in questions:
-            c.execute('''INSERT INTO quiz_questions 
-                         (question_text, option_a, option_b, option_c, correct_answer, 
-                          explanation, grammar_category, based_on_user_mistake)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                      (q.get('question', ''),
-                       q.get('option_a', ''),
-                       q.get('option_b', ''),
-                       q.get('option_c', ''),
-                       q.get('correct_answer', 'a'),
-                       q.get('explanation', ''),
-                       q.get('category', 'general'),
-                       True))
-        
-        conn.commit()
-        conn.close()
+    def save_quiz_questions(self, questions, category=None, served=True, deadline=None):
+        """Save generated quiz questions to the database
+        
+        Questions saved with served=False go into the question bank; `category`
+        files them under the bank category they were generated for.
+        """
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            for q in questions:
+                c.execute('''INSERT INTO quiz_questions 
+                             (question_text, option_a, option_b, option_c, correct_answer, 
+                              explanation, grammar_category, based_on_user_mistake, served_at)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)''',
+                          (q.get('question', ''),
+                           q.get('option_a', ''),
+                           q.get('option_b', ''),
+                           q.get('option_c', ''),
+                           q.get('correct_answer', 'a'),
+                           q.get('explanation', ''),
+                           category or q.get('category', 'general'),
+                           True,
+                           served))
+            
+            conn.commit()
     
     # NEW: Stories database methods
     def save_story(self, title, description, content, story_type='generated', scenario='general', 
                    difficulty_level='intermediate', topic='software_development', estimated_time=10,
-                   learning_objectives=None):
-        """Save a new story to the database"""
-        conn = self.get_connection()
-        c = conn.cursor()
+                   learning_objectives=None, story_length=None, pooled=False, deadline=None):
+        """Save a new story to the database
         
-        c.execute('''INSERT INTO stories 
-                     (title, description, content, story_type, scenario, difficulty_level, 
-                      topic, estimated_time, learning_objectives)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (title, description, content, story_type, scenario, difficulty_level,
-                   topic, estimated_time, json.dumps(learning_objectives) if learning_objectives else None))
-        
-        story_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        Pooled stories stay hidden until claim_pooled_story hands them to a user.
+        """
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            c.execute('''INSERT INTO stories 
+                         (title, description, content, story_type, scenario, difficulty_level, 
+                          topic, estimated_time, learning_objectives, story_length, is_pooled)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (title, description, content, story_type, scenario, difficulty_level,
+                       topic, estimated_time, json.dumps(learning_objectives) if learning_objectives else None,
+                       story_length, pooled))
+            
+            story_id = c.lastrowid
+            conn.commit()
         return story_id
     
-    def save_story_steps(self, story_id, steps):
+    def save_story_steps(self, story_id, steps, deadline=None):
         """Save story steps for interactive stories"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        try:
-            # First, delete any existing steps for this story
-            c.execute('DELETE FROM story_steps WHERE story_id = ?', (story_id,))
-            
-            # Save new steps
-            for i, step in enumerate(steps, 1):
-                # Validate step data
-                step_number = step.get('step_number', i)
-                step_type = step.get('type', 'narrative')
-                content = step.get('content', '')
-                question = step.get('question')
-                expected_response_type = step.get('expected_response_type', 'open')
-                learning_focus = step.get('learning_focus', 'communication_skills')
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            try:
+                # First, delete any existing steps for this story
+                c.execute('DELETE FROM story_steps WHERE story_id = ?', (story_id,))
                 
-                # Ensure content is not empty
-                if not content or len(content.strip()) < 5:
-                    content = f"Continue with step {step_number}..."
+                # Save new steps
+                for i, step in enumerate(steps, 1):
+                    # Validate step data
+                    step_number = step.get('step_number', i)
+                    step_type = step.get('type', 'narrative')
+                    content = step.get('content', '')
+                    question = step.get('question')
+                    expected_response_type = step.get('expected_response_type', 'open')
+                    learning_focus = step.get('learning_focus', 'communication_skills')
+                    
+                    # Ensure content is not empty
+                    if not content or len(content.strip()) < 5:
+                        content = f"Continue with step {step_number}..."
+                    
+                    c.execute('''INSERT INTO story_steps 
+                                 (story_id, step_number, step_type, content, question, 
+                                  expected_response_type, learning_focus)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              (story_id, step_number, step_type, content, question,
+                               expected_response_type, learning_focus))
                 
-                c.execute('''INSERT INTO story_steps 
-                             (story_id, step_number, step_type, content, question, 
-                              expected_response_type, learning_focus)
-                             VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                          (story_id, step_number, step_type, content, question,
-                           expected_response_type, learning_focus))
-            
-            # Update total steps in stories table
-            total_steps = len(steps)
-            c.execute('''UPDATE stories SET total_steps = ? WHERE id = ?''', (total_steps, story_id))
-            
-            conn.commit()
-            print(f"Successfully saved {total_steps} steps for story {story_id}")
-            
-        except Exception as e:
-            conn.rollback()
-            print(f"Error saving story steps: {e}")
-            raise e
-        finally:
-            conn.close()
+                # Update total steps in stories table
+                total_steps = len(steps)
+                c.execute('''UPDATE stories SET total_steps = ? WHERE id = ?''', (total_steps, story_id))
+                
+                conn.commit()
+                print(f"Successfully saved {total_steps} steps for story {story_id}")
+                
+            except Exception as e:
+                conn.rollback()
+                print(f"Error saving story steps: {e}")
+                raise e
     
     def get_stories_list(self, limit=20):
         """Get list of available stories"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute('''SELECT id, title, description, scenario, difficulty_level, topic, 
-                            estimated_time, total_steps, created_at
-                     FROM stories 
-                     WHERE is_active = TRUE
-                     ORDER BY created_at DESC 
-                     LIMIT ?''', (limit,))
-        
-        stories = c.fetchall()
-        conn.close()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            
+            c.execute('''SELECT id, title, description, scenario, difficulty_level, topic, 
+                                estimated_time, total_steps, created_at
+                         FROM stories 
+                         WHERE is_active = TRUE AND is_pooled = FALSE
+                         ORDER BY created_at DESC 
+                         LIMIT ?''', (limit,))
+            
+            stories = c.fetchall()
         return stories
     
-    def get_story_by_id(self, story_id):
+    def get_story_by_id(self, story_id, deadline=None):
         """Get a specific story by ID"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        try:
-            c.execute('''SELECT * FROM stories WHERE id = ? AND is_active = TRUE''', (story_id,))
-            story_row = c.fetchone()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
             
-            if not story_row:
-                return None
-            
-            # Convert to dictionary
-            story = dict(zip([col[0] for col in c.description], story_row))
-            
-            # Parse learning_objectives JSON if it exists
-            if story.get('learning_objectives'):
-                try:
-                    story['learning_objectives'] = json.loads(story['learning_objectives'])
-                except (json.JSONDecodeError, TypeError):
+            try:
+                c.execute('''SELECT * FROM stories WHERE id = ? AND is_active = TRUE AND is_pooled = FALSE''', (story_id,))
+                story_row = c.fetchone()
+                
+                if not story_row:
+                    return None
+                
+                # Convert to dictionary
+                story = dict(zip([col[0] for col in c.description], story_row))
+                
+                # Parse learning_objectives JSON if it exists
+                if story.get('learning_objectives'):
+                    try:
+                        story['learning_objectives'] = json.loads(story['learning_objectives'])
+                    except (json.JSONDecodeError, TypeError):
+                        story['learning_objectives'] = []
+                else:
                     story['learning_objectives'] = []
-            else:
-                story['learning_objectives'] = []
-            
-            # Get story steps
-            c.execute('''SELECT * FROM story_steps WHERE story_id = ? ORDER BY step_number''', (story_id,))
-            steps_rows = c.fetchall()
-            
-            story['steps'] = []
-            for step_row in steps_rows:
-                step = dict(zip([col[0] for col in c.description], step_row))
-                story['steps'].append(step)
-            
-            # Ensure total_steps matches actual steps
-            if story['steps']:
-                actual_steps = len(story['steps'])
-                if story.get('total_steps') != actual_steps:
-                    story['total_steps'] = actual_steps
-                    # Update database
-                    c.execute('''UPDATE stories SET total_steps = ? WHERE id = ?''', (actual_steps, story_id))
-                    conn.commit()
-            
-            # Debug log
-            print(f"Retrieved story {story_id} with {len(story['steps'])} steps")
-            
-            return story
-            
-        except Exception as e:
-            print(f"Error retrieving story {story_id}: {e}")
-            return None
-        finally:
-            conn.close()
+                
+                # Get story steps
+                c.execute('''SELECT * FROM story_steps WHERE story_id = ? ORDER BY step_number''', (story_id,))
+                steps_rows = c.fetchall()
+                
+                story['steps'] = []
+                for step_row in steps_rows:
+                    step = dict(zip([col[0] for col in c.description], step_row))
+                    story['steps'].append(step)
+                
+                # Ensure total_steps matches actual steps
+                if story['steps']:
+                    actual_steps = len(story['steps'])
+                    if story.get('total_steps') != actual_steps:
+                        story['total_steps'] = actual_steps
+                        # Update database
+                        c.execute('''UPDATE stories SET total_steps = ? WHERE id = ?''', (actual_steps, story_id))
+                        conn.commit()
+                
+                # Debug log
+                print(f"Retrieved story {story_id} with {len(story['steps'])} steps")
+                
+                return story
+                
+            except Exception as e:
+                print(f"Error retrieving story {story_id}: {e}")
+                return None
     
     def save_story_interaction(self, story_id, step_number, user_response, ai_feedback=None, 
-                              corrections=None, new_vocabulary=None, interaction_score=0.0, response_time=0):
+                              corrections=None, new_vocabulary=None, interaction_score=0.0, response_time=0, deadline=None):
         """Save user interaction with a story step"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute('''INSERT INTO story_interactions 
-                     (story_id, step_number, user_response, ai_feedback, corrections, 
-                      new_vocabulary, interaction_score, response_time)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                  (story_id, step_number, user_response, ai_feedback,
-                   json.dumps(corrections) if corrections else None,
-                   json.dumps(new_vocabulary) if new_vocabulary else None,
-                   interaction_score, response_time))
-        
-        interaction_id = c.lastrowid
-        
-        # Update user progress
-        self._update_story_progress(c, story_id, step_number)
-        
-        conn.commit()
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            c.execute('''INSERT INTO story_interactions 
+                         (story_id, step_number, user_response, ai_feedback, corrections, 
+                          new_vocabulary, interaction_score, response_time)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (story_id, step_number, user_response, ai_feedback,
+                       json.dumps(corrections) if corrections else None,
+                       json.dumps(new_vocabulary) if new_vocabulary else None,
+                       interaction_score, response_time))
+            
+            interaction_id = c.lastrowid
+            
+            # Update user progress
+            self._update_story_progress(c, story_id, step_number)
+            
+            conn.commit()
         return interaction_id
     
     def _update_story_progress(self, cursor, story_id, current_step):
@@ -511,42 +322,53 @@ class DatabaseService:
                          SET completion_percentage = ? WHERE story_id = ?''', 
                       (completion_percentage, story_id))
     
-    def get_user_story_progress(self):
+    def get_user_story_progress(self, deadline=None):
         """Get user progress for all stories"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute('''SELECT story_id, current_step, is_completed, completion_percentage,
-                            total_interactions, last_interaction
-                     FROM user_story_progress''')
-        
-        progress_data = {}
-        for row in c.fetchall():
-            progress_data[row[0]] = {
-                'current_step': row[1],
-                'is_completed': row[2],
-                'completion_percentage': row[3],
-                'total_interactions': row[4],
-                'last_interaction': row[5]
-            }
-        
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            c.execute('''SELECT story_id, current_step, is_completed, completion_percentage,
+                                total_interactions, last_interaction
+                         FROM user_story_progress''')
+            
+            progress_data = {}
+            for row in c.fetchall():
+                progress_data[row[0]] = {
+                    'current_step': row[1],
+                    'is_completed': row[2],
+                    'completion_percentage': row[3],
+                    'total_interactions': row[4],
+                    'last_interaction': row[5]
+                }
+            
         return progress_data
     
     def get_story_progress(self, story_id):
         """Get user progress for a specific story"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        try:
-            c.execute('''SELECT * FROM user_story_progress WHERE story_id = ?''', (story_id,))
-            progress_row = c.fetchone()
-            
-            if progress_row:
-                progress = dict(zip([col[0] for col in c.description], progress_row))
-                return progress
-            else:
-                # Return default progress structure
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            
+            try:
+                c.execute('''SELECT * FROM user_story_progress WHERE story_id = ?''', (story_id,))
+                progress_row = c.fetchone()
+                
+                if progress_row:
+                    progress = dict(zip([col[0] for col in c.description], progress_row))
+                    return progress
+                else:
+                    # Return default progress structure
+                    return {
+                        'story_id': story_id,
+                        'current_step': 1,
+                        'is_completed': False,
+                        'completion_percentage': 0.0,
+                        'total_interactions': 0,
+                        'started_at': None,
+                        'completed_at': None
+                    }
+                
+            except Exception as e:
+                print(f"Error retrieving story progress: {e}")
                 return {
                     'story_id': story_id,
                     'current_step': 1,
@@ -556,188 +378,169 @@ class DatabaseService:
                     'started_at': None,
                     'completed_at': None
                 }
-            
-        except Exception as e:
-            print(f"Error retrieving story progress: {e}")
-            return {
-                'story_id': story_id,
-                'current_step': 1,
-                'is_completed': False,
-                'completion_percentage': 0.0,
-                'total_interactions': 0,
-                'started_at': None,
-                'completed_at': None
-            }
-        finally:
-            conn.close()
     
     def get_story_interactions(self, story_id, limit=50):
         """Get user interactions for a specific story"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        try:
-            c.execute('''SELECT * FROM story_interactions 
-                         WHERE story_id = ? 
-                         ORDER BY timestamp DESC 
-                         LIMIT ?''', (story_id, limit))
+        with self.get_connection() as conn:
+            c = conn.cursor()
             
-            rows = c.fetchall()
-            interactions = []
-            
-            if not rows:
-                print(f"No interactions found for story {story_id}")
-                return []  # Always return empty list, never None
-            
-            for row in rows:
-                try:
-                    interaction = dict(zip([col[0] for col in c.description], row))
-                    
-                    # Parse JSON fields safely
-                    if interaction.get('corrections'):
-                        try:
-                            interaction['corrections'] = json.loads(interaction['corrections'])
-                        except (json.JSONDecodeError, TypeError):
-                            print(f"Invalid corrections JSON for interaction {interaction.get('id')}")
+            try:
+                c.execute('''SELECT * FROM story_interactions 
+                             WHERE story_id = ? 
+                             ORDER BY timestamp DESC 
+                             LIMIT ?''', (story_id, limit))
+                
+                rows = c.fetchall()
+                interactions = []
+                
+                if not rows:
+                    print(f"No interactions found for story {story_id}")
+                    return []  # Always return empty list, never None
+                
+                for row in rows:
+                    try:
+                        interaction = dict(zip([col[0] for col in c.description], row))
+                        
+                        # Parse JSON fields safely
+                        if interaction.get('corrections'):
+                            try:
+                                interaction['corrections'] = json.loads(interaction['corrections'])
+                            except (json.JSONDecodeError, TypeError):
+                                print(f"Invalid corrections JSON for interaction {interaction.get('id')}")
+                                interaction['corrections'] = []
+                        else:
                             interaction['corrections'] = []
-                    else:
-                        interaction['corrections'] = []
-                    
-                    if interaction.get('new_vocabulary'):
-                        try:
-                            interaction['new_vocabulary'] = json.loads(interaction['new_vocabulary'])
-                        except (json.JSONDecodeError, TypeError):
-                            print(f"Invalid vocabulary JSON for interaction {interaction.get('id')}")
+                        
+                        if interaction.get('new_vocabulary'):
+                            try:
+                                interaction['new_vocabulary'] = json.loads(interaction['new_vocabulary'])
+                            except (json.JSONDecodeError, TypeError):
+                                print(f"Invalid vocabulary JSON for interaction {interaction.get('id')}")
+                                interaction['new_vocabulary'] = []
+                        else:
                             interaction['new_vocabulary'] = []
-                    else:
-                        interaction['new_vocabulary'] = []
-                    
-                    # Ensure interaction_score is a number
-                    if interaction.get('interaction_score') is None:
-                        interaction['interaction_score'] = 0
-                    
-                    interactions.append(interaction)
-                    
-                except Exception as e:
-                    print(f"Error processing interaction row: {e}")
-                    continue  # Skip this row and continue with others
-            
-            print(f"Retrieved {len(interactions)} interactions for story {story_id}")
-            return interactions
-            
-        except Exception as e:
-            print(f"Error retrieving story interactions: {e}")
-            return []  # Always return empty list on error
-        finally:
-            conn.close()
+                        
+                        # Ensure interaction_score is a number
+                        if interaction.get('interaction_score') is None:
+                            interaction['interaction_score'] = 0
+                        
+                        interactions.append(interaction)
+                        
+                    except Exception as e:
+                        print(f"Error processing interaction row: {e}")
+                        continue  # Skip this row and continue with others
+                
+                print(f"Retrieved {len(interactions)} interactions for story {story_id}")
+                return interactions
+                
+            except Exception as e:
+                print(f"Error retrieving story interactions: {e}")
+                return []  # Always return empty list on error
     
     def complete_story(self, story_id):
         """Mark a story as completed"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        try:
-            # Check if progress record exists
-            c.execute('''SELECT id FROM user_story_progress WHERE story_id = ?''', (story_id,))
-            progress_exists = c.fetchone()
-            
-            if progress_exists:
-                c.execute('''UPDATE user_story_progress 
-                             SET is_completed = TRUE, completion_percentage = 100.0,
-                                 completed_at = CURRENT_TIMESTAMP
-                             WHERE story_id = ?''', (story_id,))
-            else:
-                # Create progress record if it doesn't exist
-                c.execute('''INSERT INTO user_story_progress 
-                             (story_id, is_completed, completion_percentage, completed_at, started_at)
-                             VALUES (?, TRUE, 100.0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)''', 
-                          (story_id,))
+        with self.get_connection() as conn:
+            c = conn.cursor()
             
-            conn.commit()
-            print(f"✅ Story {story_id} marked as completed")
-            
-        except Exception as e:
-            conn.rollback()
-            print(f"❌ Error completing story {story_id}: {e}")
-            raise e
-        finally:
-            conn.close()
+            try:
+                # Check if progress record exists
+                c.execute('''SELECT id FROM user_story_progress WHERE story_id = ?''', (story_id,))
+                progress_exists = c.fetchone()
+                
+                if progress_exists:
+                    c.execute('''UPDATE user_story_progress 
+                                 SET is_completed = TRUE, completion_percentage = 100.0,
+                                     completed_at = CURRENT_TIMESTAMP
+                                 WHERE story_id = ?''', (story_id,))
+                else:
+                    # Create progress record if it doesn't exist
+                    c.execute('''INSERT INTO user_story_progress 
+                                 (story_id, is_completed, completion_percentage, completed_at, started_at)
+                                 VALUES (?, TRUE, 100.0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)''', 
+                              (story_id,))
+                
+                conn.commit()
+                print(f"✅ Story {story_id} marked as completed")
+                
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error completing story {story_id}: {e}")
+                raise e
     
     def get_story_templates(self, scenario=None, difficulty_level=None):
         """Get story templates for AI generation"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        query = '''SELECT * FROM story_templates WHERE is_active = TRUE'''
-        params = []
-        
-        if scenario:
-            query += ' AND scenario = ?'
-            params.append(scenario)
-        
-        if difficulty_level:
-            query += ' AND difficulty_level = ?'
-            params.append(difficulty_level)
-        
-        query += ' ORDER BY created_at DESC'
-        
-        c.execute(query, params)
-        templates = []
-        for row in c.fetchall():
-            template = dict(zip([col[0] for col in c.description], row))
-            # Parse JSON fields
-            template['template_structure'] = json.loads(template['template_structure'])
-            template['variables'] = json.loads(template['variables']) if template['variables'] else []
-            template['learning_objectives'] = json.loads(template['learning_objectives']) if template['learning_objectives'] else []
-            templates.append(template)
-        
-        conn.close()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            
+            query = '''SELECT * FROM story_templates WHERE is_active = TRUE'''
+            params = []
+            
+            if scenario:
+                query += ' AND scenario = ?'
+                params.append(scenario)
+            
+            if difficulty_level:
+                query += ' AND difficulty_level = ?'
+                params.append(difficulty_level)
+            
+            query += ' ORDER BY created_at DESC'
+            
+            c.execute(query, params)
+            templates = []
+            for row in c.fetchall():
+                template = dict(zip([col[0] for col in c.description], row))
+                # Parse JSON fields
+                template['template_structure'] = json.loads(template['template_structure'])
+                template['variables'] = json.loads(template['variables']) if template['variables'] else []
+                template['learning_objectives'] = json.loads(template['learning_objectives']) if template['learning_objectives'] else []
+                templates.append(template)
+            
         return templates
     
-    def get_user_analytics(self):
+    def get_user_analytics(self, deadline=None):
         """Get comprehensive user analytics"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        # Get mistake patterns
-        c.execute('''SELECT mistake_type, COUNT(*) as count 
-                     FROM grammar_mistakes 
-                     GROUP BY mistake_type 
-                     ORDER BY count DESC''')
-        mistake_patterns = c.fetchall()
-        
-        # Get recent conversations count
-        c.execute('''SELECT COUNT(*) FROM conversations 
-                     WHERE date(timestamp) = date('now')''')
-        today_conversations = c.fetchone()[0]
-        
-        # Get vocabulary progress
-        c.execute('''SELECT COUNT(*) FROM vocabulary''')
-        vocabulary_count = c.fetchone()[0]
-        
-        # Most problematic areas
-        c.execute('''SELECT scenario, COUNT(*) as count
-                     FROM conversations c
-                     JOIN grammar_mistakes g ON c.id = g.conversation_id
-                     GROUP BY scenario
-                     ORDER BY count DESC
-                     LIMIT 3''')
-        problem_areas = c.fetchall()
-        
-        # Quiz statistics
-        c.execute('''SELECT AVG(score_percentage), COUNT(*) 
-                     FROM quiz_results 
-                     WHERE date(timestamp) >= date('now', '-7 days')''')
-        quiz_stats = c.fetchone()
-        
-        # NEW: Story statistics
-        c.execute('''SELECT COUNT(*) FROM user_story_progress WHERE is_completed = TRUE''')
-        completed_stories = c.fetchone()[0]
-        
-        c.execute('''SELECT AVG(completion_percentage) FROM user_story_progress''')
-        avg_story_completion = c.fetchone()[0] or 0
-        
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            # Get mistake patterns
+            c.execute('''SELECT mistake_type, COUNT(*) as count 
+                         FROM grammar_mistakes 
+                         GROUP BY mistake_type 
+                         ORDER BY count DESC''')
+            mistake_patterns = c.fetchall()
+            
+            # Get recent conversations count
+            # Compare the stored 'YYYY-MM-DD HH:MM:SS' text directly so the timestamp index is used
+            c.execute('''SELECT COUNT(*) FROM conversations 
+                         WHERE timestamp >= date('now') AND timestamp < date('now', '+1 day')''')
+            today_conversations = c.fetchone()[0]
+            
+            # Get vocabulary progress
+            c.execute('''SELECT COUNT(*) FROM vocabulary''')
+            vocabulary_count = c.fetchone()[0]
+            
+            # Most problematic areas
+            c.execute('''SELECT scenario, COUNT(*) as count
+                         FROM conversations c
+                         JOIN grammar_mistakes g ON c.id = g.conversation_id
+                         GROUP BY scenario
+                         ORDER BY count DESC
+                         LIMIT 3''')
+            problem_areas = c.fetchall()
+            
+            # Quiz statistics
+            c.execute('''SELECT AVG(score_percentage), COUNT(*) 
+                         FROM quiz_results 
+                         WHERE timestamp >= date('now', '-7 days')''')
+            quiz_stats = c.fetchone()
+            
+            # NEW: Story statistics
+            # One pass over the progress rows for both numbers
+            c.execute('''SELECT COALESCE(SUM(is_completed), 0), AVG(completion_percentage) 
+                         FROM user_story_progress''')
+            completed_stories, avg_story_completion = c.fetchone()
+            avg_story_completion = avg_story_completion or 0
+            
         
         return {
             'mistake_patterns': mistake_patterns,
@@ -754,90 +557,323 @@ class DatabaseService:
             }
         }
     
-    def get_user_mistakes(self, limit=5):
+    def get_user_mistakes(self, limit=5, deadline=None):
         """Get user's most common mistake patterns"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT mistake_type, COUNT(*) as count 
-                     FROM grammar_mistakes 
-                     GROUP BY mistake_type 
-                     ORDER BY count DESC
-                     LIMIT ?''', (limit,))
-        user_mistakes = c.fetchall()
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT mistake_type, COUNT(*) as count 
+                         FROM grammar_mistakes 
+                         GROUP BY mistake_type 
+                         ORDER BY count DESC
+                         LIMIT ?''', (limit,))
+            user_mistakes = c.fetchall()
         return user_mistakes
     
-    def get_detailed_mistakes_for_report(self, limit=20):
+    def get_detailed_mistakes_for_report(self, limit=20, deadline=None):
         """Get detailed mistake patterns for AI report generation"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        
-        c.execute('''SELECT gm.mistake_type, gm.original_text, gm.corrected_text, 
-                            gm.explanation, c.scenario, COUNT(*) as frequency
-                     FROM grammar_mistakes gm
-                     JOIN conversations c ON gm.conversation_id = c.id
-                     GROUP BY gm.mistake_type, gm.original_text
-                     ORDER BY frequency DESC
-                     LIMIT ?''', (limit,))
-        detailed_mistakes = c.fetchall()
-        
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            
+            c.execute('''SELECT gm.mistake_type, gm.original_text, gm.corrected_text, 
+                                gm.explanation, c.scenario, COUNT(*) as frequency
+                         FROM grammar_mistakes gm
+                         JOIN conversations c ON gm.conversation_id = c.id
+                         GROUP BY gm.mistake_type, gm.original_text
+                         ORDER BY frequency DESC
+                         LIMIT ?''', (limit,))
+            detailed_mistakes = c.fetchall()
+            
         return detailed_mistakes
     
-    def get_vocabulary_for_report(self, limit=15):
+    def get_vocabulary_for_report(self, limit=15, deadline=None):
         """Get vocabulary data for AI report generation"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT word, definition, times_encountered, category
-                     FROM vocabulary 
-                     ORDER BY times_encountered DESC
-                     LIMIT ?''', (limit,))
-        vocabulary_data = c.fetchall()
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT word, definition, times_encountered, category
+                         FROM vocabulary 
+                         ORDER BY times_encountered DESC
+                         LIMIT ?''', (limit,))
+            vocabulary_data = c.fetchall()
         return vocabulary_data
     
-    def get_quiz_history_for_report(self, limit=10):
+    def get_quiz_history_for_report(self, limit=10, deadline=None):
         """Get recent quiz history for AI report generation"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT detailed_results FROM quiz_results 
-                     ORDER BY timestamp DESC LIMIT ?''', (limit,))
-        quiz_history = c.fetchall()
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT detailed_results FROM quiz_results 
+                         ORDER BY timestamp DESC LIMIT ?''', (limit,))
+            quiz_history = c.fetchall()
         return quiz_history
     
-    def get_scenario_performance_for_report(self):
+    def get_scenario_performance_for_report(self, deadline=None):
         """Get conversation scenarios performance for AI report generation"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT scenario, COUNT(*) as total, 
-                            SUM(CASE WHEN corrections = '[]' THEN 1 ELSE 0 END) as perfect
-                     FROM conversations 
-                     GROUP BY scenario
-                     ORDER BY total DESC''')
-        scenario_performance = c.fetchall()
-        conn.close()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT scenario, COUNT(*) as total, 
+                                SUM(CASE WHEN corrections = '[]' THEN 1 ELSE 0 END) as perfect
+                         FROM conversations 
+                         GROUP BY scenario
+                         ORDER BY total DESC''')
+            scenario_performance = c.fetchall()
         return scenario_performance
     
     def get_vocabulary_list(self):
         """Get complete vocabulary list"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT word, definition, example, times_encountered 
-                     FROM vocabulary 
-                     ORDER BY times_encountered DESC, timestamp DESC''')
-        vocab_list = c.fetchall()
-        conn.close()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT word, definition, example, times_encountered 
+                         FROM vocabulary 
+                         ORDER BY times_encountered DESC, timestamp DESC''')
+            vocab_list = c.fetchall()
         return vocab_list
     
     def get_conversation_history(self, limit=20):
         """Get recent conversation history"""
-        conn = self.get_connection()
-        c = conn.cursor()
-        c.execute('''SELECT user_message, ai_response, corrections, scenario, timestamp 
-                     FROM conversations 
-                     ORDER BY timestamp DESC 
-                     LIMIT ?''', (limit,))
-        conversations = c.fetchall()
-        conn.close()
-        return conversations
\ No newline at end of file
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT user_message, ai_response, corrections, scenario, timestamp 
+                         FROM conversations 
+                         ORDER BY timestamp DESC 
+                         LIMIT ?''', (limit,))
+            conversations = c.fetchall()
+        return conversations
+    
+    # Analysis cache methods
+    def get_cached_analysis(self, cache_key):
+        """Get a cached analysis and its expiry time, or None if missing or expired"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT analysis, expires_at FROM analysis_cache 
+                         WHERE cache_key = ? AND expires_at > ?''', (cache_key, time.time()))
+            row = c.fetchone()
+        
+        if not row:
+            return None
+        
+        try:
+            return json.loads(row[0]), row[1]
+        except (json.JSONDecodeError, TypeError):
+            return None
+    
+    def save_cached_analysis(self, cache_key, scenario, analysis, expires_at):
+        """Store an analysis in the shared cache and purge expired entries"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''INSERT OR REPLACE INTO analysis_cache (cache_key, scenario, analysis, expires_at)
+                         VALUES (?, ?, ?, ?)''', (cache_key, scenario, json.dumps(analysis), expires_at))
+            c.execute('''DELETE FROM analysis_cache WHERE expires_at <= ?''', (time.time(),))
+            conn.commit()
+    
+    # Quiz question bank methods
+    def count_unused_quiz_questions(self, deadline=None):
+        """Number of banked questions not yet shown, per grammar category"""
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT grammar_category, COUNT(*) FROM quiz_questions 
+                         WHERE served_at IS NULL 
+                         GROUP BY grammar_category''')
+            counts = dict(c.fetchall())
+        return counts
+    
+    def claim_quiz_questions(self, category, limit, deadline=None):
+        """Take up to `limit` unused questions of a category and mark them as shown
+        
+        The write lock is taken up front so two requests never get the same question.
+        """
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('''SELECT id, question_text, option_a, option_b, option_c, 
+                                correct_answer, explanation, grammar_category
+                         FROM quiz_questions 
+                         WHERE grammar_category = ? AND served_at IS NULL 
+                         ORDER BY id 
+                         LIMIT ?''', (category, limit))
+            rows = c.fetchall()
+            if rows:
+                c.execute(f'''UPDATE quiz_questions SET served_at = CURRENT_TIMESTAMP 
+                              WHERE id IN ({','.join('?' * len(rows))})''', [row[0] for row in rows])
+            conn.commit()
+        
+        return [
+            {
+                "question": row[1],
+                "option_a": row[2],
+                "option_b": row[3],
+                "option_c": row[4],
+                "correct_answer": row[5],
+                "explanation": row[6],
+                "category": row[7]
+            }
+            for row in rows
+        ]
+    
+    # Story pool methods
+    def count_pooled_stories(self, deadline=None):
+        """Unclaimed pre-generated stories per (scenario, difficulty, length, topic)"""
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT scenario, difficulty_level, story_length, topic, COUNT(*) 
+                         FROM stories 
+                         WHERE is_pooled = TRUE 
+                         GROUP BY scenario, difficulty_level, story_length, topic''')
+            counts = {tuple(row[:4]): row[4] for row in c.fetchall()}
+        return counts
+    
+    def claim_pooled_story(self, scenario, difficulty_level, story_length, topic, deadline=None):
+        """Atomically hand one ready pooled story to the user; returns its ID or None"""
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            # Stories whose steps are still being written are not ready yet
+            c.execute('''SELECT id FROM stories s 
+                         WHERE is_pooled = TRUE AND scenario = ? AND difficulty_level = ? 
+                               AND story_length = ? AND topic = ? 
+                               AND EXISTS (SELECT 1 FROM story_steps WHERE story_id = s.id)
+                         ORDER BY id 
+                         LIMIT 1''', (scenario, difficulty_level, story_length, topic))
+            row = c.fetchone()
+            if row:
+                c.execute('''UPDATE stories SET is_pooled = FALSE, created_at = CURRENT_TIMESTAMP 
+                             WHERE id = ?''', (row[0],))
+            conn.commit()
+        return row[0] if row else None
+    
+    # Personal report cache methods
+    def get_report_inputs(self, deadline=None):
+        """Cheap summary of everything a personal report is built from; it changes whenever the data does"""
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            # Conversations, mistakes and quiz results are only ever appended, so their newest ID will do
+            c.execute('''SELECT (SELECT COALESCE(MAX(id), 0) FROM conversations),
+                                (SELECT COALESCE(MAX(id), 0) FROM grammar_mistakes),
+                                (SELECT COALESCE(MAX(id), 0) FROM quiz_results),
+                                (SELECT COUNT(*) || ':' || COALESCE(SUM(times_encountered), 0) FROM vocabulary),
+                                (SELECT COUNT(*) || ':' || COALESCE(SUM(total_interactions), 0) || ':' || 
+                                        COALESCE(SUM(is_completed), 0) FROM user_story_progress)''')
+            inputs = c.fetchone()
+        return inputs
+    
+    def get_cached_report(self, report_key='personal', deadline=None):
+        """Get the cached report and its fingerprint, or None"""
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''SELECT fingerprint, report FROM report_cache WHERE report_key = ?''', (report_key,))
+            row = c.fetchone()
+        
+        if not row:
+            return None
+        
+        try:
+            return row[0], json.loads(row[1])
+        except (json.JSONDecodeError, TypeError):
+            return None
+    
+    def save_cached_report(self, fingerprint, report, report_key='personal'):
+        """Replace the cached report"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''INSERT OR REPLACE INTO report_cache (report_key, fingerprint, report)
+                         VALUES (?, ?, ?)''', (report_key, fingerprint, json.dumps(report)))
+            conn.commit()
+    
+    def create_story_job(self, job_id, parameters, deadline=None):
+        """Record a queued story generation job"""
+        now = time.time()
+        with self.get_connection(deadline) as conn:
+            c = conn.cursor()
+            c.execute('''INSERT INTO story_jobs (id, status, parameters, created_at, updated_at)
+                         VALUES (?, 'queued', ?, ?, ?)''', (job_id, json.dumps(parameters), now, now))
+            conn.commit()
+    
+    def update_story_job(self, job_id, status=None, partial=None, story_id=None, error=None):
+        """Update a story job; fields left as None keep their current value"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''UPDATE story_jobs
+                         SET status = COALESCE(?, status),
+                             partial = COALESCE(?, partial),
+                             story_id = COALESCE(?, story_id),
+                             error = COALESCE(?, error),
+                             updated_at = ?
+                         WHERE id = ?''', (status, json.dumps(partial) if partial is not None else None,
+                                            story_id, error, time.time(), job_id))
+            conn.commit()
+    
+    def get_story_job(self, job_id):
+        """Get a story job as a dict, or None"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT id, status, parameters, partial, story_id, error, created_at, updated_at
+                         FROM story_jobs WHERE id = ?''', (job_id,))
+            row = c.fetchone()
+        
+        if not row:
+            return None
+        
+        return {
+            'id': row[0],
+            'status': row[1],
+            'parameters': json.loads(row[2]),
+            'partial': json.loads(row[3]) if row[3] else {},
+            'story_id': row[4],
+            'error': row[5],
+            'created_at': row[6],
+            'updated_at': row[7]
+        }
+    
+    # In-flight request coalescing methods
+    def claim_inflight_request(self, request_key, owner, lease_seconds):
+        """Take the lease on an in-flight request key
+        
+        Returns (True, owner) if this caller should make the request, or
+        (False, current owner) while another caller holds an unexpired lease.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            # Waiting callers pick results up within a poll or two; older ones are dead weight
+            c.execute('''DELETE FROM inflight_requests WHERE finished_at < ?''', (now - 60,))
+            c.execute('''SELECT owner, lease_expires_at, finished_at FROM inflight_requests 
+                         WHERE request_key = ?''', (request_key,))
+            row = c.fetchone()
+            if row and row[2] is None and row[1] > now:
+                conn.commit()
+                return False, row[0]
+            c.execute('''INSERT OR REPLACE INTO inflight_requests (request_key, owner, lease_expires_at)
+                         VALUES (?, ?, ?)''', (request_key, owner, now + lease_seconds))
+            conn.commit()
+        return True, owner
+    
+    def get_inflight_request(self, request_key, owner):
+        """State of the request led by owner: ('running' | 'done' | 'expired' | 'gone', result)"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT owner, lease_expires_at, result, finished_at FROM inflight_requests 
+                         WHERE request_key = ?''', (request_key,))
+            row = c.fetchone()
+        
+        if not row or row[0] != owner:
+            return 'gone', None
+        if row[3] is not None:
+            return 'done', json.loads(row[2])
+        if row[1] <= time.time():
+            return 'expired', None
+        return 'running', None
+    
+    def finish_inflight_request(self, request_key, owner, result):
+        """Publish the result of a request to the callers waiting on it"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''UPDATE inflight_requests SET result = ?, finished_at = ? 
+                         WHERE request_key = ? AND owner = ?''', (json.dumps(result), time.time(), request_key, owner))
+            conn.commit()
+    
+    def release_inflight_request(self, request_key, owner):
+        """Give up the lease without a result, so a waiting caller makes the request itself"""
+        with self.get_connection() as conn:
+            c = conn.cursor()
+            c.execute('''DELETE FROM inflight_requests WHERE request_key = ? AND owner = ? AND finished_at IS NULL''',
+                      (request_key, owner))
+            conn.commit()
@@ -0,0 +1,255 @@
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from config import Config
+
+_BEGIN_WRITE = re.compile(r'\s*BEGIN\s+(IMMEDIATE|EXCLUSIVE)\b', re.IGNORECASE)
+
+def _is_locked(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+class RetryingCursor(sqlite3.Cursor):
+    """Cursor whose statements are retried when the database stays locked past the busy timeout"""
+
+    pooled = None
+
+    def execute(self, sql, parameters=()):
+        result = self.pooled._retry(super().execute, sql, parameters)
+        if _BEGIN_WRITE.match(sql):
+            self.pooled._holds_write_lock = True
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.pooled._retry(super().executemany, sql, seq_of_parameters)
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when every pooled connection stayed borrowed for the whole wait"""
+
+class PooledConnection:
+    """A borrowed SQLite connection; close() (or leaving a with block) hands it back to the pool
+
+    A statement or commit that fails with "database is locked" had no effect,
+    so it is tried again after a random pause. SQLite's own busy handler wakes
+    every waiter on the same schedule; the jitter spreads them out so a burst
+    of writers does not keep colliding.
+
+    Inside a deferred transaction a locked write may mean another writer
+    committed after our snapshot was taken, and retrying can never succeed,
+    so there the error is raised for the caller to roll back. Statements are
+    only retried outside a transaction or in one opened with BEGIN IMMEDIATE
+    (or EXCLUSIVE), which already holds the write lock.
+    """
+
+    def __init__(self, pool, connection, retries):
+        self._pool = pool
+        self._connection = connection
+        self._retries = retries
+        self._holds_write_lock = False
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a connection returned to the pool")
+        return getattr(self._connection, name)
+
+    def _retry(self, operation, *args):
+        if not self._connection.in_transaction:
+            self._holds_write_lock = False
+        retryable = self._holds_write_lock or not self._connection.in_transaction
+        attempt = 0
+        while True:
+            try:
+                return operation(*args)
+            except sqlite3.OperationalError as e:
+                if not retryable or attempt >= self._retries or not _is_locked(e):
+                    raise
+                if self._connection.in_transaction and not self._holds_write_lock:
+                    # Only the implicit BEGIN of this statement is open; start it over cleanly
+                    self._connection.rollback()
+                attempt += 1
+                self._pool._count('lock_retries')
+                time.sleep(random.uniform(0, Config.DB_LOCK_RETRY_JITTER * 2 ** attempt))
+
+    def cursor(self):
+        cursor = self._connection.cursor(RetryingCursor)
+        cursor.pooled = self
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        return self._retry(self._connection.commit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Unlike sqlite3.Connection this never commits; uncommitted work is rolled back
+        self.close()
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool._give_back(connection)
+
+class ConnectionPool:
+    """Long-lived SQLite connections shared by every DatabaseService call
+
+    Opening a connection re-reads the schema and starts with empty statement
+    and page caches, so connections are kept open and lent out one call at a
+    time. Requests run on short-lived threads, so idle connections go back
+    into a shared stack (most recently used first) instead of living per
+    thread. At most `size` connections are open at once; a borrower that finds
+    them all lent out waits for one to come back, up to its busy timeout, and
+    then gets PoolTimeout. A connection that sat idle longer than the health
+    check interval is tested before it is lent out, and replaced if it fails.
+
+    Every new connection gets the PRAGMAs of the tuning profile. Both profiles
+    use WAL, so readers keep reading while a write is in progress; "durable"
+    syncs every commit to disk, "fast" only syncs at checkpoints and may lose
+    the last commits (but never corrupts the database) on power loss.
+    """
+
+    TUNING_PROFILES = {
+        'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'temp_store': 'MEMORY'},
+        'fast': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'temp_store': 'MEMORY'}
+    }
+
+    def __init__(self, db_path, size=None, health_check_interval=None, profile=None):
+        self.db_path = db_path
+        self.size = size or Config.DB_POOL_SIZE
+        self.health_check_interval = (health_check_interval if health_check_interval is not None
+                                      else Config.DB_POOL_HEALTH_CHECK_INTERVAL)
+        self.profile = profile or Config.DB_TUNING_PROFILE
+        if self.profile not in self.TUNING_PROFILES:
+            raise ValueError(f"Unknown database tuning profile: {self.profile}")
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+        self._idle = []  # (connection, returned at)
+        self._borrowed = 0
+        self._closed = False
+        self._stats = Counter()
+
+    def connection(self, busy_timeout=None):
+        """Borrow a connection that waits at most busy_timeout seconds on a locked database
+
+        The same timeout bounds the wait for a free connection when all `size`
+        are lent out.
+        """
+        busy_timeout = busy_timeout or Config.DB_BUSY_TIMEOUT
+        self._reserve(busy_timeout)
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = self._open()
+            # SQLite waits on the lock in slices, with a jittered pause between them
+            retries = Config.DB_LOCK_RETRIES
+            connection.execute(f'PRAGMA busy_timeout = {int(busy_timeout * 1000 / (retries + 1))}')
+        except BaseException:
+            self._unreserve()
+            raise
+        return PooledConnection(self, connection, retries)
+
+    def _reserve(self, timeout):
+        """Count a borrower in, waiting while all `size` connections are lent out"""
+        with self._returned:
+            if self._borrowed >= self.size:
+                self._stats['waited'] += 1
+                if not self._returned.wait_for(lambda: self._borrowed < self.size, timeout):
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"All {self.size} database connections stayed in use for {timeout:.1f}s")
+            self._borrowed += 1
+
+    def _unreserve(self):
+        with self._returned:
+            self._borrowed -= 1
+            self._returned.notify()
+
+    def _open(self):
+        # Connections move between request threads, but only one borrower uses each at a time
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute(f'PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT * 1000)}')
+        for pragma, value in self.TUNING_PROFILES[self.profile].items():
+            connection.execute(f'PRAGMA {pragma} = {value}')
+        connection.execute(f'PRAGMA mmap_size = {Config.DB_MMAP_SIZE}')
+        # Negative cache_size is in KiB rather than pages
+        connection.execute(f'PRAGMA cache_size = -{Config.DB_CACHE_SIZE_KB}')
+        with self._lock:
+            self._stats['opened'] += 1
+        return connection
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, returned_at = self._idle.pop()
+                self._stats['reused'] += 1
+            if time.monotonic() - returned_at < self.health_check_interval or self._healthy(connection):
+                return connection
+
+    def _healthy(self, connection):
+        try:
+            connection.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error as e:
+            print(f"♻️ Replacing unhealthy database connection: {e}")
+            self._count('replaced')
+            self._close_quietly(connection)
+            return False
+
+    def _give_back(self, connection):
+        try:
+            # A call that failed half way must not leave its transaction (and locks) behind
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            self._close_quietly(connection)
+            self._unreserve()
+            return
+
+        with self._returned:
+            if not self._closed:
+                self._idle.append((connection, time.monotonic()))
+                self._borrowed -= 1
+                self._returned.notify()
+                return
+        self._close_quietly(connection)
+        self._unreserve()
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when they are handed back"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'profile': self.profile,
+                'idle': len(self._idle),
+                'borrowed': self._borrowed,
+                'opened': self._stats['opened'],
+                'reused': self._stats['reused'],
+                'replaced': self._stats['replaced'],
+                'waited': self._stats['waited'],
+                'timeouts': self._stats['timeouts'],
+                'lock_retries': self._stats['lock_retries']
+            }
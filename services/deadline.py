@@ -0,0 +1,41 @@
+import time
+from config import Config
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its time budget"""
+
+class Deadline:
+    """Time budget for one request, handed down from the route to every layer below"""
+
+    # Below this there is no point starting another network or database wait
+    MIN_ATTEMPT_SECONDS = 1.0
+
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def for_route(cls, route):
+        """Create a deadline with the configured budget for a route"""
+        return cls(Config.ROUTE_BUDGETS.get(route, Config.DEFAULT_ROUTE_BUDGET))
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, what="request"):
+        """Raise if the budget is already spent"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.budget}s exceeded before {what} (timed out)")
+
+    def timeout(self, cap):
+        """Timeout for the next wait: the remaining budget, capped at `cap`"""
+        remaining = self.remaining()
+        if remaining < self.MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceeded(f"Deadline of {self.budget}s exceeded (timed out)")
+        return min(cap, remaining)
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget}s, remaining={self.remaining():.2f}s)"
@@ -0,0 +1,96 @@
+import threading
+from config import Config
+
+class GenerationProfile:
+    """Output budget for one operation: token cap, response format and length limits
+
+    The token cap is sized from the requested content (items such as quiz
+    questions or story steps, plus any free-text words asked for) so the model
+    can finish the reply but cannot ramble on. The limits are rendered into the
+    prompt so the model writes to the budget instead of being cut off by it.
+    """
+
+    TOKENS_PER_WORD = 1.5
+    # DeepSeek's largest completion for deepseek-chat
+    MAX_TOKENS = 8192
+
+    def __init__(self, name, base_tokens, tokens_per_item=0, limits='', json_output=True):
+        self.name = name
+        self.base_tokens = base_tokens
+        self.tokens_per_item = tokens_per_item
+        self.limits = limits.strip()
+        self.json_output = json_output
+
+    def max_tokens(self, items=1, words=0):
+        tokens = self.base_tokens + self.tokens_per_item * items + self.TOKENS_PER_WORD * words
+        return min(self.MAX_TOKENS, int(tokens * Config.LLM_MAX_TOKENS_SCALE))
+
+    def options(self, items=1, words=0):
+        """Keyword arguments for chat_completions_create"""
+        options = {'max_tokens': self.max_tokens(items, words)}
+        if self.json_output and Config.LLM_JSON_MODE:
+            options['response_format'] = {'type': 'json_object'}
+        return options
+
+    def render_limits(self, **values):
+        """The limits line for the prompt"""
+        return self.limits.format(**values)
+
+class GenerationProfileRegistry:
+    """Generation profiles by operation name"""
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def register(self, profile):
+        with self._lock:
+            self._profiles[profile.name] = profile
+        return profile
+
+    def get(self, name):
+        return self._profiles[name]
+
+    def describe(self):
+        """Token sizing of every profile"""
+        with self._lock:
+            return {
+                name: {
+                    'base_tokens': profile.base_tokens,
+                    'tokens_per_item': profile.tokens_per_item,
+                    'json_output': profile.json_output
+                }
+                for name, profile in self._profiles.items()
+            }
+
+generation_profiles = GenerationProfileRegistry()
+
+generation_profiles.register(GenerationProfile(
+    'analysis', 600,
+    limits="Keep conversation_response under 60 words, list at most 3 corrections and 2 new_vocabulary entries, "
+           "and keep suggestions under 30 words."
+))
+
+# One analysis per message, each held to the single-message limits
+generation_profiles.register(GenerationProfile(
+    'analysis_batch', 50, tokens_per_item=550,
+    limits="For each message keep conversation_response under 60 words, list at most 3 corrections and "
+           "2 new_vocabulary entries, and keep suggestions under 30 words."
+))
+
+generation_profiles.register(GenerationProfile(
+    'quiz', 50, tokens_per_item=150,
+    limits="Return exactly {items} questions; keep each option under 15 words and each explanation under 25 words."
+))
+
+# Steps cover content and question; the introduction is sized by words
+generation_profiles.register(GenerationProfile(
+    'story', 250, tokens_per_item=150,
+    limits="Write at most {words} words of introduction and at most {items} steps; "
+           "keep each step's content and question under 40 words."
+))
+
+generation_profiles.register(GenerationProfile(
+    'report', 900,
+    limits="Give at most 5 entries per list, each under 20 words, and keep overall_assessment under 60 words."
+))
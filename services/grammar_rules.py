@@ -0,0 +1,195 @@
+import json
+import re
+
+class GrammarRuleEngine:
+    """Offline grammar checker driven by a data file of regex rules
+
+    Each rule is a case-insensitive pattern that starts at a word, with the
+    correction, mistake type and explanation to report. All rules are compiled
+    once: rules that start with a literal word are grouped by that word into one
+    combined pattern, so checking a message is a single pass over its words with
+    at most one regex attempt per word.
+
+    Word classes let one rule cover many words. In a pattern, {verb} matches
+    any word of the class and {verb.past} any of its past forms; in the
+    correction they give the matched word's entry and form, in the casing it
+    was typed with.
+    """
+
+    _WORD = re.compile(r"[a-z][a-z']*", re.IGNORECASE)
+    _LEADING_WORD = re.compile(r"(?:\\b)?([a-z][a-z']*)(?=$| |\\b|\\s)")
+    _PLACEHOLDER = re.compile(r"\{([a-z_]+)(?:\.([a-z_]+))?\}")
+    _LOOKBEHINDS = re.compile(r"(?:\(\?<[!=][^()]*\))*")
+
+    def __init__(self, rules, word_classes=None):
+        # class -> entry -> {form: word}; a plain list is a class without forms
+        self.word_classes = {
+            name: {entry: {}
+                   for entry in entries} if isinstance(entries, list) else entries
+            for name, entries in (word_classes or {}).items()
+        }
+        self.rules = []
+        self.patterns = []
+        self._slots = []  # per rule: (group name, class, form) for each placeholder
+        leading_words = []
+        for index, rule in enumerate(rules):
+            try:
+                pattern = rule['pattern']
+                if re.compile(self._PLACEHOLDER.sub('x', pattern)).groups:
+                    raise ValueError("uses a capturing group; use (?:...) instead")
+                expanded, slots = self._expand(pattern, index)
+                re.compile(expanded, re.IGNORECASE)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                raise ValueError(f"Grammar rule {index} is invalid: {e}")
+            self.rules.append((rule.get('correction', ''), rule.get('type', 'grammar'), rule.get('explanation', '')))
+            self.patterns.append(expanded)
+            self._slots.append(slots)
+            leading_words.append(self._leading_words(pattern))
+
+        # Rules without a leading literal word can match at any word, so every group includes them
+        anywhere = [index for index, words in enumerate(leading_words) if words is None]
+        groups = {}
+        for index, words in enumerate(leading_words):
+            for word in words or ():
+                groups.setdefault(word, []).append(index)
+
+        self._by_word = {
+            word: self._combine(self.patterns, sorted(set(indexes + anywhere)))
+            for word, indexes in groups.items()
+        }
+        self._anywhere = self._combine(self.patterns, anywhere) if anywhere else None
+
+        # Typed word (lowercased) -> its entry, per class and form
+        self._entries = {}
+        for name, entries in self.word_classes.items():
+            for entry, forms in entries.items():
+                self._entries.setdefault((name, None), {})[entry.lower()] = entry
+                for form, word in forms.items():
+                    self._entries.setdefault((name, form), {})[word.lower()] = entry
+
+    @classmethod
+    def from_file(cls, path):
+        """Load {word_classes, rules} (or just a list of rules) from JSON
+
+        Each rule is {pattern, correction, type, explanation}.
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return cls(data)
+        return cls(data['rules'], data.get('word_classes'))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _words(self, name, form):
+        if name not in self.word_classes:
+            raise ValueError(f"unknown word class '{name}'")
+        if form is None:
+            return list(self.word_classes[name])
+        words = [forms[form] for forms in self.word_classes[name].values() if form in forms]
+        if not words:
+            raise ValueError(f"word class '{name}' has no '{form}' forms")
+        return words
+
+    def _expand(self, pattern, index):
+        """The pattern with each placeholder turned into a named group of its words"""
+        slots = []
+
+        def group(match):
+            name = f"r{index}_{len(slots)}"
+            slots.append((name, match.group(1), match.group(2)))
+            # Longest first, so "did not" wins over "did"
+            words = sorted(self._words(match.group(1), match.group(2)), key=len, reverse=True)
+            return f"(?P<{name}>{'|'.join(re.escape(word) for word in words)})"
+        return self._PLACEHOLDER.sub(group, pattern), slots
+
+    def _leading_words(self, pattern):
+        """The words (lowercased) every match of the pattern starts with, or None"""
+        if self._has_top_level_alternation(pattern):
+            return None
+        # Lookbehinds only check the text before the match
+        pattern = pattern[self._LOOKBEHINDS.match(pattern).end():]
+        placeholder = self._PLACEHOLDER.match(pattern[2:] if pattern.startswith('\\b') else pattern)
+        if placeholder:
+            words = self._words(placeholder.group(1), placeholder.group(2))
+            return {self._WORD.match(word).group().lower() for word in words}
+        match = self._LEADING_WORD.match(pattern)
+        if not match:
+            return None
+        return {match.group(1).lower()}
+
+    def _has_top_level_alternation(self, pattern):
+        depth = 0
+        escaped = False
+        for char in pattern:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char in '([':
+                depth += 1
+            elif char in ')]':
+                depth -= 1
+            elif char == '|' and depth == 0:
+                return True
+        return False
+
+    def _combine(self, patterns, indexes):
+        # One named group per rule tells which rule matched
+        return re.compile('|'.join(f"(?P<r{index}>{patterns[index]})" for index in indexes), re.IGNORECASE)
+
+    def check(self, text):
+        """Every rule match in the text, in order and without overlaps
+
+        Each match is a dict with the original text, its start and end offsets,
+        and the rule's correction, type and explanation.
+        """
+        matches = []
+        end = 0
+        for word in self._WORD.finditer(text):
+            if word.start() < end:
+                continue
+            combined = self._by_word.get(word.group().lower(), self._anywhere)
+            if combined is None:
+                continue
+            match = combined.match(text, word.start())
+            if not match:
+                continue
+
+            index = int(match.lastgroup[1:])
+            correction, mistake_type, explanation = self.rules[index]
+            matches.append({
+                'original': match.group(),
+                'corrected': self._correct(match, index, correction),
+                'type': mistake_type,
+                'explanation': explanation,
+                'start': match.start(),
+                'end': match.end()
+            })
+            end = match.end()
+        return matches
+
+    def _correct(self, match, index, correction):
+        """Fill in the correction's placeholders from the words the rule matched"""
+        typed = {}
+        for name, word_class, form in self._slots[index]:
+            if match.group(name) is not None:
+                word = match.group(name)
+                typed[word_class] = (word, self._entries[(word_class, form)][word.lower()])
+
+        def fill(placeholder):
+            word, entry = typed[placeholder.group(1)]
+            form = placeholder.group(2)
+            return _same_case(word, self.word_classes[placeholder.group(1)][entry][form] if form else entry)
+        corrected = self._PLACEHOLDER.sub(fill, correction)
+        # Keep a capital at the start of a sentence
+        return _same_case(match.group(), corrected)
+
+def _same_case(typed, word):
+    """word with the capitalisation of typed: all caps, or a capital first letter"""
+    if len(typed) > 1 and typed.isupper():
+        return word.upper()
+    if typed[:1].isupper():
+        return word[:1].upper() + word[1:]
+    return word
@@ -0,0 +1,81 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from .latency import LatencyTracker
+
+class HedgePolicy:
+    """When to send a backup copy of a slow request, and how many backups we can afford
+
+    The delay before hedging is a percentile of the latency histogram for the
+    call's profile, so only the slowest requests get a backup. Every request earns
+    a fraction of a hedge (the budget) and every hedge spends a whole one, so
+    hedges can never exceed that fraction of requests.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key):
+        """One policy per upstream, shared by every client in the process"""
+        with cls._shared_lock:
+            policy = cls._shared.get(key)
+            if policy is None:
+                policy = cls._shared[key] = cls(LatencyTracker.shared(key))
+            return policy
+
+    def __init__(self, latency, percentile=None, budget=None, min_delay=None, max_saved=3):
+        self.latency = latency
+        self.percentile = percentile or Config.HEDGE_PERCENTILE
+        self.budget = budget if budget is not None else Config.HEDGE_BUDGET
+        self.min_delay = min_delay if min_delay is not None else Config.HEDGE_MIN_DELAY
+        self.max_saved = max_saved
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._stats = Counter()
+        self._executor = None
+
+    def delay(self, key):
+        """Seconds to wait before hedging a request, or None until there are enough samples"""
+        observed = self.latency.percentile(key, self.percentile)
+        return max(self.min_delay, observed) if observed is not None else None
+
+    def earn(self):
+        """Count a request towards the hedge budget"""
+        with self._lock:
+            self._stats['requests'] += 1
+            self._tokens = min(float(self.max_saved), self._tokens + self.budget)
+
+    def spend(self):
+        """Take one hedge from the budget; False when it is used up"""
+        with self._lock:
+            if self._tokens < 1:
+                self._stats['over_budget'] += 1
+                return False
+            self._tokens -= 1
+            self._stats['hedged'] += 1
+            return True
+
+    def count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def submit(self, fn, *args):
+        """Run a request on the policy's worker threads"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=Config.HTTP_POOL_SIZE * 2, thread_name_prefix='hedge')
+            return self._executor.submit(fn, *args)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'percentile': self.percentile,
+                'budget': self.budget,
+                'requests': self._stats['requests'],
+                'hedged': self._stats['hedged'],
+                'hedge_wins': self._stats['hedge_wins'],
+                'over_budget': self._stats['over_budget'],
+                'no_slot': self._stats['no_slot']
+            }
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+class SessionPool:
+    """Shared keep-alive HTTP session with a bounded connection pool
+
+    Requests sent through post() or warm_up() are counted per session until
+    they finish (streamed ones until their response is closed); a session is
+    only recycled for being idle when none are in flight.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, base_url, pool_size=None, idle_timeout=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else Config.HTTP_POOL_IDLE_TIMEOUT
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = 0.0
+        self._in_flight = Counter()  # session -> requests not finished yet
+
+    @classmethod
+    def shared(cls, base_url):
+        """Get the process-wide pool for a base URL"""
+        key = base_url.rstrip('/')
+        with cls._instances_lock:
+            pool = cls._instances.get(key)
+            if pool is None:
+                pool = cls(key)
+                cls._instances[key] = pool
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        """Close every shared pool (used on shutdown)"""
+        with cls._instances_lock:
+            for pool in cls._instances.values():
+                pool.close()
+            cls._instances.clear()
+
+    def _create_session(self):
+        session = requests.Session()
+        # Retries are handled by DeepSeekClient, so the adapter never retries on its own
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+            pool_block=False
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def get_session(self):
+        """Return the live session, recycling it if its connections sat idle too long"""
+        with self._lock:
+            return self._live_session()
+
+    def _live_session(self):
+        now = time.monotonic()
+        if (self._session is not None and self.idle_timeout and not self._in_flight[self._session]
+                and now - self._last_used > self.idle_timeout):
+            # The upstream has most likely dropped our idle keep-alive sockets by now
+            print(f"♻️ Recycling idle HTTP connections to {self.base_url}")
+            self._session.close()
+            self._session = None
+
+        if self._session is None:
+            self._session = self._create_session()
+
+        self._last_used = now
+        return self._session
+
+    def post(self, url, **kwargs):
+        """POST through the pooled session"""
+        return self._request('POST', url, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        with self._lock:
+            session = self._live_session()
+            self._in_flight[session] += 1
+        try:
+            response = session.request(method, url, **kwargs)
+        except BaseException:
+            self._finished(session)
+            raise
+
+        if not kwargs.get('stream'):
+            self._finished(session)
+            return response
+
+        # The body is still being read; the request is in flight until the response is closed
+        close = response.close
+        finished = []
+
+        def close_and_finish():
+            close()
+            if not finished:
+                finished.append(True)
+                self._finished(session)
+        response.close = close_and_finish
+        return response
+
+    def _finished(self, session):
+        with self._lock:
+            self._in_flight[session] -= 1
+            if not self._in_flight[session]:
+                del self._in_flight[session]
+            # The idle clock starts when the last request is done
+            self._last_used = time.monotonic()
+
+    def warm_up(self, connections=None, timeout=5):
+        """Open keep-alive connections ahead of the first real request"""
+        connections = min(connections or Config.HTTP_POOL_WARMUP_CONNECTIONS, self.pool_size)
+        opened = []
+
+        def open_connection():
+            try:
+                # Any response status is fine, we only want the TCP + TLS handshake done
+                self._request('HEAD', self.base_url, timeout=timeout)
+                opened.append(True)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ Connection warm-up to {self.base_url} failed: {e}")
+
+        threads = [threading.Thread(target=open_connection, daemon=True) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout + 1)
+
+        print(f"🔥 Warmed up {len(opened)}/{connections} connections to {self.base_url}")
+        return len(opened)
+
+    def close(self):
+        """Close all pooled connections"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+class AsyncHTTPPool:
+    """Shared keep-alive httpx client for coroutines, owned by a background event loop
+
+    Async views run each request on a new event loop, and httpx connections
+    belong to the loop that opened them. Requests are therefore sent from one
+    long-lived loop, so every request reuses the same connections; callers
+    await the response from their own loop.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, base_url, pool_size=None, idle_timeout=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else Config.HTTP_POOL_IDLE_TIMEOUT
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+
+    @classmethod
+    def shared(cls, base_url):
+        """Get the process-wide async pool for a base URL"""
+        key = base_url.rstrip('/')
+        with cls._instances_lock:
+            pool = cls._instances.get(key)
+            if pool is None:
+                pool = cls(key)
+                cls._instances[key] = pool
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        """Close every shared async pool (used on shutdown)"""
+        with cls._instances_lock:
+            for pool in cls._instances.values():
+                pool.close()
+            cls._instances.clear()
+
+    def _start(self):
+        # Caller holds the lock
+        self._loop = asyncio.new_event_loop()
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.idle_timeout
+            )
+        )
+        threading.Thread(target=self._run, args=(self._loop,), name='async-http', daemon=True).start()
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def post(self, url, **kwargs):
+        """POST from the pool's loop; cancelling the caller cancels the request"""
+        with self._lock:
+            if self._loop is None:
+                self._start()
+            loop, client = self._loop, self._client
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.post(url, **kwargs), loop))
+
+    def close(self):
+        """Close the pooled connections and stop the loop"""
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop = self._client = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"⚠️ Closing async HTTP connections to {self.base_url} failed: {e}")
+        loop.call_soon_threadsafe(loop.stop)
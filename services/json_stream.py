@@ -0,0 +1,222 @@
+import json
+import re
+
+class StringFieldStreamer:
+    """Decode one JSON string field incrementally while the model is still writing it"""
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field):
+        self.field = field
+        self._start_pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ''
+        self._pos = None  # Index of the next undecoded character inside the string value
+        self.done = False
+
+    def feed(self, chunk):
+        """Add raw model output and return any newly decoded text of the field"""
+        if self.done:
+            return ''
+        self._buffer += chunk
+
+        if self._pos is None:
+            match = self._start_pattern.search(self._buffer)
+            if not match:
+                return ''
+            self._pos = match.end()
+
+        decoded = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != '\\':
+                decoded.append(char)
+                pos += 1
+                continue
+
+            # Escape sequence: wait for more input if it is cut in half
+            if pos + 1 >= len(buffer):
+                break
+            escape = buffer[pos + 1]
+            if escape == 'u':
+                if pos + 6 > len(buffer):
+                    break
+                try:
+                    decoded.append(chr(int(buffer[pos + 2:pos + 6], 16)))
+                except ValueError:
+                    pass
+                pos += 6
+            else:
+                decoded.append(self._ESCAPES.get(escape, escape))
+                pos += 2
+
+        self._pos = pos
+        return ''.join(decoded)
+
+class IncrementalJSONParser:
+    """Find the JSON object in model output as it arrives and report top-level fields once complete
+
+    Elements of top-level arrays are collected in `items` as each one completes,
+    so long lists can be shown before the whole field is finished.
+    Prose or markdown fences around the object are ignored, and close() repairs
+    output that was cut off (unterminated strings, missing brackets, a dangling
+    key) so a truncated completion still yields the fields it did finish.
+    """
+
+    _CLOSERS = {'{': '}', '[': ']'}
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._start = None  # Index of the outermost '{'
+        self._end = None  # Index of its matching '}'
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        # Top-level field tracking
+        self._expect_key = True
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+        self._item_start = None  # Start of the current element of a top-level array
+        # (index, open brackets) where the text before index can be closed into valid JSON
+        self._safe_points = []
+        self.fields = {}
+        self.items = {}  # Top-level array field -> elements completed so far
+        self.repaired = False
+
+    @property
+    def done(self):
+        return self._end is not None
+
+    def feed(self, chunk):
+        """Add raw model output and return the (name, value) top-level fields completed by it"""
+        if self.done:
+            return []
+        self._buffer += chunk
+        completed = []
+
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and not self.done:
+            char = buffer[pos]
+
+            if self._start is None:
+                if char == '{':
+                    self._start = pos
+                    self._stack.append(char)
+                    self._safe_points.append((pos + 1, tuple(self._stack)))
+                pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._expect_key and self._key_start is not None:
+                        self._key = json.loads(buffer[self._key_start:pos + 1])
+                pos += 1
+                continue
+
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = pos
+            elif char == ':' and depth == 1:
+                self._expect_key = False
+                self._value_start = pos + 1
+            elif char == ',':
+                self._safe_points.append((pos, tuple(self._stack)))
+                if depth == 1:
+                    self._complete_field(pos, completed)
+                elif depth == 2 and self._item_start is not None:
+                    self._complete_item(pos)
+                    self._item_start = pos + 1
+            elif char in '{[':
+                self._stack.append(char)
+                self._safe_points.append((pos + 1, tuple(self._stack)))
+                if char == '[' and depth == 1 and self._key is not None:
+                    self.items[self._key] = []
+                    self._item_start = pos + 1
+            elif char in '}]':
+                if depth == 1:
+                    self._complete_field(pos, completed)
+                    self._end = pos
+                elif depth == 2 and self._item_start is not None:
+                    self._complete_item(pos)
+                    self._item_start = None
+                self._stack.pop()
+                self._safe_points.append((pos + 1, tuple(self._stack)))
+            pos += 1
+
+        self._pos = pos
+        return completed
+
+    def _complete_field(self, pos, completed):
+        if self._key is not None and self._value_start is not None:
+            try:
+                value = json.loads(self._buffer[self._value_start:pos])
+            except ValueError:
+                pass
+            else:
+                self.fields[self._key] = value
+                completed.append((self._key, value))
+        self._expect_key = True
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def _complete_item(self, pos):
+        text = self._buffer[self._item_start:pos]
+        if not text.strip():
+            return
+        try:
+            self.items[self._key].append(json.loads(text))
+        except ValueError:
+            pass
+
+    def close(self):
+        """Return the parsed object, repairing truncated output; raises ValueError if there is none"""
+        if self._start is None:
+            raise ValueError("No JSON object found in model output")
+
+        if self.done:
+            return json.loads(self._buffer[self._start:self._end + 1])
+
+        # Cut off mid-way: first try closing everything that is still open
+        text = self._buffer[self._start:]
+        if self._in_string:
+            if self._escape:
+                text = text[:-1]
+            text += '"'
+        candidates = [(text, tuple(self._stack))]
+        candidates.extend((self._buffer[self._start:index], stack) for index, stack in reversed(self._safe_points))
+
+        for text, stack in candidates:
+            text = text.rstrip().rstrip(',')
+            closing = ''.join(self._CLOSERS[bracket] for bracket in reversed(stack))
+            try:
+                result = json.loads(text + closing)
+            except ValueError:
+                continue
+            if isinstance(result, dict):
+                self.repaired = True
+                print(f"🩹 Repaired truncated JSON from model output ({len(self._buffer)} chars)")
+                return result
+
+        raise ValueError("Could not repair truncated JSON in model output")
+
+def parse_json_object(content):
+    """Parse the JSON object in a complete model response, tolerating fences, prose and truncation"""
+    parser = IncrementalJSONParser()
+    parser.feed(content)
+    return parser.close()
@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+from config import Config
+
+class LatencyHistogram:
+    """Rolling latency histogram with log-spaced buckets
+
+    Counts are kept for the current and the previous window, so percentiles
+    always cover between one and two windows of recent calls. Percentiles are
+    bucket upper bounds, which errs on the long side.
+    """
+
+    # 50ms to ~5 minutes, 25% apart
+    BOUNDS = tuple(round(0.05 * 1.25 ** index, 3) for index in range(40))
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self._current = [0] * (len(self.BOUNDS) + 1)
+        self._previous = [0] * (len(self.BOUNDS) + 1)
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        elapsed = now - self._rotated_at
+        if elapsed < self.window_seconds:
+            return
+        # After a long quiet spell the previous window is too old to keep
+        self._previous = self._current if elapsed < 2 * self.window_seconds else [0] * len(self._current)
+        self._current = [0] * len(self._current)
+        self._rotated_at = now
+
+    def add(self, seconds):
+        self._rotate()
+        self._current[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+    def _counts(self):
+        self._rotate()
+        return [current + previous for current, previous in zip(self._current, self._previous)]
+
+    def count(self):
+        return sum(self._counts())
+
+    def percentile(self, fraction):
+        counts = self._counts()
+        target = fraction * sum(counts)
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if count and cumulative >= target:
+                return self.BOUNDS[index] if index < len(self.BOUNDS) else self.BOUNDS[-1] * 1.25
+        return None
+
+    def to_dict(self):
+        counts = self._counts()
+        return {
+            'count': sum(counts),
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': {
+                (f"<={self.BOUNDS[index]}" if index < len(self.BOUNDS) else f">{self.BOUNDS[-1]}"): count
+                for index, count in enumerate(counts) if count
+            }
+        }
+
+class LatencyTracker:
+    """Latency histograms per call profile, and the timeouts derived from them
+
+    A profile key names an operation and its output budget (e.g. "quiz/800"),
+    since a five-question quiz and a long story take very different times.
+    Until a profile has LATENCY_MIN_SAMPLES calls its timeouts are None and
+    callers keep their fixed defaults. Only successful attempts are recorded, so
+    hung attempts do not drag the timeout up to the hang; if the upstream really
+    slows down, retries (which get longer timeouts) succeed and raise it.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key):
+        """One tracker per upstream, shared by every client in the process"""
+        with cls._shared_lock:
+            tracker = cls._shared.get(key)
+            if tracker is None:
+                tracker = cls._shared[key] = cls()
+            return tracker
+
+    def __init__(self, window_seconds=None, min_samples=None):
+        self.window_seconds = window_seconds or Config.LATENCY_WINDOW_SECONDS
+        self.min_samples = min_samples or Config.LATENCY_MIN_SAMPLES
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, key, seconds):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.window_seconds)
+            histogram.add(seconds)
+
+    def percentile(self, key, fraction):
+        """Observed latency percentile for a profile, or None without enough samples"""
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None or histogram.count() < self.min_samples:
+                return None
+            return histogram.percentile(fraction)
+
+    def timeout(self, key):
+        """First-attempt timeout: a high percentile with headroom, within the floor and ceiling"""
+        observed = self.percentile(key, Config.LLM_TIMEOUT_PERCENTILE)
+        if observed is None:
+            return None
+        return min(Config.LLM_TIMEOUT_CEILING, max(Config.LLM_TIMEOUT_FLOOR, observed * Config.LLM_TIMEOUT_MULTIPLIER))
+
+    def backoff(self, key):
+        """First retry delay: a fraction of a typical call, never more than the fixed 1s"""
+        observed = self.percentile(key, 0.5)
+        if observed is None:
+            return None
+        return min(1.0, max(Config.LLM_BACKOFF_FLOOR, observed * Config.LLM_BACKOFF_FACTOR))
+
+    def get_stats(self):
+        """Each profile's histogram with the timeout and backoff derived from it"""
+        with self._lock:
+            stats = {key: histogram.to_dict() for key, histogram in sorted(self._histograms.items())}
+        for key, entry in stats.items():
+            entry['timeout'] = self.timeout(key)
+            entry['backoff'] = self.backoff(key)
+        return stats
@@ -0,0 +1,250 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from config import Config
+from .deadline import Deadline
+
+class LoadShedError(Exception):
+    """Raised instead of queueing a call that could not start within its time budget"""
+
+class LimiterSlot:
+    """Permission to make one upstream request; release it when the request is done"""
+
+    def __init__(self, limiter, priority):
+        self._limiter = limiter
+        self._priority = priority
+        self._started_at = time.monotonic()
+        self._released = False
+        self._handed_off = False
+
+    def release(self):
+        if self._released or self._handed_off:
+            return
+        self._released = True
+        self._limiter._release(self._priority, time.monotonic() - self._started_at)
+
+    def hand_off(self):
+        """Keep the slot after the caller's scope ends (e.g. for a stream); returns the release callback"""
+        self._handed_off = True
+
+        def release():
+            self._handed_off = False
+            self.release()
+        return release
+
+class PriorityLimiter:
+    """Outbound concurrency and rate limit for AI calls, with priority classes
+
+    Calls wait in one queue ordered by class (interactive chat first, reports
+    last) and start when there is a free slot, their class is under its own
+    cap and the token bucket has a token. Background classes share what is
+    left after a reserve of slots that only interactive calls may use. A call is shed with LoadShedError
+    straight away when its class queue is full or the expected wait does not
+    fit its deadline, so callers can serve their fallback instead of waiting.
+    """
+
+    CLASSES = ('chat', 'story_interaction', 'quiz', 'story_generation', 'report')
+    INTERACTIVE = ('chat', 'story_interaction')
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key):
+        """One limiter per upstream, shared by every client in the process"""
+        with cls._shared_lock:
+            limiter = cls._shared.get(key)
+            if limiter is None:
+                limiter = cls._shared[key] = cls()
+            return limiter
+
+    def __init__(self, max_concurrency=None, rate=None, burst=None, queue_limit=None, class_limits=None,
+                 interactive_reserve=None):
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        reserve = interactive_reserve if interactive_reserve is not None else Config.LLM_INTERACTIVE_RESERVE
+        self.background_concurrency = max(1, self.max_concurrency - reserve)
+        self.rate = rate or Config.LLM_RATE_LIMIT
+        self.burst = burst or Config.LLM_RATE_BURST
+        self.queue_limit = queue_limit or Config.LLM_QUEUE_LIMIT
+        self.class_limits = class_limits if class_limits is not None else Config.LLM_CLASS_CONCURRENCY
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._waiting = []  # heap of (class rank, arrival order)
+        self._async_waiters = set()  # (event loop, asyncio.Event)
+        self._queued = Counter()
+        self._in_flight = Counter()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._average_seconds = 2.0  # Moving average of how long a slot is held
+        self._admitted = Counter()
+        self._shed = Counter()
+
+    def acquire(self, priority=None, deadline=None):
+        """Wait for a slot for this priority class; raises LoadShedError if the wait would not fit the deadline"""
+        priority = self._class_of(priority)
+        with self._cond:
+            entry = self._enqueue(priority, deadline)
+            try:
+                while True:
+                    slot, timeout = self._admit(entry, priority, deadline)
+                    if slot is not None:
+                        return slot
+                    self._cond.wait(timeout)
+            finally:
+                self._dequeue(entry, priority)
+
+    async def acquire_async(self, priority=None, deadline=None):
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread
+
+        Async waiters share the queue with threads; whenever a slot frees up or
+        the queue changes their event is set from whichever thread did it.
+        """
+        priority = self._class_of(priority)
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self._cond:
+            entry = self._enqueue(priority, deadline)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    slot, timeout = self._admit(entry, priority, deadline)
+                    if slot is not None:
+                        return slot
+                    wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._dequeue(entry, priority)
+
+    def _class_of(self, priority):
+        return priority if priority in self.CLASSES else self.CLASSES[-1]
+
+    def _enqueue(self, priority, deadline):
+        """Join the queue, or shed straight away (lock held)"""
+        entry = (self.CLASSES.index(priority), next(self._sequence))
+        if self._queued[priority] >= self.queue_limit:
+            self._reject(priority, f"{priority} queue is full")
+        if deadline is not None:
+            expected = self._expected_wait(entry[0])
+            if expected > deadline.remaining() - Deadline.MIN_ATTEMPT_SECONDS:
+                self._reject(priority, f"expected wait of {expected:.1f}s exceeds the request budget")
+
+        heapq.heappush(self._waiting, entry)
+        self._queued[priority] += 1
+        return entry
+
+    def _admit(self, entry, priority, deadline):
+        """(slot, None) when this waiter may start now, else (None, seconds to wait at most) (lock held)"""
+        token_wait = None
+        if self._next_eligible() == entry:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._in_flight[priority] += 1
+                self._admitted[priority] += 1
+                return LimiterSlot(self, priority), None
+            token_wait = (1 - self._tokens) / self.rate
+
+        timeout = token_wait
+        if deadline is not None:
+            remaining = deadline.remaining() - Deadline.MIN_ATTEMPT_SECONDS
+            if remaining <= 0:
+                self._reject(priority, "request budget ran out while queued")
+            timeout = min(timeout, remaining) if timeout is not None else remaining
+        return None, timeout
+
+    def _dequeue(self, entry, priority):
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        self._queued[priority] -= 1
+        self._notify()
+
+    def _notify(self):
+        """Wake every waiter, threads and coroutines alike (lock held)"""
+        self._cond.notify_all()
+        for loop, wakeup in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # The waiter's event loop has been closed
+
+    def try_acquire(self, priority=None):
+        """A slot only if one is free right now and no call is queued; never waits or sheds"""
+        priority = self._class_of(priority)
+        with self._cond:
+            if self._waiting or not self._can_start(priority):
+                return None
+            self._refill()
+            if self._tokens < 1:
+                return None
+            self._tokens -= 1
+            self._in_flight[priority] += 1
+            self._admitted[priority] += 1
+            return LimiterSlot(self, priority)
+
+    def _reject(self, priority, reason):
+        self._shed[priority] += 1
+        print(f"🚦 Shedding {priority} AI call: {reason}")
+        raise LoadShedError(f"AI service is busy ({reason})")
+
+    def _next_eligible(self):
+        """The highest priority waiter whose class may start another call now"""
+        for entry in sorted(self._waiting):
+            if self._can_start(self.CLASSES[entry[0]]):
+                return entry
+        return None
+
+    def _can_start(self, priority):
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return False
+        if priority not in self.INTERACTIVE:
+            background = sum(count for name, count in self._in_flight.items() if name not in self.INTERACTIVE)
+            if background >= self.background_concurrency:
+                return False
+        return self._in_flight[priority] < self.class_limits.get(priority, self.max_concurrency)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _expected_wait(self, rank):
+        """Rough queueing delay for a new call of this rank, from queue length, slots and rate"""
+        ahead = sum(1 for entry in self._waiting if entry[0] <= rank)
+        busy = sum(self._in_flight.values())
+        for_slot = max(0, ahead + busy - self.max_concurrency + 1) * self._average_seconds / self.max_concurrency
+        self._refill()
+        for_token = max(0.0, ahead + 1 - self._tokens) / self.rate
+        return max(for_slot, for_token)
+
+    def _release(self, priority, held_seconds):
+        with self._cond:
+            self._in_flight[priority] -= 1
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * held_seconds
+            self._notify()
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'background_concurrency': self.background_concurrency,
+                'rate_per_second': self.rate,
+                'average_call_seconds': round(self._average_seconds, 3),
+                'classes': {
+                    priority: {
+                        'in_flight': self._in_flight[priority],
+                        'queued': self._queued[priority],
+                        'admitted': self._admitted[priority],
+                        'shed': self._shed[priority]
+                    }
+                    for priority in self.CLASSES
+                }
+            }
@@ -0,0 +1,93 @@
+import threading
+from collections import Counter
+
+class _Aggregate:
+    """Running totals for one operation (optionally narrowed to one scenario)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.finish_reasons = Counter()
+
+    def add(self, elapsed, usage=None, finish_reason=None, failed=False):
+        self.calls += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        if failed:
+            self.errors += 1
+            return
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cached_tokens += usage.cached_tokens
+        if finish_reason:
+            self.finish_reasons[finish_reason] += 1
+
+    def to_dict(self):
+        successes = self.calls - self.errors
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cache_hit_rate': round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            'avg_completion_tokens': round(self.completion_tokens / successes, 1) if successes else 0.0,
+            'avg_seconds': round(self.total_seconds / self.calls, 3) if self.calls else 0.0,
+            'max_seconds': round(self.max_seconds, 3),
+            'finish_reasons': dict(self.finish_reasons)
+        }
+
+class MetricsRegistry:
+    """In-process token usage and latency totals for every LLM call
+
+    Calls are grouped by operation (analysis, quiz, story, report) and,
+    within each operation, by scenario.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._scenarios = {}  # (operation, scenario) -> _Aggregate
+
+    def record(self, operation, scenario=None, elapsed=0.0, usage=None, finish_reason=None, failed=False):
+        """Add one LLM call to the totals"""
+        scenario = scenario or 'general'
+        with self._lock:
+            for aggregates, key in ((self._operations, operation), (self._scenarios, (operation, scenario))):
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregate = aggregates[key] = _Aggregate()
+                aggregate.add(elapsed, usage, finish_reason, failed)
+
+    def record_completion(self, operation, scenario, completion):
+        """Add a finished completion (or completed stream) to the totals"""
+        self.record(operation, scenario, completion.elapsed, completion.usage, completion.finish_reason)
+
+    def get_stats(self, operation=None, scenario=None):
+        """Totals per operation with a per-scenario breakdown, optionally filtered"""
+        with self._lock:
+            stats = {}
+            for name, aggregate in self._operations.items():
+                if operation and name != operation:
+                    continue
+                stats[name] = aggregate.to_dict()
+                stats[name]['scenarios'] = {
+                    scenario_name: scenario_aggregate.to_dict()
+                    for (operation_name, scenario_name), scenario_aggregate in self._scenarios.items()
+                    if operation_name == name and (not scenario or scenario_name == scenario)
+                }
+            return stats
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._scenarios.clear()
+
+# Shared by every AIService in the process
+llm_metrics = MetricsRegistry()
@@ -0,0 +1,383 @@
+import json
+import sqlite3
+
+class Migration:
+    """One numbered schema change"""
+
+    def __init__(self, version, description, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a function taking a cursor as schema migration `version`
+
+    Versions start at 1 and must be consecutive; a released migration is never
+    edited, later changes get a new version.
+    """
+    def register(apply):
+        if version != len(MIGRATIONS) + 1:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+def schema_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(connection):
+    """Apply pending migrations; returns the schema version
+
+    The version lives in PRAGMA user_version, so an up-to-date database costs
+    one read. Pending migrations run in a single write transaction together
+    with the version bump, and the version is read again once the write lock is
+    held, so when several workers start at once only one of them migrates.
+    """
+    latest = len(MIGRATIONS)
+    if schema_version(connection) >= latest:
+        return latest
+
+    cursor = connection.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        current = schema_version(connection)
+        for step in MIGRATIONS[current:]:
+            step.apply(cursor)
+            print(f"🗄️ Database migration {step.version}: {step.description}")
+        # PRAGMA does not accept parameters; latest is an int we computed
+        cursor.execute(f'PRAGMA user_version = {latest}')
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    return latest
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table; returns True if it was missing"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if any(row[1] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+@migration(1, "initial schema")
+def _initial_schema(c):
+    # Databases created before migrations existed already have some of these
+    # tables and columns, so this step has to be idempotent
+
+    # Conversations table
+    c.execute('''CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_message TEXT NOT NULL,
+        ai_response TEXT NOT NULL,
+        corrections TEXT,
+        scenario TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Grammar mistakes table
+    c.execute('''CREATE TABLE IF NOT EXISTS grammar_mistakes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        original_text TEXT NOT NULL,
+        corrected_text TEXT NOT NULL,
+        mistake_type TEXT NOT NULL,
+        explanation TEXT,
+        conversation_id INTEGER,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+    )''')
+
+    # Vocabulary table
+    c.execute('''CREATE TABLE IF NOT EXISTS vocabulary (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        word TEXT NOT NULL UNIQUE,
+        definition TEXT NOT NULL,
+        example TEXT,
+        category TEXT DEFAULT 'technical',
+        difficulty_level INTEGER DEFAULT 1,
+        times_encountered INTEGER DEFAULT 1,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # User progress table
+    c.execute('''CREATE TABLE IF NOT EXISTS user_progress (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        skill_area TEXT NOT NULL,
+        current_level INTEGER DEFAULT 1,
+        mistakes_count INTEGER DEFAULT 0,
+        improvements_count INTEGER DEFAULT 0,
+        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Learning recommendations table
+    c.execute('''CREATE TABLE IF NOT EXISTS recommendations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recommendation_type TEXT NOT NULL,
+        content TEXT NOT NULL,
+        priority INTEGER DEFAULT 1,
+        is_completed BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Quiz results table
+    c.execute('''CREATE TABLE IF NOT EXISTS quiz_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quiz_type TEXT NOT NULL,
+        total_questions INTEGER NOT NULL,
+        correct_answers INTEGER NOT NULL,
+        incorrect_answers INTEGER NOT NULL,
+        score_percentage REAL NOT NULL,
+        focused_areas TEXT,
+        detailed_results TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Quiz questions table
+    c.execute('''CREATE TABLE IF NOT EXISTS quiz_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question_text TEXT NOT NULL,
+        option_a TEXT NOT NULL,
+        option_b TEXT NOT NULL,
+        option_c TEXT NOT NULL,
+        correct_answer TEXT NOT NULL,
+        explanation TEXT NOT NULL,
+        grammar_category TEXT NOT NULL,
+        difficulty_level INTEGER DEFAULT 1,
+        based_on_user_mistake BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        served_at DATETIME
+    )''')
+    # Older databases: questions saved before the bank existed were already shown
+    if _add_column_if_missing(c, 'quiz_questions', 'served_at', 'DATETIME'):
+        c.execute('''UPDATE quiz_questions SET served_at = created_at''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_questions_bank 
+                 ON quiz_questions (grammar_category, served_at)''')
+
+    # NEW: Stories table
+    c.execute('''CREATE TABLE IF NOT EXISTS stories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        content TEXT NOT NULL,
+        story_type TEXT DEFAULT 'generated',
+        scenario TEXT DEFAULT 'general',
+        difficulty_level TEXT DEFAULT 'intermediate',
+        topic TEXT DEFAULT 'software_development',
+        estimated_time INTEGER DEFAULT 10,
+        total_steps INTEGER DEFAULT 1,
+        learning_objectives TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE,
+        story_length TEXT,
+        is_pooled BOOLEAN DEFAULT FALSE
+    )''')
+    # Pre-generated stories wait unclaimed (is_pooled) until a user asks for one
+    _add_column_if_missing(c, 'stories', 'story_length', 'TEXT')
+    _add_column_if_missing(c, 'stories', 'is_pooled', 'BOOLEAN DEFAULT FALSE')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stories_pool 
+                 ON stories (is_pooled, scenario, difficulty_level, story_length, topic)''')
+
+    # NEW: Story steps table (for interactive stories)
+    c.execute('''CREATE TABLE IF NOT EXISTS story_steps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        story_id INTEGER NOT NULL,
+        step_number INTEGER NOT NULL,
+        step_type TEXT DEFAULT 'narrative',
+        content TEXT NOT NULL,
+        question TEXT,
+        expected_response_type TEXT DEFAULT 'open',
+        learning_focus TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+
+    # NEW: User story progress table
+    c.execute('''CREATE TABLE IF NOT EXISTS user_story_progress (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        story_id INTEGER NOT NULL,
+        current_step INTEGER DEFAULT 1,
+        is_completed BOOLEAN DEFAULT FALSE,
+        total_interactions INTEGER DEFAULT 0,
+        completion_percentage REAL DEFAULT 0.0,
+        time_spent INTEGER DEFAULT 0,
+        last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
+        started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        completed_at DATETIME,
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+
+    # NEW: Story interactions table
+    c.execute('''CREATE TABLE IF NOT EXISTS story_interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        story_id INTEGER NOT NULL,
+        step_number INTEGER NOT NULL,
+        user_response TEXT NOT NULL,
+        ai_feedback TEXT,
+        corrections TEXT,
+        new_vocabulary TEXT,
+        interaction_score REAL DEFAULT 0.0,
+        response_time INTEGER DEFAULT 0,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+
+    # NEW: Story templates table (for AI generation)
+    c.execute('''CREATE TABLE IF NOT EXISTS story_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        scenario TEXT NOT NULL,
+        difficulty_level TEXT NOT NULL,
+        template_structure TEXT NOT NULL,
+        variables TEXT,
+        learning_objectives TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE
+    )''')
+
+    # Shared cache of AI conversation analyses
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_cache (
+        cache_key TEXT PRIMARY KEY,
+        scenario TEXT,
+        analysis TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Latest AI personal report and the learner data it was built from
+    c.execute('''CREATE TABLE IF NOT EXISTS report_cache (
+        report_key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        report TEXT NOT NULL,
+        generated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Identical LLM calls in flight, shared between processes
+    c.execute('''CREATE TABLE IF NOT EXISTS inflight_requests (
+        request_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        lease_expires_at REAL NOT NULL,
+        result TEXT,
+        finished_at REAL
+    )''')
+
+    # Background story generation jobs and what they have produced so far
+    c.execute('''CREATE TABLE IF NOT EXISTS story_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'queued',
+        parameters TEXT NOT NULL,
+        partial TEXT,
+        story_id INTEGER,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+
+DEFAULT_STORY_TEMPLATES = [
+    {
+        'name': 'Bug Hunt Adventure',
+        'scenario': 'debugging_session',
+        'difficulty_level': 'intermediate',
+        'template_structure': json.dumps({
+            'intro': 'A critical bug has been discovered in production...',
+            'steps': [
+                {'type': 'narrative', 'content': 'Describe the bug symptoms'},
+                {'type': 'question', 'content': 'What would be your first debugging step?'},
+                {'type': 'narrative', 'content': 'Investigation process'},
+                {'type': 'question', 'content': 'How would you communicate this to stakeholders?'},
+                {'type': 'resolution', 'content': 'Bug resolution and lessons learned'}
+            ]
+        }),
+        'variables': json.dumps(['bug_type', 'system_component', 'urgency_level']),
+        'learning_objectives': json.dumps(['technical vocabulary', 'problem-solving communication', 'stakeholder updates'])
+    },
+    {
+        'name': 'Code Review Drama',
+        'scenario': 'code_review',
+        'difficulty_level': 'advanced',
+        'template_structure': json.dumps({
+            'intro': 'You need to review a complex pull request...',
+            'steps': [
+                {'type': 'narrative', 'content': 'Analyzing the code changes'},
+                {'type': 'question', 'content': 'How would you provide constructive feedback?'},
+                {'type': 'dialogue', 'content': 'Discussion with the developer'},
+                {'type': 'question', 'content': 'How do you handle disagreements?'},
+                {'type': 'conclusion', 'content': 'Reaching consensus and approval'}
+            ]
+        }),
+        'variables': json.dumps(['code_complexity', 'team_member', 'review_type']),
+        'learning_objectives': json.dumps(['diplomatic language', 'technical feedback', 'conflict resolution'])
+    },
+    {
+        'name': 'Interview Challenge',
+        'scenario': 'technical_interview',
+        'difficulty_level': 'beginner',
+        'template_structure': json.dumps({
+            'intro': 'You are interviewing for a software developer position...',
+            'steps': [
+                {'type': 'question', 'content': 'Tell me about yourself'},
+                {'type': 'technical', 'content': 'Explain a technical concept'},
+                {'type': 'behavioral', 'content': 'Describe a challenging project'},
+                {'type': 'scenario', 'content': 'How would you handle a difficult situation?'},
+                {'type': 'closing', 'content': 'Questions for the interviewer'}
+            ]
+        }),
+        'variables': json.dumps(['company_type', 'position_level', 'technology_stack']),
+        'learning_objectives': json.dumps(['self-presentation', 'technical explanations', 'question asking'])
+    }
+]
+
+@migration(2, "unique story templates")
+def _unique_story_templates(c):
+    # Startup used to insert the default templates again on every run
+    c.execute('''DELETE FROM story_templates 
+                 WHERE id NOT IN (SELECT MIN(id) FROM story_templates GROUP BY name)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_story_templates_name 
+                 ON story_templates (name)''')
+    for template in DEFAULT_STORY_TEMPLATES:
+        c.execute('''INSERT OR IGNORE INTO story_templates 
+                     (name, scenario, difficulty_level, template_structure, variables, learning_objectives)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (template['name'], template['scenario'], template['difficulty_level'],
+                   template['template_structure'], template['variables'], template['learning_objectives']))
+
+@migration(3, "indexes for hot queries")
+def _hot_query_indexes(c):
+    # Story pages: steps in order, latest interactions, progress per story
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_story_steps_story 
+                 ON story_steps (story_id, step_number)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_story_interactions_story 
+                 ON story_interactions (story_id, timestamp)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_user_story_progress_story 
+                 ON user_story_progress (story_id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stories_listing 
+                 ON stories (is_pooled, is_active, created_at)''')
+
+    # Analytics and reports: mistakes grouped by type (and text), joined to their conversation
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_grammar_mistakes_type 
+                 ON grammar_mistakes (mistake_type, original_text)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_grammar_mistakes_conversation 
+                 ON grammar_mistakes (conversation_id)''')
+
+    # History and "today"/"last 7 days" counts
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_conversations_timestamp 
+                 ON conversations (timestamp)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_conversations_scenario 
+                 ON conversations (scenario)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_results_timestamp 
+                 ON quiz_results (timestamp)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_vocabulary_frequency 
+                 ON vocabulary (times_encountered, timestamp)''')
+
+    # Expired cache entries are purged on every save
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_analysis_cache_expiry 
+                 ON analysis_cache (expires_at)''')
+
+@migration(4, "unserved quiz question index")
+def _unserved_quiz_questions_index(c):
+    # The bank only ever counts and claims unserved questions; served ones pile up forever
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_questions_unserved 
+                 ON quiz_questions (grammar_category, id) WHERE served_at IS NULL''')
+    c.execute('''DROP INDEX IF EXISTS idx_quiz_questions_bank''')
@@ -0,0 +1,304 @@
+import hashlib
+import threading
+
+class RenderedPrompt:
+    """A rendered prompt and how much of it is the shared, cacheable prefix"""
+
+    def __init__(self, template, content):
+        self.name = template.name
+        self.version = template.version
+        self.content = content
+        self.prefix_chars = len(template.static_prefix)
+
+    @property
+    def total_chars(self):
+        return len(self.content)
+
+    def messages(self, user_message=None):
+        """Chat messages with the system prompt first, so the prefix stays identical across calls"""
+        messages = [{"role": "system", "content": self.content}]
+        if user_message is not None:
+            messages.append({"role": "user", "content": user_message})
+        return messages
+
+class PromptTemplate:
+    """Versioned system prompt split into static instructions and a variable tail
+
+    DeepSeek caches prompts by prefix, so everything that changes between
+    calls lives in the tail and the instructions ahead of it stay byte-identical.
+    """
+
+    SEPARATOR = "\n\n"
+
+    def __init__(self, name, version, instructions, context):
+        self.name = name
+        self.version = version
+        self.context = context.strip()
+        # Rendered once; only the context is formatted per call
+        self.static_prefix = instructions.strip() + self.SEPARATOR
+        raw = '\x1f'.join([version, self.static_prefix, self.context])
+        self.fingerprint = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    def render(self, **values):
+        return RenderedPrompt(self, self.static_prefix + self.context.format(**values))
+
+class PromptRegistry:
+    """Named prompt templates shared by the AI service"""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def register(self, template):
+        with self._lock:
+            self._templates[template.name] = template
+        return template
+
+    def get(self, name):
+        return self._templates[name]
+
+    def render(self, name, **values):
+        """Render a template and log how much of it the upstream can serve from cache"""
+        prompt = self.get(name).render(**values)
+        print(f"🧩 Prompt {prompt.name}@{prompt.version}: {prompt.prefix_chars}/{prompt.total_chars} chars in cacheable prefix")
+        return prompt
+
+    def describe(self):
+        """Version, fingerprint and static prefix size of every template"""
+        with self._lock:
+            return {
+                name: {
+                    'version': template.version,
+                    'fingerprint': template.fingerprint,
+                    'prefix_chars': len(template.static_prefix)
+                }
+                for name, template in self._templates.items()
+            }
+
+prompts = PromptRegistry()
+
+prompts.register(PromptTemplate('analysis', 'v3', """
+You are an English tutor specialized in helping software developers improve their technical English communication.
+
+Your role:
+1. Respond naturally to continue the work conversation in the scenario given at the end of these instructions
+2. Identify and correct any grammar, vocabulary, or communication errors
+3. Suggest better ways to express technical concepts
+4. Introduce new technical vocabulary when appropriate
+5. Ask follow-up questions to keep the conversation engaging
+
+IMPORTANT: You MUST respond with valid JSON in exactly this format:
+{
+    "conversation_response": "Your natural response to continue the work scenario",
+    "corrections": [
+        {
+            "original": "incorrect text",
+            "corrected": "corrected text",
+            "type": "grammar/vocabulary/style",
+            "explanation": "why this is better"
+        }
+    ],
+    "new_vocabulary": [
+        {
+            "word": "technical term",
+            "definition": "definition",
+            "example": "usage example"
+        }
+    ],
+    "suggestions": "Additional tips for improvement"
+}
+
+Do NOT include any other text before or after the JSON. Only return the JSON object.
+""", """
+Output limits: {output_limits}
+Current scenario: {scenario_prompt}
+"""))
+
+prompts.register(PromptTemplate('analysis_batch', 'v2', """
+You are an English tutor specialized in helping software developers improve their technical English communication.
+
+The user sends a JSON array of messages, each with an "id" and the "message" text. Analyze every message on its own, in the scenario given at the end of these instructions.
+
+For each message:
+1. Respond naturally to continue the work conversation
+2. Identify and correct any grammar, vocabulary, or communication errors
+3. Suggest better ways to express technical concepts
+4. Introduce new technical vocabulary when appropriate
+
+IMPORTANT: You MUST respond with valid JSON in exactly this format, with one result per message and the same ids:
+{
+    "results": [
+        {
+            "id": "1",
+            "conversation_response": "Your natural response to this message",
+            "corrections": [
+                {
+                    "original": "incorrect text",
+                    "corrected": "corrected text",
+                    "type": "grammar/vocabulary/style",
+                    "explanation": "why this is better"
+                }
+            ],
+            "new_vocabulary": [
+                {
+                    "word": "technical term",
+                    "definition": "definition",
+                    "example": "usage example"
+                }
+            ],
+            "suggestions": "Additional tips for improvement"
+        }
+    ]
+}
+
+Do NOT include any other text before or after the JSON. Only return the JSON object.
+""", """
+Output limits: {output_limits}
+Current scenario: {scenario_prompt}
+"""))
+
+prompts.register(PromptTemplate('quiz', 'v3', """
+You are an English grammar quiz generator for software developers.
+
+You generate multiple choice questions that help the user practice the areas where they make mistakes. Focus on technical English and workplace communication scenarios.
+
+IMPORTANT: You MUST respond with valid JSON in exactly this format:
+{
+    "questions": [
+        {
+            "question": "Choose the correct sentence for a daily standup:",
+            "option_a": "I worked on API integration yesterday",
+            "option_b": "I work on API integration yesterday",
+            "option_c": "I working on API integration yesterday",
+            "correct_answer": "a",
+            "explanation": "Past tense 'worked' is correct when describing completed actions",
+            "category": "verb_tense"
+        }
+    ]
+}
+
+Generate questions that are:
+1. Relevant to software development contexts
+2. Focused on the user's problem areas listed at the end of these instructions
+3. Clearly explained
+4. Set in realistic workplace scenarios
+
+Do NOT include any other text before or after the JSON.
+""", """
+User's problem areas: {mistake_types}
+Number of questions: {num_questions}
+Output limits: {output_limits}
+"""))
+
+prompts.register(PromptTemplate('story', 'v3', """
+You are an expert story creator for English language learning, specialized in software development scenarios.
+
+Create a CONCISE, engaging, interactive story using the PARAMETERS at the end of these instructions.
+
+STORY REQUIREMENTS:
+1. Create a realistic but BRIEF professional scenario
+2. Keep the introduction within the content length given in PARAMETERS
+3. Design the number of interactive steps given in PARAMETERS, each requiring a focused response
+4. Focus on practical workplace communication
+5. Make it immediately engaging and actionable
+6. Set estimated_time to the lower bound of the reading time in PARAMETERS, in minutes
+
+CRITICAL: You MUST create interactive steps. Each step should either be:
+- type: "narrative" (for story progression, no user input needed)
+- type: "question" (requires user response, must have both content AND question)
+
+RESPONSE FORMAT - Return ONLY valid JSON:
+{
+    "title": "Short, catchy title (max 8 words)",
+    "description": "1-2 sentence description of the learning experience",
+    "content": "Brief narrative introduction - set up the scenario clearly",
+    "learning_objectives": ["objective1", "objective2"],
+    "estimated_time": 5,
+    "total_steps": 2,
+    "steps": [
+        {
+            "step_number": 1,
+            "type": "question",
+            "content": "Brief situation setup (1-2 sentences describing what happens next)",
+            "question": "Specific, actionable question requiring a professional response",
+            "expected_response_type": "open",
+            "learning_focus": "professional_communication"
+        },
+        {
+            "step_number": 2,
+            "type": "question",
+            "content": "Follow-up situation (1-2 sentences about what happens after their response)",
+            "question": "Another specific question to continue the interaction",
+            "expected_response_type": "open",
+            "learning_focus": "technical_vocabulary"
+        }
+    ]
+}
+
+Do NOT include any text before or after the JSON.
+""", """
+PARAMETERS:
+- Topic: {topic}
+- Scenario: {scenario}
+- Difficulty: {difficulty}
+- Length: {length} ({time}, {focus})
+- Content length: {content_length} for the introduction
+- Interactive steps: {steps}
+- Focus Areas: {focus_areas}
+- Output limits: {output_limits}
+"""))
+
+prompts.register(PromptTemplate('report', 'v3', """
+You are an expert English language analyst for software developers.
+Analyze the learning data at the end of these instructions and provide a comprehensive personal report in JSON format:
+
+{
+    "strengths": [
+        "List 3-5 specific areas where the user excels",
+        "Include grammar topics they handle well",
+        "Mention vocabulary strengths"
+    ],
+    "weaknesses": [
+        "List 3-5 specific areas needing improvement",
+        "Focus on recurring mistake patterns",
+        "Include challenging grammar concepts"
+    ],
+    "grammar_mastered": [
+        "Grammar topics the user demonstrates proficiency in",
+        "Based on few/no mistakes in these areas"
+    ],
+    "grammar_needs_work": [
+        "Grammar topics with frequent mistakes",
+        "Areas requiring focused practice"
+    ],
+    "focus_areas": [
+        "Top 3 priority areas for improvement",
+        "Most impactful areas to work on next"
+    ],
+    "recommendations": [
+        "Specific, actionable recommendations",
+        "Include study strategies and practice methods"
+    ],
+    "overall_assessment": "2-3 sentence summary of current English level and progress",
+    "learning_path": [
+        "Step-by-step learning plan for next 2-4 weeks",
+        "Ordered by priority and logical progression"
+    ],
+    "personality_insights": [
+        "Learning style observations",
+        "Communication patterns noticed"
+    ]
+}
+
+Focus on software development communication contexts. Be specific and constructive.
+Do NOT include any text before or after the JSON object.
+""", """
+User's Learning Data:
+- Common Mistakes: {mistake_count} different error patterns
+- Vocabulary: {vocabulary_count} technical terms learned
+- Quiz History: {quiz_count} recent quizzes taken
+- Conversation Scenarios: {scenario_count} different workplace contexts
+- Story Progress: {story_count} stories engaged with
+
+Output limits: {output_limits}
+"""))
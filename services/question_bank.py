@@ -0,0 +1,96 @@
+import threading
+from config import Config
+
+class QuestionBank:
+    """Pre-generated quiz questions kept topped up per grammar category
+
+    Questions live in the quiz_questions table; served_at marks the ones a user
+    has already seen. A background thread generates more whenever a category
+    drops below its target, so quizzes are served without waiting on the API.
+    """
+
+    def __init__(self, db_service, ai_service, target_per_category=None, batch_size=None):
+        self.db_service = db_service
+        self.ai_service = ai_service
+        self.target_per_category = target_per_category or Config.QUIZ_BANK_TARGET
+        self.batch_size = batch_size or Config.QUIZ_BANK_BATCH_SIZE
+        self._wake = threading.Event()
+        self._pending = set()  # Categories asked for since the last refill pass
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def take(self, categories, count, deadline=None):
+        """Claim up to `count` unused questions, spread over the given categories in order"""
+        questions = []
+        categories = list(dict.fromkeys(categories))
+        for index, category in enumerate(categories):
+            # Split what is still missing over the categories left, favouring the first ones
+            remaining_categories = len(categories) - index
+            wanted = -(-(count - len(questions)) // remaining_categories)
+            questions.extend(self.db_service.claim_quiz_questions(category, wanted, deadline=deadline))
+
+        # Top up from any category that still has stock
+        for category in categories:
+            if len(questions) >= count:
+                break
+            questions.extend(self.db_service.claim_quiz_questions(category, count - len(questions), deadline=deadline))
+
+        return questions
+
+    def request_refill(self, categories):
+        """Ask the background thread to top up these categories soon"""
+        with self._lock:
+            self._pending.update(categories)
+        self._wake.set()
+
+    def start(self):
+        """Start the background refiller (once per process)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='quiz-bank-refill', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            try:
+                self.refill_all()
+            except Exception as e:
+                print(f"❌ Quiz bank refill failed: {e}")
+            self._wake.wait(Config.QUIZ_BANK_REFILL_INTERVAL)
+            self._wake.clear()
+
+    def tracked_categories(self):
+        """Seed categories, the user's most common mistake types and anything requested since"""
+        categories = list(Config.QUIZ_BANK_CATEGORIES)
+        categories.extend(mistake[0] for mistake in self.db_service.get_user_mistakes(5))
+        with self._lock:
+            categories.extend(self._pending)
+            self._pending.clear()
+        return list(dict.fromkeys(categories))
+
+    def refill_all(self):
+        counts = self.db_service.count_unused_quiz_questions()
+        for category in self.tracked_categories():
+            self.refill(category, counts.get(category, 0))
+
+    def refill(self, category, unused=None):
+        """Generate questions for one category until it reaches the target"""
+        if unused is None:
+            unused = self.db_service.count_unused_quiz_questions().get(category, 0)
+
+        while unused < self.target_per_category:
+            wanted = min(self.batch_size, self.target_per_category - unused)
+            questions = self.ai_service.generate_quiz_questions([(category, 0)], wanted, save=False)
+            if not questions:
+                # API unavailable or unusable output; try again on the next pass
+                return
+            questions = questions[:wanted]
+            self.db_service.save_quiz_questions(questions, category=category, served=False)
+            unused += len(questions)
+            print(f"🏦 Quiz bank: {unused}/{self.target_per_category} unused '{category}' questions")
+
+    def get_stats(self):
+        return {
+            'target_per_category': self.target_per_category,
+            'unused': self.db_service.count_unused_quiz_questions()
+        }
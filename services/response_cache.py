@@ -0,0 +1,161 @@
+import copy
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from config import Config
+
+class AnalysisCache:
+    """Two-tier cache for conversation analyses: in-process LRU in front of SQLite"""
+
+    def __init__(self, db_service, max_entries=None, ttl=None):
+        self.db_service = db_service
+        self.max_entries = max_entries or Config.ANALYSIS_CACHE_SIZE
+        self.ttl = ttl or Config.ANALYSIS_CACHE_TTL
+        self._entries = OrderedDict()  # cache_key -> (expires_at, analysis)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def normalize_message(message):
+        """Collapse whitespace so trivially different repeats share an entry
+
+        Case and punctuation are kept because corrections depend on them.
+        """
+        return ' '.join(unicodedata.normalize('NFC', message).split())
+
+    @classmethod
+    def make_key(cls, message, scenario, prompt_version):
+        raw = '\x1f'.join([cls.normalize_message(message), scenario or '', prompt_version])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        """Return a cached analysis, checking memory first and then the database"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                expires_at, analysis = entry
+                if expires_at > now:
+                    self._entries.move_to_end(cache_key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(analysis)
+                del self._entries[cache_key]
+
+        try:
+            cached = self.db_service.get_cached_analysis(cache_key)
+        except Exception as e:
+            print(f"⚠️ Analysis cache lookup failed: {e}")
+            cached = None
+
+        with self._lock:
+            if cached is None:
+                self._stats['misses'] += 1
+                return None
+
+            analysis, expires_at = cached
+            self._stats['db_hits'] += 1
+            self._remember(cache_key, analysis, expires_at)
+            return copy.deepcopy(analysis)
+
+    def put(self, cache_key, analysis, scenario=None):
+        """Store an analysis in both tiers"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(cache_key, copy.deepcopy(analysis), expires_at)
+            self._stats['stores'] += 1
+
+        try:
+            self.db_service.save_cached_analysis(cache_key, scenario, analysis, expires_at)
+        except Exception as e:
+            print(f"⚠️ Could not persist cached analysis: {e}")
+
+    def _remember(self, cache_key, analysis, expires_at):
+        # Caller holds the lock
+        self._entries[cache_key] = (expires_at, analysis)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop the in-process tier (the database tier expires on its own)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Hit/miss counters for both tiers"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+class ReportCache:
+    """Latest personal report, fresh while the learner data it was built from is unchanged
+
+    A stale report is still served (stale-while-revalidate) and regenerated in
+    a background thread, at most one refresh at a time per process.
+    """
+
+    def __init__(self, db_service, prompt_version):
+        self.db_service = db_service
+        self.prompt_version = prompt_version
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0}
+
+    def fingerprint(self, deadline=None):
+        """Hash of the report inputs; a new prompt version also invalidates old reports"""
+        inputs = self.db_service.get_report_inputs(deadline=deadline)
+        raw = '\x1f'.join([self.prompt_version] + [str(value) for value in inputs])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    def get(self, fingerprint):
+        """Return (report, fresh), or (None, False) when nothing is cached"""
+        try:
+            cached = self.db_service.get_cached_report()
+        except Exception as e:
+            print(f"⚠️ Report cache lookup failed: {e}")
+            cached = None
+
+        with self._lock:
+            if cached is None:
+                self._stats['misses'] += 1
+                return None, False
+            fresh = cached[0] == fingerprint
+            self._stats['fresh_hits' if fresh else 'stale_hits'] += 1
+            return cached[1], fresh
+
+    def put(self, fingerprint, report):
+        try:
+            self.db_service.save_cached_report(fingerprint, report)
+        except Exception as e:
+            print(f"⚠️ Could not cache personal report: {e}")
+
+    def refresh_in_background(self, regenerate):
+        """Run `regenerate` in a daemon thread unless a refresh is already running"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            self._stats['refreshes'] += 1
+
+        def run():
+            try:
+                regenerate()
+            except Exception as e:
+                print(f"❌ Background report refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='report-refresh', daemon=True).start()
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['refreshing'] = self._refreshing
+        return stats
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from config import Config
+from .deadline import DeadlineExceeded
+
+class _Flight:
+    """One in-progress call and, once done, its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class _StreamFlight:
+    """One in-progress generator and the items it has produced so far"""
+
+    def __init__(self, source):
+        self.source = source
+        self.items = []
+        self.done = False
+        self.error = None
+        self.consumers = 0
+        # Held by whichever consumer is pulling the next item from the source
+        self.pull_lock = threading.Lock()
+
+class SingleFlight:
+    """Coalesce identical calls that are in flight at the same time
+
+    The first caller for a key runs the call and every caller that arrives
+    while it is running waits for the same result (or exception) instead of
+    making its own. With a database service the flights are also shared between
+    processes: the leader holds a lease on the key in SQLite and publishes the
+    encoded result there, and other processes poll for it. Streams (see
+    stream()) are only shared within the process.
+    """
+
+    def __init__(self, db_service=None, lease_seconds=None, poll_interval=None):
+        self.db_service = db_service
+        self.lease_seconds = lease_seconds or Config.SINGLE_FLIGHT_LEASE
+        self.poll_interval = poll_interval or Config.SINGLE_FLIGHT_POLL_INTERVAL
+        self._flights = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def call(self, key, fn, deadline=None, encode=None, decode=None):
+        """Run fn() once for all concurrent callers with this key
+
+        encode/decode turn the result into JSON-compatible data and back; they
+        are needed to share it with other processes.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return self._wait(flight, deadline)
+
+        try:
+            flight.result = self._lead(key, fn, deadline, encode, decode)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+
+    async def call_async(self, key, coroutine_fn, deadline=None, encode=None, decode=None):
+        """Async variant of call; the flight is shared with sync callers too"""
+        flight, leader = self._join(key)
+        if not leader:
+            return await asyncio.to_thread(self._wait, flight, deadline)
+
+        try:
+            shared = self._shared(encode, decode)
+            owner = None
+            if shared:
+                owner, result = await asyncio.to_thread(self._claim_or_follow, key, deadline, decode)
+                if owner is None:
+                    flight.result = result
+                    return result
+
+            try:
+                flight.result = await coroutine_fn()
+            except BaseException:
+                if owner:
+                    await asyncio.to_thread(self.db_service.release_inflight_request, key, owner)
+                raise
+            if owner:
+                await asyncio.to_thread(self.db_service.finish_inflight_request, key, owner, encode(flight.result))
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+
+    def stream(self, key, generator_fn, deadline=None):
+        """Iterate generator_fn() once for all concurrent callers with this key
+
+        Every caller gets every item from the start, as soon as it is produced.
+        Whoever is waiting for the next item pulls it from the source, so
+        the flight carries on when the caller that started it disconnects; the
+        source is closed once nobody is left reading it.
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = _StreamFlight(generator_fn())
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+                print("🔗 Joined an identical streaming request in flight")
+            flight.consumers += 1
+        return self._replay(key, flight, deadline)
+
+    def _replay(self, key, flight, deadline):
+        index = 0
+        try:
+            while True:
+                if index < len(flight.items):
+                    index += 1
+                    yield flight.items[index - 1]
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                timeout = max(deadline.remaining(), 0) if deadline is not None else -1
+                if not flight.pull_lock.acquire(timeout=timeout):
+                    raise DeadlineExceeded("Timed out waiting for an identical streaming request in flight")
+                try:
+                    if index == len(flight.items) and not flight.done:
+                        self._pull(key, flight)
+                finally:
+                    flight.pull_lock.release()
+        finally:
+            self._leave(key, flight)
+
+    def _pull(self, key, flight):
+        try:
+            flight.items.append(next(flight.source))
+            return
+        except StopIteration:
+            pass
+        except BaseException as e:
+            flight.error = e
+        flight.done = True
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def _leave(self, key, flight):
+        with self._lock:
+            flight.consumers -= 1
+            abandoned = flight.consumers == 0 and not flight.done
+            if abandoned and self._streams.get(key) is flight:
+                del self._streams[key]
+        if abandoned:
+            flight.source.close()
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats['coalesced'] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._stats['leaders'] += 1
+            return flight, True
+
+    def _land(self, key, flight):
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.done.set()
+
+    def _wait(self, flight, deadline=None):
+        timeout = deadline.remaining() if deadline is not None else self.lease_seconds
+        if not flight.done.wait(timeout):
+            raise DeadlineExceeded("Timed out waiting for an identical request in flight")
+        print("🔗 Reused the result of an identical in-flight request")
+        return flight.outcome()
+
+    def _shared(self, encode, decode):
+        return self.db_service is not None and encode is not None and decode is not None
+
+    def _lead(self, key, fn, deadline, encode, decode):
+        if not self._shared(encode, decode):
+            return fn()
+
+        owner, result = self._claim_or_follow(key, deadline, decode)
+        if owner is None:
+            return result
+
+        try:
+            result = fn()
+        except BaseException:
+            # Let waiting processes run the call themselves
+            self.db_service.release_inflight_request(key, owner)
+            raise
+        self.db_service.finish_inflight_request(key, owner, encode(result))
+        return result
+
+    def _claim_or_follow(self, key, deadline, decode):
+        """Take the key's lease, or wait for another process to publish its result
+
+        Returns (owner, None) when this process must make the call, or
+        (None, result) when another process made it.
+        """
+        while True:
+            owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            leader, current_owner = self.db_service.claim_inflight_request(key, owner, self.lease_seconds)
+            if leader:
+                return owner, None
+
+            # Another process is making this call: poll for its result
+            while True:
+                if deadline is not None and deadline.remaining() <= self.poll_interval:
+                    raise DeadlineExceeded("Timed out waiting for an identical request in another process")
+                time.sleep(self.poll_interval)
+                state, payload = self.db_service.get_inflight_request(key, current_owner)
+                if state == 'done':
+                    with self._lock:
+                        self._stats['shared'] += 1
+                    print("🔗 Reused the result of an identical request from another process")
+                    return None, decode(payload)
+                if state != 'running':
+                    # Failed, expired or replaced: try to take over
+                    with self._lock:
+                        self._stats['takeovers'] += 1
+                    break
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights) + len(self._streams),
+                'shared_across_processes': self.db_service is not None,
+                'leaders': self._stats['leaders'],
+                'coalesced': self._stats['coalesced'],
+                'shared': self._stats['shared'],
+                'takeovers': self._stats['takeovers']
+            }
@@ -0,0 +1,71 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from .deadline import Deadline
+
+class StoryJobQueue:
+    """Story generation run in the background, with its progress kept in the story_jobs table
+
+    Submitting returns at once; a worker thread generates and saves the story
+    while the job row records the status and any partial results (title,
+    description, finished steps), so any process can answer a status request.
+    """
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    def __init__(self, business_service, workers=None):
+        self.business_service = business_service
+        self.db_service = business_service.db_service
+        self._executor = ThreadPoolExecutor(max_workers=workers or Config.STORY_JOB_WORKERS,
+                                            thread_name_prefix='story-job')
+
+    def submit(self, parameters, route='generate_story', finish=None):
+        """Queue a story for generation and return the job ID
+
+        `parameters` are generate_ai_story's keyword arguments; `route` picks the
+        time budget and `finish(story)` runs on the saved story before the job completes.
+        """
+        job_id = uuid.uuid4().hex
+        self.db_service.create_story_job(job_id, parameters)
+        self._executor.submit(self._run, job_id, parameters, route, finish)
+        print(f"📋 Story job {job_id} queued")
+        return job_id
+
+    def get(self, job_id):
+        """Current state of a job, or None if it does not exist"""
+        job = self.db_service.get_story_job(job_id)
+        if job and job['status'] in self.ACTIVE_STATUSES and time.time() - job['updated_at'] > Config.STORY_JOB_STALE_AFTER:
+            # The process running it went away; it will never finish
+            job['status'] = 'failed'
+            job['error'] = "Story generation was interrupted. Please try again."
+        return job
+
+    def _run(self, job_id, parameters, route, finish):
+        # The time budget starts when a worker picks the job up, not when it was queued
+        deadline = Deadline.for_route(route)
+        self.db_service.update_story_job(job_id, status='running')
+
+        def on_progress(partial):
+            self.db_service.update_story_job(job_id, partial=partial)
+
+        try:
+            story = self.business_service.generate_ai_story(**parameters, deadline=deadline, on_progress=on_progress)
+            if finish:
+                story = finish(story)
+            if not story or not story.get('id'):
+                raise Exception("Story generation failed - no ID returned")
+
+            self.db_service.update_story_job(job_id, status='completed', story_id=story['id'], partial={
+                'title': story.get('title'),
+                'description': story.get('description'),
+                'steps': story.get('steps', [])
+            })
+            print(f"✅ Story job {job_id} completed with story {story['id']}")
+
+        except Exception as e:
+            print(f"❌ Story job {job_id} failed: {e}")
+            self.db_service.update_story_job(job_id, status='failed', error=str(e))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
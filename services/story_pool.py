@@ -0,0 +1,98 @@
+import threading
+from config import Config
+
+def _topic_key(topic):
+    # "Software Development" and "software_development" ask for the same stories
+    return '_'.join((topic or '').lower().split()).replace('-', '_')
+
+class StoryPool:
+    """Ready, unclaimed AI stories per (scenario, difficulty, length)
+
+    Pooled stories are ordinary rows in stories/story_steps flagged is_pooled,
+    so claiming one is a single indexed update. A background thread generates
+    replacements whenever a combination drops below its target.
+    """
+
+    def __init__(self, business_service, stories_per_key=None):
+        self.business_service = business_service
+        self.db_service = business_service.db_service
+        self.stories_per_key = stories_per_key or Config.STORY_POOL_SIZE
+        self.topic = Config.STORY_POOL_TOPIC
+        self._wake = threading.Event()
+        self._pending = set()  # Combinations asked for since the last refill pass
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def accepts(self, topic, additional_preferences=''):
+        """Pooled stories are generic; personalised requests still go to the API"""
+        return _topic_key(topic) == _topic_key(self.topic) and not (additional_preferences or '').strip()
+
+    def claim(self, scenario, difficulty, length, deadline=None):
+        """Take a ready story for this combination, or None if the pool is empty"""
+        try:
+            story_id = self.db_service.claim_pooled_story(scenario, difficulty, length, self.topic, deadline=deadline)
+        finally:
+            self.request_refill((scenario, difficulty, length))
+
+        if story_id is None:
+            print(f"🫙 Story pool empty for {scenario}/{difficulty}/{length}")
+            return None
+
+        print(f"⚡ Story {story_id} served from the pool")
+        return self.db_service.get_story_by_id(story_id, deadline=deadline)
+
+    def request_refill(self, key):
+        with self._lock:
+            self._pending.add(key)
+        self._wake.set()
+
+    def start(self):
+        """Start the background refiller (once per process)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='story-pool-refill', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            try:
+                self.refill_all()
+            except Exception as e:
+                print(f"❌ Story pool refill failed: {e}")
+            self._wake.wait(Config.STORY_POOL_REFILL_INTERVAL)
+            self._wake.clear()
+
+    def tracked_keys(self):
+        """Configured combinations first, then any requested since the last pass"""
+        keys = [
+            (scenario, difficulty, length)
+            for scenario in Config.WORK_SCENARIOS
+            for difficulty in Config.STORY_POOL_DIFFICULTIES
+            for length in Config.STORY_POOL_LENGTHS
+        ]
+        with self._lock:
+            # Requested combinations are the ones users are waiting on
+            keys = list(self._pending) + keys
+            self._pending.clear()
+        return list(dict.fromkeys(keys))
+
+    def refill_all(self):
+        counts = self.db_service.count_pooled_stories()
+        for scenario, difficulty, length in self.tracked_keys():
+            available = counts.get((scenario, difficulty, length, self.topic), 0)
+            while available < self.stories_per_key:
+                if not self.business_service.generate_pooled_story(self.topic, difficulty, scenario, length):
+                    # API unavailable or unusable output; try again on the next pass
+                    return
+                available += 1
+                print(f"🫙 Story pool: {available}/{self.stories_per_key} ready for {scenario}/{difficulty}/{length}")
+
+    def get_stats(self):
+        return {
+            'stories_per_key': self.stories_per_key,
+            'ready': {
+                '/'.join(key[:3]): count
+                for key, count in self.db_service.count_pooled_stories().items()
+                if key[3] == self.topic
+            }
+        }
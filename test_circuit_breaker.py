@@ -0,0 +1,76 @@
+# test_circuit_breaker.py - Regression tests: a half-open trial that ends without an outcome is given back
+import asyncio
+import time
+import pytest
+from services.ai_service import AsyncDeepSeekClient, DeepSeekClient
+from services.circuit_breaker import CircuitBreaker
+from services.deadline import Deadline, DeadlineExceeded
+from services.limiter import LoadShedError
+
+class SheddingLimiter:
+    def acquire(self, priority=None, deadline=None):
+        raise LoadShedError("AI service is busy (test)")
+
+    async def acquire_async(self, priority=None, deadline=None):
+        raise LoadShedError("AI service is busy (test)")
+
+class Slot:
+    def release(self):
+        pass
+
+class FreeLimiter:
+    def acquire(self, priority=None, deadline=None):
+        return Slot()
+
+    async def acquire_async(self, priority=None, deadline=None):
+        return Slot()
+
+def half_open_breaker():
+    """A breaker whose cool-down has passed, so the next call is the half-open trial"""
+    breaker = CircuitBreaker('test', failure_rate_threshold=0.5, minimum_calls=1, cooldown_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+def client_with(client_class, limiter):
+    client = client_class(api_key='sk-test', base_url='http://127.0.0.1:9')
+    client.breaker = half_open_breaker()
+    client.limiter = limiter
+    return client
+
+def assert_trial_available(breaker):
+    assert not breaker.is_open()
+    assert breaker.allow_request()
+
+def test_shed_call_leaves_the_trial_available():
+    client = client_with(DeepSeekClient, SheddingLimiter())
+    with pytest.raises(LoadShedError):
+        client.chat_completions_create(messages=[], max_retries=1)
+    assert_trial_available(client.breaker)
+
+def test_spent_deadline_leaves_the_trial_available():
+    client = client_with(DeepSeekClient, FreeLimiter())
+    with pytest.raises(DeadlineExceeded):
+        client.chat_completions_create(messages=[], max_retries=1, deadline=Deadline(0.1))
+    assert_trial_available(client.breaker)
+
+def test_unexpected_error_leaves_the_trial_available():
+    client = client_with(DeepSeekClient, FreeLimiter())
+
+    def broken_post(*args, **kwargs):
+        raise ValueError("not an HTTP error")
+    client._post = broken_post
+    with pytest.raises(Exception):
+        client.chat_completions_create(messages=[], max_retries=1)
+    assert_trial_available(client.breaker)
+
+def test_async_shed_and_deadline_leave_the_trial_available():
+    client = client_with(AsyncDeepSeekClient, SheddingLimiter())
+    with pytest.raises(LoadShedError):
+        asyncio.run(client.chat_completions_create(messages=[], max_retries=1))
+    assert_trial_available(client.breaker)
+
+    client = client_with(AsyncDeepSeekClient, FreeLimiter())
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(client.chat_completions_create(messages=[], max_retries=1, deadline=Deadline(0.1)))
+    assert_trial_available(client.breaker)
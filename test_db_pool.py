@@ -0,0 +1,57 @@
+# test_db_pool.py - Locked statements are retried only where a retry can succeed
+import sqlite3
+import threading
+import time
+import pytest
+from services.db_pool import ConnectionPool
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=3, health_check_interval=0)
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE notes (body TEXT)')
+        conn.commit()
+    yield pool
+    pool.close()
+
+def hold_write_lock(pool, seconds):
+    """Keep the write lock on another connection for a while"""
+    ready = threading.Event()
+
+    def writer():
+        with pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            ready.set()
+            time.sleep(seconds)
+            conn.commit()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    ready.wait()
+    return thread
+
+def test_statement_outside_a_transaction_is_retried(pool):
+    writer = hold_write_lock(pool, 0.3)
+    with pool.connection(busy_timeout=0.8) as conn:
+        conn.execute('INSERT INTO notes VALUES (?)', ('first',))
+        conn.commit()
+    writer.join()
+    assert pool.get_stats()['lock_retries'] > 0
+
+def test_begin_immediate_is_retried(pool):
+    writer = hold_write_lock(pool, 0.3)
+    with pool.connection(busy_timeout=0.8) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('INSERT INTO notes VALUES (?)', ('first',))
+        conn.commit()
+    writer.join()
+    assert pool.get_stats()['lock_retries'] > 0
+
+def test_write_in_a_deferred_transaction_is_not_retried(pool):
+    with pool.connection(busy_timeout=0.3) as conn:
+        conn.execute('BEGIN')
+        conn.execute('SELECT * FROM notes').fetchall()
+        writer = hold_write_lock(pool, 0.5)
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            conn.execute('INSERT INTO notes VALUES (?)', ('stale',))
+    writer.join()
+    assert pool.get_stats()['lock_retries'] == 0